@@ -11,6 +11,25 @@ class BlockClientRequest(BaseModel):
     ip: str
 
 
+class AwgBackend(BaseModel):
+    """
+    Один AWG-бэкенд из AWG_BACKENDS: контейнер (локальный или на другом
+    docker-хосте) со своим интерфейсом, подсетью, endpoint и конфигами.
+    """
+
+    name: str
+    container: str
+    # пусто — локальный docker (DOCKER_HOST_URL / DOCKER_BIN без -H)
+    docker_host: str = ""
+    endpoint: str
+    port: str = "33042"
+    subnet: str
+    subnet_v6: str = ""
+    interface: str = "awg0"
+    wg_config_file: str = "/opt/amnezia/awg/wg0.conf"
+    clients_table_path: str = "/opt/amnezia/awg/clientsTable"
+
+
 class Settings(BaseSettings):
     # JWT
     JWT_SECRET: str
@@ -29,7 +48,47 @@ class Settings(BaseSettings):
     WG_CONFIG_FILE: str
     DOCKER_CONTAINER: str
     DOCKER_BIN: str = "/usr/bin/docker"
+    # api — Docker Engine API через сокет (с откатом на CLI), cli — docker CLI
+    DOCKER_BACKEND: str = "api"
+    DOCKER_HOST_URL: str = "unix:///var/run/docker.sock"
+    # Таймаут одной операции с контейнером, секунды
+    DOCKER_TIMEOUT: float = 30
+    # Сколько ждать поднятия интерфейса после перезапуска, секунды
+    AWG_READY_TIMEOUT: float = 30
+    WG_INTERFACE: str = "awg0"
+    WG_SUBNET: str = "10.8.1.0/24"
+    WG_SUBNET_V6: str = ""
     CLIENTS_TABLE_PATH: str = "/opt/amnezia/awg/clientsTable"
+    # Несколько бэкендов — JSON-список объектов AwgBackend. Пусто — один
+    # бэкенд из DOCKER_CONTAINER, WG_CONFIG_FILE, WG_SUBNET и ENDPOINT
+    AWG_BACKENDS: list[AwgBackend] = []
+
+    # Блокировки: ipset — один набор и одно правило на цепочку,
+    # iptables — правило на каждый IP, auto — ipset, если установлен.
+    # IPv6-адреса — в наборе FIREWALL_IPSET + "6" и правилах ip6tables
+    FIREWALL_BACKEND: str = "auto"
+    FIREWALL_IPSET: str = "awg-blocked"
+    # Окно сбора изменений в один пакет, мс, и максимум элементов в пакете
+    MUTATION_BATCH_WINDOW_MS: int = 50
+    MUTATION_BATCH_MAX: int = 1000
+
+    # Статистика: срок хранения временного ряда по разрешениям, секунды
+    # (0 — хранить всегда), и период очистки
+    STATS_RETENTION_RAW: int = 86400
+    STATS_RETENTION_1M: int = 7 * 86400
+    STATS_RETENTION_1H: int = 90 * 86400
+    STATS_RETENTION_1D: int = 730 * 86400
+    STATS_COMPACT_INTERVAL: int = 3600
+    # Интервал сбора, секунды: базовый и верхняя граница адаптивного
+    STATS_INTERVAL: float = 10
+    STATS_INTERVAL_MAX: float = 60
+    # Сбор с нескольких бэкендов: сколько дампов снимать одновременно,
+    # таймаут одного дампа и предел паузы после ошибок (backoff), секунды
+    STATS_CONCURRENCY: int = 8
+    STATS_BACKEND_TIMEOUT: float = 15
+    STATS_BACKOFF_MAX: float = 300
+    # Сколько секунд /clients отдаёт последний снятый дамп без нового wg show
+    CLIENTS_CACHE_TTL: float = 5
 
     # Test mode (отключает авторизацию)
     TEST_MODE: bool = False
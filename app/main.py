@@ -3,12 +3,17 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import asyncio
-from services.stats.collector import collect_once
+import time
+from services.stats import collector
 from services.stats.database import init_db
-from fastapi import FastAPI
+from services.stats import live
+from services.firewall_utils import reconcile_blocklist
+from services.awg_manager import seed_pool_metrics
+from fastapi import FastAPI, Request
 
 
-from routers import wg, auth
+from routers import wg, auth, metrics
+from services.metrics import HTTP_SECONDS
 
 app = FastAPI(
     title="AmneziaWG REST API",
@@ -16,18 +21,41 @@ app = FastAPI(
 )
 app.include_router(wg.router, prefix="/api/wg")
 app.include_router(auth.router, prefix="/api/auth")
+app.include_router(metrics.router)
+
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # шаблон пути, а не сам путь — чтобы ключи пиров не плодили метки
+        route = request.scope.get("route")
+        HTTP_SECONDS.labels(
+            request.method, getattr(route, "path", "unmatched"), str(status)
+        ).observe(time.perf_counter() - start)
 
 
 @app.on_event("startup")
 async def start_collector():
     init_db()
-    asyncio.create_task(collector_loop())
-
-
-async def collector_loop():
-    while True:
-        try:
-            collect_once()
-        except Exception as e:
-            print("Collector error:", e)
-        await asyncio.sleep(10)  # интервал сбора
+    live.seed_from_db()
+    try:
+        await reconcile_blocklist()
+    except Exception as e:
+        print("Blocklist reconcile error:", e)
+    app.state.collector_task = asyncio.create_task(collector.collector_loop())
+    # в фоне: старт API не ждёт контейнеров
+    app.state.pools_task = asyncio.create_task(seed_pool_metrics())
+
+
+@app.on_event("shutdown")
+async def stop_collector():
+    task = getattr(app.state, "collector_task", None)
+    if task:
+        task.cancel()
+    collector.shutdown()
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics")
+def metrics():
+    """
+    Метрики в формате Prometheus.
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
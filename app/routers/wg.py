@@ -1,20 +1,30 @@
 import os
 import subprocess
 import tempfile
-from services.awg_manager import add_client
-from services.docker_utils import (
-    docker_copy_from,
-    docker_copy_to,
-    docker_exec,
-    get_docker_base_cmd,
+from services.awg_manager import (
+    add_client,
+    add_clients,
+    block_client_ips,
+    replace_configs as replace_awg_configs,
+    replace_psks,
+    unblock_client_ips,
+)
+from services.docker_utils import docker_copy_from
+from services.awg_utils import remove_client, remove_clients
+from services import blocklist
+from services.backends import get_backend
+from services.placement import backend_loads
+from services.stats import live, snapshot, stream
+from services.stats.collector import collector_state
+from services.stats.stats import (
+    get_peer_history,
+    get_peer_stats,
 )
-from services.awg_utils import remove_client
-from services.firewall_utils import block_ip, unblock_ip
-from services.stats.stats import get_peer_stats, get_wireguard_stats
 from pydantic import BaseModel
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from deps.auth import get_current_user
-from core.config import BlockClientRequest, BlockIPRequest, settings
+from core.config import BlockClientRequest, BlockIPRequest
 
 router = APIRouter()
 
@@ -23,14 +33,26 @@ class ClientRequest(BaseModel):
     client_name: str
 
 
+class ClientsRequest(BaseModel):
+    client_names: list[str]
+    # не задан — клиенты размещаются по нагрузке бэкендов
+    backend: str | None = None
+
+
+class RemoveClientsRequest(BaseModel):
+    clients: list[str]
+
+
 class ConfigsUpdateRequest(BaseModel):
     wg_conf: str
     clients_table: str
+    backend: str | None = None
 
 
 class ReplacePsk(BaseModel):
     client_name: str
-    new_preshared_key: str
+    # не задан — ключ сгенерирует сервер
+    new_preshared_key: str | None = None
 
 
 class ReplacePskRequest(BaseModel):
@@ -38,25 +60,31 @@ class ReplacePskRequest(BaseModel):
 
 
 @router.get("/clients")
-def list_clients(user=Depends(get_current_user)):
+async def list_clients(request: Request, user=Depends(get_current_user)):
     """
-    Получить список клиентов из AmneziaWG
+    Список клиентов AmneziaWG: пиры из `wg show dump` с именами из
+    clientsTable. Отдаётся из общего с сборщиком снимка (не старше
+    CLIENTS_CACHE_TTL); поддерживает ETag / If-None-Match.
     """
     try:
-        result = subprocess.run(
-            f"{get_docker_base_cmd(settings.DOCKER_CONTAINER)} wg show",
-            shell=True,
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-        return {"status": "ok", "output": result.stdout}
+        body, etag = await snapshot.clients_response()
     except subprocess.CalledProcessError as e:
         return {"status": "error", "output": e.stderr}
+    except (subprocess.TimeoutExpired, OSError) as e:
+        # контейнер не ответил (TimeoutError — подкласс OSError) или docker
+        # недоступен, а удачного дампа бэкенда ещё не было
+        return {"status": "error", "output": str(e)}
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (t.strip().removeprefix("W/") for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @router.post("/add_client")
-def add_client_route(
+async def add_client_route(
     request: ClientRequest,
     user=Depends(get_current_user),
 ):
@@ -65,7 +93,7 @@ def add_client_route(
     """
     try:
 
-        client_conf = add_client(client_name=request.client_name)
+        client_conf = await add_client(client_name=request.client_name)
 
         return {"status": "ok", "client_conf": client_conf}
 
@@ -73,32 +101,88 @@ def add_client_route(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/add_clients")
+async def add_clients_route(
+    request: ClientsRequest,
+    user=Depends(get_current_user),
+):
+    """
+    Пакетно добавляет клиентов в AmneziaWG: одна запись server.conf и
+    clientsTable, одно применение к интерфейсу. Ошибки — по каждому клиенту.
+    """
+    try:
+
+        results = await add_clients(
+            client_names=request.client_names, container=request.backend
+        )
+
+        return {"status": "ok", "clients": results}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/replace_psk")
+async def replace_psk_route(
+    request: ReplacePskRequest,
+    user=Depends(get_current_user),
+):
+    """
+    Пакетная смена PresharedKey: одна запись server.conf и один вызов
+    wg set на все ключи. Возвращает обновлённые конфиги клиентов.
+    """
+    try:
+        results = await replace_psks(
+            [(c.client_name, c.new_preshared_key) for c in request.clients]
+        )
+        return {"status": "ok", "clients": results}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/block_ip")
-def block_ip_route(request: BlockIPRequest, user=Depends(get_current_user)):
+async def block_ip_route(request: BlockIPRequest, user=Depends(get_current_user)):
     """
     Блокирует клиента по внутреннему IP.
     """
     try:
-        block_ip(request.ip)
-        return {"status": "ok", "message": f"IP {request.ip} заблокирован"}
+        result = (await block_client_ips([request.ip]))[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    if result["status"] == "error":
+        code = 500 if result["error"].startswith("firewall") else 400
+        raise HTTPException(status_code=code, detail=result["error"])
+    return {"status": "ok", "message": f"IP {request.ip} заблокирован"}
+
 
 @router.post("/unblock_ip")
-def unblock_ip_route(request: BlockIPRequest, user=Depends(get_current_user)):
+async def unblock_ip_route(request: BlockIPRequest, user=Depends(get_current_user)):
     """
     Разблокирует клиента по внутреннему IP.
     """
     try:
-        unblock_ip(request.ip)
-        return {"status": "ok", "message": f"IP {request.ip} разблокирован"}
+        result = (await unblock_client_ips([request.ip]))[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    if result["status"] == "error":
+        code = 500 if result["error"].startswith("firewall") else 400
+        raise HTTPException(status_code=code, detail=result["error"])
+    return {"status": "ok", "message": f"IP {request.ip} разблокирован"}
+
+
+@router.get("/blocked")
+def blocked_ips(user=Depends(get_current_user)):
+    """
+    Список заблокированных IP (из памяти, без обращения к firewall).
+    """
+    return {"status": "ok", "blocked": blocklist.list_blocked()}
+
 
 @router.post("/remove_client")
-def remove_client_route(
+async def remove_client_route(
     request: BlockClientRequest,
     user=Depends(get_current_user),
 ):
@@ -109,18 +193,9 @@ def remove_client_route(
     - снимает блокировку IP (если была)
     """
     try:
-        wg_config_file = settings.WG_CONFIG_FILE
-        docker_container = settings.DOCKER_CONTAINER
-
-        if not wg_config_file or not docker_container:
-            raise HTTPException(
-                status_code=500, detail="Не заданы переменные окружения"
-            )
-
-        remove_client(
+        # бэкенд клиента находится по индексу клиент → бэкенд
+        await remove_client(
             client_name=request.ip,  # или request.client_name — зависит от твоей модели
-            wg_config_file=wg_config_file,
-            container=docker_container,
         )
 
         return {
@@ -132,12 +207,46 @@ def remove_client_route(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/remove_clients")
+async def remove_clients_route(
+    request: RemoveClientsRequest,
+    user=Depends(get_current_user),
+):
+    """
+    Пакетно удаляет клиентов (по имени или публичному ключу):
+    одна перезапись конфигов, одна разблокировка IP и одно применение
+    к интерфейсу без перезапуска.
+    """
+    try:
+        results = await remove_clients(clients=request.clients)
+
+        return {"status": "ok", "clients": results}
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/backends")
+async def list_backends(user=Depends(get_current_user)):
+    """
+    AWG-бэкенды и их нагрузка: число клиентов, ёмкость подсети, суммарная
+    скорость по живой статистике. clientsTable бэкендов читаются параллельно.
+    """
+    return {"status": "ok", "backends": await backend_loads()}
+
+
 @router.get("/configs")
-def get_configs(user=Depends(get_current_user)):
+async def get_configs(
+    backend: str | None = Query(None),
+    user=Depends(get_current_user),
+):
     """
-    Получает текущее содержимое wg0.conf и clientsTable из контейнера.
+    Получает текущее содержимое wg0.conf и clientsTable из контейнера
+    бэкенда (по умолчанию — первого).
     """
     try:
+        target = get_backend(backend)
+
         # Создаем временные файлы для копирования данных на хост
         with tempfile.NamedTemporaryFile(
             mode="w+", delete=False
@@ -146,11 +255,9 @@ def get_configs(user=Depends(get_current_user)):
         ) as tmp_clients:
 
             # Копируем из контейнера во временные файлы
-            docker_copy_from(
-                settings.DOCKER_CONTAINER, settings.WG_CONFIG_FILE, tmp_wg.name
-            )
-            docker_copy_from(
-                settings.DOCKER_CONTAINER, settings.CLIENTS_TABLE_PATH, tmp_clients.name
+            await docker_copy_from(target.name, target.wg_config_file, tmp_wg.name)
+            await docker_copy_from(
+                target.name, target.clients_table_path, tmp_clients.name
             )
 
             # Читаем содержимое
@@ -163,6 +270,8 @@ def get_configs(user=Depends(get_current_user)):
             os.unlink(tmp_clients.name)
 
         return {"status": "ok", "wg_conf": wg_content, "clients_table": clients_content}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Ошибка при получении конфигов: {e}"
@@ -170,53 +279,75 @@ def get_configs(user=Depends(get_current_user)):
 
 
 @router.post("/replace_configs")
-def replace_configs(
+async def replace_configs(
     request: ConfigsUpdateRequest,
     user=Depends(get_current_user),
 ):
     """
-    Заменяет конфиги внутри контейнера и перезапускает интерфейс.
+    Заменяет конфиги внутри контейнера. К интерфейсу применяется только
+    разница пиров; контейнер перезапускается, лишь если изменилась секция
+    [Interface].
     """
     try:
-        container = settings.DOCKER_CONTAINER
-
-        # 1. Создаем временные файлы из полученных строк, чтобы передать их в docker_copy_to
-        with tempfile.NamedTemporaryFile(
-            mode="w", delete=False
-        ) as tmp_wg, tempfile.NamedTemporaryFile(mode="w", delete=False) as tmp_clients:
-
-            tmp_wg.write(request.wg_conf)
-            tmp_clients.write(request.clients_table)
+        return await replace_awg_configs(
+            request.wg_conf, request.clients_table, request.backend
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Некорректные конфиги: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при замене конфигов: {e}")
 
-            tmp_wg_path = tmp_wg.name
-            tmp_clients_path = tmp_clients.name
 
-        # 2. Копируем в контейнер
-        docker_copy_to(container, tmp_wg_path, settings.WG_CONFIG_FILE)
-        docker_copy_to(container, tmp_clients_path, settings.CLIENTS_TABLE_PATH)
+@router.get("/stats/collector")
+def stats_collector():
+    """
+    Состояние сборщика: длительность и интервал циклов, отставание (lag),
+    число ошибок.
+    """
+    return collector_state()
 
-        # 3. Чистим временные файлы на хосте
-        os.unlink(tmp_wg_path)
-        os.unlink(tmp_clients_path)
 
-        # 4. Перезапускаем контейнер для применения настроек
-        # (Или используйте вашу функцию restart_awg, если не хотите рестартить весь контейнер)
-        import subprocess
+@router.get("/stats/stream")
+async def stats_stream():
+    """
+    Поток статистики (Server-Sent Events): при подключении — событие
+    snapshot со всеми пирами, после каждого цикла сбора — событие diff
+    только с изменившимися пирами.
+    """
+    return StreamingResponse(
+        stream.subscribe(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        subprocess.run(f"docker restart {container}", shell=True, check=True)
 
-        # 5. Проверка статуса
-        check = docker_exec(container, "wg show")
-        status = (
-            "ok"
-            if "interface:" in check
-            else "warning: container restarted but wg not found"
-        )
+@router.get("/stats/top")
+def stats_top(n: int = Query(10, ge=1, le=1000), by: str = "rate"):
+    """
+    Топ пиров по текущей скорости (rate, rx_rate, tx_rate) или итогам
+    (total, total_rx, total_tx) — из памяти, без обращения к БД.
+    """
+    try:
+        return live.top(n, by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        return {"status": status}
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка при замене конфигов: {e}")
+@router.get("/stats/{peer:path}/history")
+def stat_peer_history(
+    peer: str,
+    start: int | None = Query(None, alias="from"),
+    end: int | None = Query(None, alias="to"),
+    step: int | None = None,
+):
+    """
+    Трафик пира по интервалам: from/to — unix-время, step — шаг в секундах.
+    Данные берутся из самой грубой свёртки, которая отвечает на запрос.
+    """
+    try:
+        return get_peer_history(peer, start, end, step)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/stats/{peer}")
@@ -225,5 +356,24 @@ def stat_one_peer(peer: str):
 
 
 @router.get("/stats")
-def stats():
-    return get_wireguard_stats()
+def stats(
+    response: Response,
+    sort: str = "total",
+    order: str = "desc",
+    offset: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1),
+    active: bool | None = None,
+    search: str | None = None,
+):
+    """
+    Статистика пиров из памяти: сортировка (sort/order), страница
+    (offset/limit), фильтры по активности и подстроке ключа.
+    Общее число подходящих пиров — в заголовке X-Total-Count.
+    """
+    try:
+        total, peers = live.query(sort, order, offset, limit, active, search)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    response.headers["X-Total-Count"] = str(total)
+    return peers
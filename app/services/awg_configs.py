@@ -1,21 +1,26 @@
 import subprocess
-from core.config import settings
-from services.docker_utils import docker_copy_to, docker_exec, docker_copy_from
+from services.awg_manager import replace_configs
+from services.backends import get_backend
+from services.docker_utils import docker_copy_from
 
 
-def get_current_configs(local_wg_conf_path: str, local_clients_table_path: str):
+async def get_current_configs(
+    local_wg_conf_path: str,
+    local_clients_table_path: str,
+    backend_name: str | None = None,
+):
     """
-    Скачивает текущие конфиги из контейнера на хост.
+    Скачивает текущие конфиги бэкенда (по умолчанию — первого) на хост.
     """
-    container = settings.DOCKER_CONTAINER
+    backend = get_backend(backend_name)
+    container = backend.name
 
     print(f"📥 Загрузка текущих конфигов из контейнера {container}...")
 
     try:
-        # Используем твою функцию docker_copy_from
-        docker_copy_from(container, settings.WG_CONFIG_FILE, local_wg_conf_path)
-        docker_copy_from(
-            container, settings.CLIENTS_TABLE_PATH, local_clients_table_path
+        await docker_copy_from(container, backend.wg_config_file, local_wg_conf_path)
+        await docker_copy_from(
+            container, backend.clients_table_path, local_clients_table_path
         )
         print("✅ Конфиги успешно скачаны.")
     except Exception as e:
@@ -23,34 +28,28 @@ def get_current_configs(local_wg_conf_path: str, local_clients_table_path: str):
         raise
 
 
-def replace_configs_and_restart(wg_conf_src: str, clients_table_src: str) -> bool:
+async def replace_configs_and_restart(
+    wg_conf_src: str, clients_table_src: str, backend_name: str | None = None
+) -> bool:
     """
-    Заменяет wg0.conf и clientsTable внутри Docker-контейнера и перезапускает его.
+    Заменяет wg0.conf и clientsTable внутри Docker-контейнера. Изменения пиров
+    применяются к работающему интерфейсу; контейнер перезапускается, только
+    если изменилась секция [Interface].
     """
-    container = settings.DOCKER_CONTAINER
-
     try:
-        print("📤 Копируем новые конфиги в контейнер...")
-        docker_copy_to(container, wg_conf_src, settings.WG_CONFIG_FILE)
-        docker_copy_to(container, clients_table_src, settings.CLIENTS_TABLE_PATH)
-
-        print(f"🔄 Перезапускаем контейнер {container}...")
-        # Перезапуск контейнера — самый надежный способ применить изменения в AmneziaWG
-        subprocess.run(f"docker restart {container}", shell=True, check=True)
-
-        # Небольшая пауза, чтобы интерфейс успел инициализироваться
-        import time
-
-        time.sleep(2)
+        with open(wg_conf_src, "r") as f:
+            wg_conf = f.read()
+        with open(clients_table_src, "r") as f:
+            clients_table = f.read()
 
-        print("🩺 Проверка статуса интерфейса...")
-        output = docker_exec(container, "wg show")
+        print("📤 Заменяем конфиги в контейнере...")
+        result = await replace_configs(wg_conf, clients_table, backend_name)
 
-        if "interface:" in output:
+        if result["status"] == "ok":
             print("✅ WireGuard/AWG успешно запущен.")
             return True
         else:
-            print("⚠️ Интерфейс не найден в выводе wg show.")
+            print("⚠️ Интерфейс не поднялся после перезапуска.")
             return False
 
     except subprocess.CalledProcessError as e:
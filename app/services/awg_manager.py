@@ -1,17 +1,38 @@
+import asyncio
+import ipaddress
 import os
 import re
 import json
+import shutil
 import subprocess
-from datetime import datetime
+import tempfile
+import time
+from functools import partial
 
-from core.config import settings
+from core.config import AwgBackend, settings
 from services.docker_utils import (
     docker_exec,
     docker_copy_from,
     docker_copy_to,
+    docker_restart,
+    apply_peers_or_restart,
     restart_awg,
+    wait_interface,
+)
+from services import wg_keys
+from services.clients_table import ClientsTable, creation_date, get_store
+from services.awg_scheduler import Mutation, get_scheduler
+from services.firewall_utils import block_ips, unblock_ips
+from services.metrics import FREE_IPS, MUTATION_BATCH_ITEMS, MUTATION_BATCH_SECONDS
+from services import placement
+from services.backends import get_backend, get_backends, is_sharded
+from services.stats import snapshot
+from services.wg_config import (
+    LIVE_PEER_KEYS,
+    ServerConfig,
+    diff_peers,
+    parse_server_config,
 )
-from services.firewall_utils import unblock_ip
 
 
 # -----------------------------
@@ -34,18 +55,22 @@ def load_awg_params() -> str:
 # -----------------------------
 # Генерация ключей
 # -----------------------------
-def generate_keys(container: str) -> tuple[str, str, str]:
-    key = docker_exec(container, "wg genkey")
-    psk = docker_exec(container, "wg genpsk")
-    pub = docker_exec(container, f"sh -c \"echo '{key}' | wg pubkey\"")
+def generate_keys() -> tuple[str, str, str]:
+    """
+    Ключи генерируются в процессе API (X25519), без docker exec.
+    """
+    key, pub = wg_keys.generate_keypair()
+    psk = wg_keys.generate_preshared_key()
     return key, pub, psk
 
 
 # -----------------------------
 # Чтение server.conf
 # -----------------------------
-def read_server_config(container: str, wg_config_file: str, temp_path: str) -> str:
-    docker_copy_from(container, wg_config_file, temp_path)
+async def read_server_config(
+    container: str, wg_config_file: str, temp_path: str
+) -> str:
+    await docker_copy_from(container, wg_config_file, temp_path)
     with open(temp_path, "r") as f:
         return f.read()
 
@@ -53,37 +78,21 @@ def read_server_config(container: str, wg_config_file: str, temp_path: str) -> s
 # -----------------------------
 # Выделение IP
 # -----------------------------
-def allocate_ip(server_conf: str) -> str:
-    octet = 2
-    while re.search(rf"AllowedIPs\s*=\s*10\.8\.1\.{octet}/32", server_conf):
-        octet += 1
-        if octet > 254:
-            raise RuntimeError("Подсеть 10.8.1.0/24 заполнена.")
-    return f"10.8.1.{octet}/32"
-
-
-# -----------------------------
-# Обновление server.conf
-# -----------------------------
-def update_server_config(temp_path: str, client_name: str, pub: str, psk: str, ip: str):
-    peer_block = f"""
-
-[Peer]
-# {client_name}
-PublicKey = {pub}
-PresharedKey = {psk}
-AllowedIPs = {ip}
-
-"""
-    with open(temp_path, "a") as f:
-        f.write(peer_block)
+def allocate_ip(config: ServerConfig, backend: AwgBackend) -> str:
+    """
+    Выделяет адрес из подсети бэкенда (и из IPv6-подсети, если задана).
+    Возвращает значение для AllowedIPs, например "10.8.1.5/32".
+    """
+    ips = [config.pool(backend.subnet).allocate()]
+    if backend.subnet_v6:
+        ips.append(config.pool(backend.subnet_v6).allocate())
+    return ", ".join(ips)
 
 
 # -----------------------------
 # Создание клиентского .conf
 # -----------------------------
-def write_client_config(
-    path: str,
+def render_client_config(
     ip: str,
     key: str,
     psk: str,
@@ -91,8 +100,9 @@ def write_client_config(
     endpoint: str,
     port: str,
     awg_params: str,
-):
-    config = f"""[Interface]
+    allowed_ips: str = "0.0.0.0/0",
+) -> str:
+    return f"""[Interface]
 Address = {ip}
 DNS = 1.1.1.1, 1.0.0.1
 PrivateKey = {key}
@@ -101,52 +111,22 @@ PrivateKey = {key}
 [Peer]
 PublicKey = {server_pub}
 PresharedKey = {psk}
-AllowedIPs = 0.0.0.0/0
+AllowedIPs = {allowed_ips}
 Endpoint = {endpoint}:{port}
 PersistentKeepalive = 25
 """
-    with open(path, "w") as f:
-        f.write(config)
-
-
-# -----------------------------
-# Обновление clientsTable
-# -----------------------------
-def update_clients_table(container: str, pub: str, client_name: str, temp_path: str):
-    docker_path = "/opt/amnezia/awg/clientsTable"
-
-    try:
-        docker_copy_from(container, docker_path, temp_path)
-    except subprocess.CalledProcessError:
-        with open(temp_path, "w") as f:
-            f.write("[]")
-
-    with open(temp_path, "r") as f:
-        table = json.load(f)
-
-    table.append(
-        {
-            "clientId": pub,
-            "userData": {
-                "clientName": client_name,
-                "creationDate": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            },
-        }
-    )
-
-    with open(temp_path, "w") as f:
-        json.dump(table, f, indent=4)
-
-    docker_copy_to(container, temp_path, docker_path)
 
 
 # -----------------------------
 # Валидация клиента
 # -----------------------------
-def validate_client_config(container: str, client_conf_path: str, wg_config_file: str):
-    with open(client_conf_path, "r") as f:
-        content = f.read()
-
+def check_client_config(content: str, check_key: bool = True):
+    """
+    Проверка содержимого клиентского конфига без обращения к контейнеру.
+    check_key=False — не проверять PrivateKey вычислением публичного ключа
+    (X25519 на чистом Python, ~2.5 мс): для пар ключей, только что
+    сгенерированных generate_keys.
+    """
     required = [
         "[Interface]",
         "PrivateKey",
@@ -163,145 +143,723 @@ def validate_client_config(container: str, client_conf_path: str, wg_config_file
     if not priv_match:
         raise RuntimeError("Не удалось извлечь PrivateKey из клиентского конфига")
     priv = priv_match.group(1)
+    if not check_key:
+        return
 
     try:
-        docker_exec(container, f"sh -c \"echo '{priv}' | wg pubkey\"")
-    except Exception:
+        wg_keys.public_key(priv)
+    except ValueError:
         raise RuntimeError("Некорректный приватный ключ клиента")
 
+
+async def validate_server_config(container: str, wg_config_file: str):
     try:
-        docker_exec(container, f"wg-quick strip {wg_config_file}")
+        await docker_exec(container, f"wg-quick strip {wg_config_file}")
     except Exception:
         raise RuntimeError("Серверный конфиг повреждён после добавления клиента")
 
-    return True
 
+def _check_client_name(client_name: str, config: ServerConfig):
+    if (
+        not client_name
+        or client_name != client_name.strip()
+        or any(c in client_name for c in "/\\\n\r")
+        or client_name in (".", "..")
+    ):
+        raise RuntimeError(f"Некорректное имя клиента: {client_name!r}")
 
-# -----------------------------
-# Основная функция add_client
-# -----------------------------
-def add_client(client_name: str) -> str:
-    container = settings.DOCKER_CONTAINER
-    endpoint = settings.ENDPOINT
-    wg_config_file = settings.WG_CONFIG_FILE
+    if client_name in config.by_name:
+        raise RuntimeError(f"Клиент {client_name} уже существует")
 
-    pwd = os.getcwd()
-    client_dir = os.path.join(pwd, "users", client_name)
-    files_dir = os.path.join(pwd, "files")
-    os.makedirs(client_dir, exist_ok=True)
-    os.makedirs(files_dir, exist_ok=True)
 
-    temp_conf = os.path.join(files_dir, "server.conf")
-    temp_table = os.path.join(files_dir, "clientsTable")
-
-    key, pub, psk = generate_keys(container)
-
-    server_conf = read_server_config(container, wg_config_file, temp_conf)
-
-    # Загружаем AWG параметры из JSON
-    awg_params = load_awg_params()
+# -----------------------------
+# Транзакция изменений конфигов контейнера
+# -----------------------------
+class ConfigTransaction:
+    """
+    Накопление изменений server.conf, clientsTable и блокировок в памяти
+    с одним применением в commit(): одна запись каждого файла, одна
+    транзакция iptables и один wg set на весь пакет.
+    """
+
+    def __init__(self, backend: AwgBackend, wg_config_file: str | None = None):
+        self.backend = backend
+        self.container = backend.name
+        self.wg_config_file = wg_config_file or backend.wg_config_file
+        self.store = get_store(backend.name)
+        self.tmp_dir = tempfile.mkdtemp(prefix="awg-batch-")
+        self.temp_conf = os.path.join(self.tmp_dir, "server.conf")
+
+        self.config: ServerConfig | None = None
+        self.table: ClientsTable | None = None
+        self.server_pub = ""
+        self.awg_params = ""
+
+        self.conf_changed = False
+        self.table_added: list[tuple[str, str]] = []
+        self.table_removed_names: set[str] = set()
+        self.table_removed_keys: set[str] = set()
+        self.peers_upsert: dict[str, tuple[str, str, str]] = {}
+        self.peers_remove: set[str] = set()
+        self.to_block: set[str] = set()
+        self.to_unblock: set[str] = set()
+        # результаты операций по IP: при ошибке firewall помечаются они
+        self.ip_results: dict[str, list[dict]] = {}
+        # users/<name>/<name>.conf пишутся только после успешного commit():
+        # иначе у клиента окажутся ключи, которых нет на сервере
+        self.user_confs: dict[str, str] = {}
+        self.added = False
+
+    async def load(self, with_table: bool = False):
+        """with_table — нужна clientsTable (добавление/удаление клиентов)."""
+        if with_table:
+            self.table = await self.store.get()
+
+        # Разбор большого конфига — CPU-работа, выносим из event loop
+        self.config = await asyncio.to_thread(
+            parse_server_config,
+            await read_server_config(
+                self.container, self.wg_config_file, self.temp_conf
+            ),
+        )
+
+        if self.config.private_key:
+            self.server_pub = wg_keys.server_public_key(
+                self.config.private_key, self.container
+            )
+
+    # --- операции ---
+    def add(self, client_name: str, keys: tuple[str, str, str]) -> dict:
+        assert self.config is not None
+        config = self.config
+        result = {"client_name": client_name}
+        key, pub, psk = keys
+        peer = None
+
+        try:
+            if not self.server_pub:
+                raise RuntimeError("В server.conf не найден PrivateKey")
+            if not self.awg_params:
+                # Загружаем AWG параметры из JSON
+                self.awg_params = load_awg_params()
+
+            _check_client_name(client_name, config)
+
+            ip = allocate_ip(config, self.backend)
+            peer = config.add_peer(client_name, pub, psk, ip)
+
+            client_conf = _render_user_config(
+                ip,
+                key,
+                psk,
+                self.server_pub,
+                self.awg_params,
+                self.backend,
+            )
+        except Exception as e:
+            if peer is not None:
+                config.remove_peer(peer)
+            result.update(status="error", error=str(e))
+            return result
+
+        self.conf_changed = True
+        self.added = True
+        self.table_added.append((pub, client_name))
+        self.user_confs[client_name] = client_conf
+        self.peers_upsert[pub] = (pub, psk, ip)
+        self.peers_remove.discard(pub)
+        result.update(status="ok", client_conf=client_conf)
+        return result
+
+    def remove(self, client: str) -> dict:
+        assert self.config is not None
+        peer = self.config.find(client)
+        if not peer and self.table is not None:
+            # имя может быть только в clientsTable, а в server.conf — ключ
+            key = self.table.key_of(client)
+            peer = self.config.find(key) if key else None
+        if not peer:
+            print(f"[awg] ⚠ Клиент {client} не найден в server.conf")
+            self.table_removed_names.add(client)
+            return {"client": client, "status": "not_found"}
+
+        if peer.name:
+            self.table_removed_names.add(peer.name)
+            self.user_confs.pop(peer.name, None)
+        if peer.public_key:
+            self.table_removed_keys.add(peer.public_key)
+            # клиент мог быть добавлен в этом же пакете
+            self.table_added = [
+                (pub, name) for pub, name in self.table_added if pub != peer.public_key
+            ]
+            self.peers_upsert.pop(peer.public_key, None)
+            self.peers_remove.add(peer.public_key)
+        result = {"client": client, "status": "removed", "ips": peer.ips}
+        for ip in peer.ips:
+            self.to_block.discard(ip)
+            self.to_unblock.add(ip)
+            self.ip_results.setdefault(ip, []).append(result)
+
+        self.config.remove_peer(peer)
+        self.conf_changed = True
+        return result
+
+    def replace_psk(self, client: str, psk: str | None) -> dict:
+        """psk=None — сгенерировать новый ключ."""
+        assert self.config is not None
+        peer = self.config.find(client)
+        if not peer or not peer.public_key:
+            return {"client": client, "status": "not_found"}
+
+        try:
+            psk = wg_keys.check_key(psk) if psk else wg_keys.generate_preshared_key()
+        except ValueError as e:
+            return {"client": client, "status": "error", "error": str(e)}
+
+        self.config.update_peer(peer, "PresharedKey", psk)
+        client_conf = self._user_conf_with_psk(peer.name, psk) if peer.name else None
+        if client_conf is not None:
+            self.user_confs[peer.name] = client_conf
+        self.peers_upsert[peer.public_key] = (
+            peer.public_key,
+            psk,
+            ", ".join(peer.allowed_ips),
+        )
+        self.conf_changed = True
+        return {
+            "client": client,
+            "status": "ok",
+            "public_key": peer.public_key,
+            "client_conf": client_conf,
+        }
 
-    server_priv_match = re.search(r"PrivateKey\s*=\s*(\S+)", server_conf)
-    server_priv = server_priv_match.group(1)
-    server_pub = docker_exec(container, f"sh -c \"echo '{server_priv}' | wg pubkey\"")
+    def _user_conf_with_psk(self, client_name: str, psk: str) -> str | None:
+        """
+        Сохранённый конфиг клиента (с учётом изменений этого пакета) с новым
+        PresharedKey. None — если конфига клиента на хосте нет (приватный
+        ключ клиента сервер не хранит, собрать конфиг заново нельзя).
+        """
+        content = self.user_confs.get(client_name)
+        if content is None:
+            path = _user_config_path(client_name)
+            if not os.path.exists(path):
+                return None
+            with open(path, "r") as f:
+                content = f.read()
+
+        return re.sub(
+            r"^(PresharedKey\s*=\s*).*$",
+            lambda m: m.group(1) + psk,
+            content,
+            flags=re.MULTILINE,
+        )
+
+    def block(self, ip: str) -> dict:
+        if not _is_ip(ip):
+            return {"ip": ip, "status": "error", "error": "Некорректный IP-адрес"}
+        self.to_unblock.discard(ip)
+        self.to_block.add(ip)
+        result = {"ip": ip, "status": "blocked"}
+        self.ip_results.setdefault(ip, []).append(result)
+        return result
+
+    def unblock(self, ip: str) -> dict:
+        if not _is_ip(ip):
+            return {"ip": ip, "status": "error", "error": "Некорректный IP-адрес"}
+        self.to_block.discard(ip)
+        self.to_unblock.add(ip)
+        result = {"ip": ip, "status": "unblocked"}
+        self.ip_results.setdefault(ip, []).append(result)
+        return result
+
+    # --- применение ---
+    async def commit(self):
+        if self.conf_changed:
+            assert self.config is not None
+            text = await asyncio.to_thread(self.config.render)
+            with open(self.temp_conf, "w") as f:
+                f.write(text)
+            await docker_copy_to(self.container, self.temp_conf, self.wg_config_file)
+
+        if self.table_added or self.table_removed_names or self.table_removed_keys:
+            await self._commit_clients_table()
+
+        # server.conf записан для персистентности, в живой интерфейс изменения
+        # применяются через wg set — остальные туннели не разрываются
+        if self.peers_upsert or self.peers_remove:
+            await apply_peers_or_restart(
+                self.container,
+                self.backend.interface,
+                self.wg_config_file,
+                list(self.peers_upsert.values()),
+                remove=sorted(self.peers_remove),
+            )
+
+        # пиры применены — ключи клиентов уже есть на сервере
+        for client_name, content in self.user_confs.items():
+            _save_user_config(client_name, content)
+
+        if self.added:
+            await validate_server_config(self.container, self.wg_config_file)
+
+        # firewall — последним и со своей обработкой ошибок: его сбой не
+        # должен отменять уже применённые изменения пиров
+        if self.to_unblock:
+            await self._firewall(unblock_ips, self.to_unblock)
+        if self.to_block:
+            await self._firewall(block_ips, self.to_block)
+
+    async def _firewall(self, apply, ips: set[str]):
+        try:
+            await apply(sorted(ips))
+        except Exception as e:
+            print(f"[awg] ⚠ Ошибка firewall: {e}")
+            for ip in ips:
+                for result in self.ip_results.get(ip, ()):
+                    if result["status"] == "removed":
+                        # клиент удалён, не удалась только разблокировка IP
+                        result["error"] = f"firewall: {e}"
+                    else:
+                        result.update(status="error", error=f"firewall: {e}")
+
+    async def _commit_clients_table(self):
+        # правим копию: при ошибке записи кеш остаётся прежним
+        table = (self.table or await self.store.get()).copy()
+
+        removed = table.remove(self.table_removed_names, self.table_removed_keys)
+        if removed:
+            print(f"[awg] clientsTable: удалено записей {removed}")
+
+        date = creation_date()
+        for pub, client_name in self.table_added:
+            table.add(pub, client_name, date)
+
+        await self.store.write(table)
+
+    def close(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def _is_ip(ip: str) -> bool:
+    try:
+        ipaddress.ip_address(ip.split("/")[0].strip())
+    except ValueError:
+        return False
+    return True
 
-    ip = allocate_ip(server_conf)
 
-    update_server_config(temp_conf, client_name, pub, psk, ip)
-    docker_copy_to(container, temp_conf, wg_config_file)
+def _user_config_path(client_name: str) -> str:
+    return os.path.join(os.getcwd(), "users", client_name, f"{client_name}.conf")
 
-    restart_awg(container, wg_config_file)
 
-    client_conf_path = os.path.join(client_dir, f"{client_name}.conf")
-    write_client_config(
-        client_conf_path,
+def _render_user_config(
+    ip: str,
+    key: str,
+    psk: str,
+    server_pub: str,
+    awg_params: str,
+    backend: AwgBackend,
+) -> str:
+    client_conf = render_client_config(
         ip,
         key,
         psk,
         server_pub,
-        endpoint,
-        port="33042",
+        backend.endpoint,
+        port=backend.port,
         awg_params=awg_params,
+        allowed_ips="0.0.0.0/0, ::/0" if backend.subnet_v6 else "0.0.0.0/0",
     )
+    # ключи сгенерированы в пакете, публичный уже посчитан в потоке
+    check_client_config(client_conf, check_key=False)
+    return client_conf
 
-    validate_client_config(container, client_conf_path, wg_config_file)
-
-    update_clients_table(container, pub, client_name, temp_table)
 
-    with open(client_conf_path, "r") as f:
-        return f.read()
+def _save_user_config(client_name: str, content: str):
+    path = _user_config_path(client_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
 
 
 # -----------------------------
-# Удаление клиента
+# Замена конфигов целиком
 # -----------------------------
-def extract_client_ip(server_conf: str, client_name: str) -> str | None:
-    lines = server_conf.splitlines()
-    found = False
-
-    for line in lines:
-        if line.strip() == f"# {client_name}":
-            found = True
-            continue
-
-        if found and "AllowedIPs" in line:
-            return line.split("=")[1].strip().split("/")[0]
-
-        if found and line.strip().startswith("[Peer]"):
-            break
-
-    return None
-
-
-def remove_client(client_name: str):
-    container = settings.DOCKER_CONTAINER
-    wg_config_file = settings.WG_CONFIG_FILE
-
-    temp_conf = "/tmp/awg_remove.conf"
-    temp_table = "/tmp/awg_clients_table.json"
-    docker_table_path = "/opt/amnezia/awg/clientsTable"
-
-    docker_copy_from(container, wg_config_file, temp_conf)
-
-    with open(temp_conf, "r") as f:
-        server_conf = f.read()
-
-    client_ip = extract_client_ip(server_conf, client_name)
-
-    lines = server_conf.splitlines(keepends=True)
-    new_lines = []
-    skip = False
+async def _replace_configs(
+    backend: AwgBackend, wg_config_file: str, wg_conf: str, clients_table: str
+) -> dict:
+    """
+    Записывает новые server.conf и clientsTable и применяет к интерфейсу
+    только разницу пиров. Контейнер перезапускается, лишь если изменилась
+    секция [Interface] (или старый конфиг прочитать не удалось).
+    """
+    # оба файла проверяются до того, как что-то будет записано
+    entries = json.loads(clients_table)
+    if not isinstance(entries, list):
+        raise ValueError("clientsTable должна быть JSON-списком")
+    table = ClientsTable(entries)
+    new = await asyncio.to_thread(parse_server_config, wg_conf)
+    if not new.private_key:
+        raise ValueError("В новом server.conf не найден PrivateKey")
+
+    container = backend.name
+    tmp_dir = tempfile.mkdtemp(prefix="awg-replace-")
+    temp_conf = os.path.join(tmp_dir, "server.conf")
+    try:
+        try:
+            old = await asyncio.to_thread(
+                parse_server_config,
+                await read_server_config(container, wg_config_file, temp_conf),
+            )
+        except subprocess.CalledProcessError:
+            old = None
+
+        with open(temp_conf, "w") as f:
+            f.write(wg_conf)
+        await docker_copy_to(container, temp_conf, wg_config_file)
+        await get_store(container).write(table)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    result = {"status": "ok", "restarted": False}
+
+    if old is None or old.interface != new.interface:
+        print(f"🔄 Изменена секция [Interface] — перезапуск контейнера {container}...")
+        await docker_restart(container)
+        result["restarted"] = True
+    else:
+        added, removed, changed = diff_peers(old, new)
+        upsert = added + changed
+        result.update(added=len(added), removed=len(removed), changed=len(changed))
+        print(f"[awg] Замена конфигов: +{len(added)} -{len(removed)} ~{len(changed)}")
+
+        if all(
+            p.preshared_key and p.settings().keys() <= LIVE_PEER_KEYS for p in upsert
+        ):
+            if upsert or removed:
+                await apply_peers_or_restart(
+                    container,
+                    backend.interface,
+                    wg_config_file,
+                    [
+                        (p.public_key, p.preshared_key, ", ".join(p.allowed_ips))
+                        for p in upsert
+                    ],
+                    remove=removed,
+                )
+        else:
+            # Endpoint, PersistentKeepalive и пиры без PSK — через wg-quick
+            await restart_awg(container, wg_config_file)
+            result["restarted"] = True
+
+    # проверка готовности опросом, а не фиксированной паузой
+    if result["restarted"] and not await wait_interface(
+        container, backend.interface, settings.AWG_READY_TIMEOUT
+    ):
+        result["status"] = "warning: interface is not up"
+
+    snapshot.invalidate(container)
+    placement.invalidate()
+    _observe_pools(new, backend)
+    return result
 
-    for line in lines:
-        if line.strip() == f"# {client_name}":
-            skip = True
-            continue
 
-        if skip and line.strip().startswith("[Peer]"):
-            skip = False
+# -----------------------------
+# Планировщик изменений
+# -----------------------------
+# Все изменения контейнера идут через одну очередь: операции, пришедшие
+# за MUTATION_BATCH_WINDOW_MS, применяются одной транзакцией. Замена
+# конфигов целиком (replace) — всегда отдельным пакетом.
+EXCLUSIVE_KINDS = frozenset({"replace"})
+FIREWALL_KINDS = frozenset({"block", "unblock"})
+
+
+async def _apply_batch(backend: AwgBackend, batch: list[Mutation]):
+    # все операции пакета — над одним файлом (target), см. _submit
+    wg_config_file = batch[0].target
+    if batch[0].kind in EXCLUSIVE_KINDS:
+        m = batch[0]
+        m.results = [
+            await _replace_configs(backend, wg_config_file, wg_conf, clients_table)
+            for wg_conf, clients_table in m.items
+        ]
+        return
+
+    # X25519 на чистом Python — ~2 мс на ключ, для пакета считаем в потоке
+    adds = sum(len(m.items) for m in batch if m.kind == "add")
+    keys = iter(await asyncio.to_thread(lambda: [generate_keys() for _ in range(adds)]))
+
+    start = time.perf_counter()
+    MUTATION_BATCH_ITEMS.observe(sum(len(m.items) for m in batch))
+
+    tx = ConfigTransaction(backend, wg_config_file)
+    try:
+        # блокировки — только firewall хоста, server.conf для них не нужен
+        if any(m.kind not in FIREWALL_KINDS for m in batch):
+            await tx.load(with_table=any(m.kind in ("add", "remove") for m in batch))
+
+        for m in batch:
+            if m.kind == "add":
+                m.results = [tx.add(name, next(keys)) for name in m.items]
+            elif m.kind == "remove":
+                m.results = [tx.remove(client) for client in m.items]
+            elif m.kind == "psk":
+                m.results = [tx.replace_psk(client, psk) for client, psk in m.items]
+            elif m.kind == "block":
+                m.results = [tx.block(ip) for ip in m.items]
+            elif m.kind == "unblock":
+                m.results = [tx.unblock(ip) for ip in m.items]
+            else:
+                raise RuntimeError(f"Неизвестная операция: {m.kind}")
+
+        await tx.commit()
+        _observe_pools(tx.config, backend)
+    finally:
+        tx.close()
+        MUTATION_BATCH_SECONDS.observe(time.perf_counter() - start)
+
+
+# бэкенды, для которых awg_free_ips уже выставлен по server.conf
+_pools_observed: set[str] = set()
+
+
+def _observe_pools(config: ServerConfig | None, backend: AwgBackend):
+    if config is None:
+        return
+    _pools_observed.add(backend.name)
+    for subnet in (backend.subnet, backend.subnet_v6):
+        if subnet:
+            FREE_IPS.labels(subnet).set(config.pool(subnet).free)
+
+
+async def seed_pool_metrics():
+    """
+    awg_free_ips при старте: server.conf каждого бэкенда читается один раз,
+    не дожидаясь первого изменения. Бэкенды, по которым пакет изменений
+    успел выставить значение раньше, пропускаются.
+    """
+    for backend in get_backends():
+        tmp_dir = tempfile.mkdtemp(prefix="awg-pools-")
+        try:
+            config = await asyncio.to_thread(
+                parse_server_config,
+                await read_server_config(
+                    backend.name,
+                    backend.wg_config_file,
+                    os.path.join(tmp_dir, "server.conf"),
+                ),
+            )
+        except Exception as e:
+            print(f"⚠️ Не удалось прочитать server.conf бэкенда {backend.name}: {e}")
             continue
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        if backend.name not in _pools_observed:
+            _observe_pools(config, backend)
+
+
+async def _submit(
+    kind: str,
+    items: list,
+    backend: AwgBackend,
+    wg_config_file: str | None = None,
+) -> list:
+    wg_config_file = wg_config_file or backend.wg_config_file
+
+    # очередь — на бэкенд (контейнер); файл конфига передаётся с операцией,
+    # чтобы операции над другим файлом не применились к файлу первого пакета
+    scheduler = get_scheduler(
+        backend.name,
+        partial(_apply_batch, backend),
+        window=settings.MUTATION_BATCH_WINDOW_MS / 1000,
+        max_batch=settings.MUTATION_BATCH_MAX,
+        exclusive=EXCLUSIVE_KINDS,
+    )
+    return await scheduler.submit(kind, items, wg_config_file)
+
+
+async def _fan_out(
+    kind: str,
+    items: list,
+    targets: list[AwgBackend],
+    wg_config_file: str | None = None,
+) -> list:
+    """
+    Операция над items, разложенными по бэкендам (targets[i] — бэкенд
+    items[i]): пакеты разных бэкендов применяются параллельно, результаты
+    возвращаются в исходном порядке.
+    """
+    groups: dict[str, list[int]] = {}
+    by_name: dict[str, AwgBackend] = {}
+    for i, backend in enumerate(targets):
+        groups.setdefault(backend.name, []).append(i)
+        by_name[backend.name] = backend
+
+    results: list = [None] * len(items)
+
+    async def run(name: str, positions: list[int]):
+        out = await _submit(
+            kind, [items[i] for i in positions], by_name[name], wg_config_file
+        )
+        for i, result in zip(positions, out):
+            if isinstance(result, dict) and is_sharded():
+                result["backend"] = name
+            results[i] = result
+
+    await asyncio.gather(*(run(name, pos) for name, pos in groups.items()))
+    return results
+
+
+async def _targets(clients: list[str], container: str | None) -> list[AwgBackend]:
+    """Бэкенды клиентов: заданный явно или по индексу клиент → бэкенд."""
+    if container is not None:
+        return [get_backend(container)] * len(clients)
+    return await placement.locate(clients)
 
-        if not skip:
-            new_lines.append(line)
-
-    with open(temp_conf, "w") as f:
-        f.writelines(new_lines)
-
-    docker_copy_from(container, docker_table_path, temp_table)
-
-    with open(temp_table, "r") as f:
-        table = json.load(f)
 
-    table = [c for c in table if c["userData"]["clientName"] != client_name]
+# -----------------------------
+# Добавление клиентов
+# -----------------------------
+async def add_client(client_name: str) -> str:
+    result = (await add_clients([client_name]))[0]
+    if result["status"] != "ok":
+        raise RuntimeError(result["error"])
+    return result["client_conf"]
+
+
+async def add_clients(
+    client_names: list[str],
+    container: str | None = None,
+    wg_config_file: str | None = None,
+) -> list[dict]:
+    """
+    Пакетное добавление клиентов. Вызовы, пришедшие одновременно,
+    объединяются планировщиком: server.conf и clientsTable записываются
+    один раз, а все новые пиры применяются одним вызовом wg set.
+    Ошибки по отдельным клиентам возвращаются в результате, не прерывая пакет.
+
+    container — имя бэкенда; без него клиенты размещаются по нагрузке.
+    """
+    names = list(client_names)
+    if not is_sharded():
+        return await _fan_out(
+            "add", names, [get_backend(container)] * len(names), wg_config_file
+        )
+
+    # имя проверяется по всем бэкендам: иначе тот же клиент появится
+    # на другом бэкенде и перезапишет users/<name>/<name>.conf
+    free = await placement.reserve(names)
+    new = [name for name, ok in zip(names, free) if ok]
+    try:
+        if container is not None:
+            targets = [get_backend(container)] * len(new)
+        else:
+            targets = await placement.place(len(new))
+
+        added = await _fan_out("add", new, targets, wg_config_file)
+        for name, backend, result in zip(new, targets, added):
+            if result["status"] == "ok":
+                placement.remember(name, backend.name)
+    finally:
+        placement.release(new)
+
+    done = iter(added)
+    return [
+        (
+            next(done)
+            if ok
+            else {
+                "client_name": name,
+                "status": "error",
+                "error": f"Клиент {name} уже существует",
+            }
+        )
+        for name, ok in zip(names, free)
+    ]
 
-    with open(temp_table, "w") as f:
-        json.dump(table, f, indent=4)
 
-    if client_ip:
-        unblock_ip(client_ip)
+# -----------------------------
+# Удаление клиентов
+# -----------------------------
+async def remove_client(client_name: str):
+    await remove_clients([client_name])
+
+
+async def remove_clients(
+    clients: list[str],
+    container: str | None = None,
+    wg_config_file: str | None = None,
+) -> list[dict]:
+    """
+    Пакетное удаление клиентов по имени или публичному ключу:
+    блок [Peer], запись clientsTable, блокировка IP и пир в интерфейсе.
+    """
+    print(f"[awg] 🗑 Удаление клиентов: {len(clients)}")
+    clients = list(clients)
+    results = await _fan_out(
+        "remove", clients, await _targets(clients, container), wg_config_file
+    )
+    for client, result in zip(clients, results):
+        if result["status"] == "removed":
+            placement.forget(client)
+    return results
 
-    docker_copy_to(container, temp_conf, wg_config_file)
-    docker_copy_to(container, temp_table, docker_table_path)
 
-    docker_exec(container, f"sh -c 'wg-quick down {wg_config_file} || true'")
-    docker_exec(container, f"sh-quick up {wg_config_file}'")
+# -----------------------------
+# Смена PSK и блокировки
+# -----------------------------
+async def replace_psks(
+    items: list[tuple[str, str | None]],
+    container: str | None = None,
+    wg_config_file: str | None = None,
+) -> list[dict]:
+    """
+    Замена PresharedKey: items — пары (имя или публичный ключ, новый PSK или
+    None — сгенерировать). Одна запись server.conf и один wg set на пакет;
+    в результате — обновлённые конфиги клиентов.
+    """
+    items = list(items)
+    targets = await _targets([client for client, _ in items], container)
+    return await _fan_out("psk", items, targets, wg_config_file)
+
+
+async def replace_configs(
+    wg_conf: str,
+    clients_table: str,
+    container: str | None = None,
+    wg_config_file: str | None = None,
+) -> dict:
+    """
+    Замена server.conf и clientsTable бэкенда с применением разницы пиров
+    без перезапуска контейнера. Выполняется в очереди изменений отдельно
+    от остальных операций.
+    """
+    return (
+        await _submit(
+            "replace",
+            [(wg_conf, clients_table)],
+            get_backend(container),
+            wg_config_file,
+        )
+    )[0]
+
+
+async def block_client_ips(ips: list[str], container: str | None = None) -> list[dict]:
+    ips = list(ips)
+    return await _fan_out("block", ips, _ip_targets(ips, container))
+
+
+async def unblock_client_ips(
+    ips: list[str], container: str | None = None
+) -> list[dict]:
+    ips = list(ips)
+    return await _fan_out("unblock", ips, _ip_targets(ips, container))
+
+
+def _ip_targets(ips: list[str], container: str | None) -> list[AwgBackend]:
+    # блокировка идёт через очередь бэкенда, в подсети которого адрес,
+    # чтобы не гоняться с удалением его клиентов
+    if container is not None:
+        return [get_backend(container)] * len(ips)
+    return [placement.backend_of_ip(ip) for ip in ips]
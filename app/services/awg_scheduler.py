@@ -0,0 +1,154 @@
+import asyncio
+import sys
+from typing import Any, Awaitable, Callable
+
+
+def _log(msg: str):
+    print(f"[awg-scheduler] {msg}", file=sys.stderr)
+
+
+class Mutation:
+    """
+    Одна операция в очереди: kind — тип (add/remove/block/...),
+    items — элементы операции, results — результаты по элементам,
+    которые заполняет обработчик пакета. target — к чему применяется
+    операция (например, файл конфига): операции с разными target в один
+    пакет не объединяются.
+    """
+
+    __slots__ = ("kind", "items", "target", "future", "results")
+
+    def __init__(
+        self, kind: str, items: list[Any], future: asyncio.Future, target: Any = None
+    ):
+        self.kind = kind
+        self.items = items
+        self.target = target
+        self.future = future
+        self.results: list[Any] = []
+
+
+class MutationScheduler:
+    """
+    Очередь изменений одного AWG-контейнера.
+
+    Все операции, пришедшие за окно window (секунды) после первой, собираются
+    в пакет и применяются одним вызовом apply_batch — с одной записью
+    конфигов и одним применением к интерфейсу. Пакеты выполняются строго
+    последовательно, поэтому read-modify-write конфигов не гоняется.
+
+    Операции видов из exclusive (например, замена конфигов целиком) всегда
+    идут отдельным пакетом, без окна ожидания; операция с другим target
+    начинает новый пакет.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        apply_batch: Callable[[list[Mutation]], Awaitable[None]],
+        window: float,
+        max_batch: int,
+        exclusive: frozenset[str] = frozenset(),
+    ):
+        self.name = name
+        self.apply_batch = apply_batch
+        self.window = window
+        self.max_batch = max_batch
+        self.exclusive = exclusive
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue[Mutation] | None = None
+        self._worker: asyncio.Task | None = None
+        # эксклюзивная операция, отложенная до следующего пакета
+        self._held: Mutation | None = None
+
+    async def submit(
+        self, kind: str, items: list[Any], target: Any = None
+    ) -> list[Any]:
+        """Ставит операцию в очередь и ждёт результата её пакета."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # очередь и воркер привязаны к event loop
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = None
+            self._held = None
+
+        assert self._queue is not None
+        mutation = Mutation(kind, items, loop.create_future(), target)
+        self._queue.put_nowait(mutation)
+
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+        return await mutation.future
+
+    async def _next_batch(self) -> list[Mutation]:
+        assert self._queue is not None
+
+        first = self._held or await self._queue.get()
+        self._held = None
+        if first.kind in self.exclusive:
+            return [] if first.future.done() else [first]
+
+        batch = [first]
+        size = len(first.items)
+
+        # даём накопиться операциям, пришедшим в течение окна
+        if self.window > 0:
+            await asyncio.sleep(self.window)
+
+        while size < self.max_batch:
+            try:
+                mutation = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            if mutation.kind in self.exclusive or mutation.target != first.target:
+                self._held = mutation
+                break
+            batch.append(mutation)
+            size += len(mutation.items)
+
+        # операции, чьи вызывающие уже отменены, не применяем
+        return [m for m in batch if not m.future.done()]
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+
+            _log(
+                f"{self.name}: batch of {len(batch)} ops "
+                f"({sum(len(m.items) for m in batch)} items)"
+            )
+
+            try:
+                await self.apply_batch(batch)
+            except Exception as e:
+                _log(f"{self.name}: batch failed: {e}")
+                for m in batch:
+                    if not m.future.done():
+                        m.future.set_exception(e)
+                continue
+
+            for m in batch:
+                if not m.future.done():
+                    m.future.set_result(m.results)
+
+
+_schedulers: dict[str, MutationScheduler] = {}
+
+
+def get_scheduler(
+    name: str,
+    apply_batch: Callable[[list[Mutation]], Awaitable[None]],
+    window: float,
+    max_batch: int,
+    exclusive: frozenset[str] = frozenset(),
+) -> MutationScheduler:
+    """Планировщик на контейнер (создаётся при первом обращении)."""
+    scheduler = _schedulers.get(name)
+    if scheduler is None:
+        scheduler = MutationScheduler(name, apply_batch, window, max_batch, exclusive)
+        _schedulers[name] = scheduler
+    return scheduler
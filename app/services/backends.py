@@ -0,0 +1,64 @@
+from core.config import AwgBackend, settings
+from services.docker_utils import register_container
+
+# -----------------------------
+# Пул AWG-бэкендов
+# -----------------------------
+# Бэкенды задаются в AWG_BACKENDS; без него — один бэкенд из старых
+# настроек (DOCKER_CONTAINER, WG_CONFIG_FILE, WG_SUBNET, ENDPOINT).
+# Имя бэкенда используется везде, где раньше было имя контейнера:
+# очередь изменений, кеш clientsTable, вызовы docker.
+
+_backends: dict[str, AwgBackend] | None = None
+
+
+def _load() -> dict[str, AwgBackend]:
+    global _backends
+
+    if _backends is None:
+        if settings.AWG_BACKENDS:
+            backends = {}
+            for backend in settings.AWG_BACKENDS:
+                if backend.name in backends:
+                    raise RuntimeError(f"Бэкенд {backend.name} задан дважды")
+                register_container(backend.name, backend.container, backend.docker_host)
+                backends[backend.name] = backend
+        else:
+            default = AwgBackend(
+                name=settings.DOCKER_CONTAINER,
+                container=settings.DOCKER_CONTAINER,
+                endpoint=settings.ENDPOINT,
+                subnet=settings.WG_SUBNET,
+                subnet_v6=settings.WG_SUBNET_V6,
+                interface=settings.WG_INTERFACE,
+                wg_config_file=settings.WG_CONFIG_FILE,
+                clients_table_path=settings.CLIENTS_TABLE_PATH,
+            )
+            backends = {default.name: default}
+        _backends = backends
+
+    return _backends
+
+
+def get_backends() -> list[AwgBackend]:
+    return list(_load().values())
+
+
+def find_backend(name: str) -> AwgBackend | None:
+    return _load().get(name)
+
+
+def get_backend(name: str | None = None) -> AwgBackend:
+    """Бэкенд по имени; без имени — первый (единственный) бэкенд."""
+    backends = _load()
+    if name is None:
+        return next(iter(backends.values()))
+
+    backend = backends.get(name)
+    if backend is None:
+        raise ValueError(f"Неизвестный бэкенд: {name}")
+    return backend
+
+
+def is_sharded() -> bool:
+    return len(_load()) > 1
@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+from services.metrics import BLOCKED_IPS
+from services.stats.database import db_lock, get_conn
+
+# -----------------------------
+# Список заблокированных IP
+# -----------------------------
+# Источник правды — таблица blocked_ips в stats.db; в памяти держится её
+# копия, поэтому проверки «заблокирован ли IP» и выдача списка не трогают
+# ни БД, ни firewall. Правила в ядре сверяются со списком при старте
+# (firewall_utils.reconcile_blocklist).
+
+_blocked: dict[str, int] = {}
+
+
+def load():
+    """Читает список из БД в память (при старте приложения)."""
+    conn = get_conn()
+    with db_lock():
+        rows = conn.execute("SELECT ip, blocked_at FROM blocked_ips").fetchall()
+
+    _blocked.clear()
+    _blocked.update(rows)
+    BLOCKED_IPS.set(len(_blocked))
+
+
+def is_blocked(ip: str) -> bool:
+    return ip in _blocked
+
+
+def blocked_ips() -> set[str]:
+    return set(_blocked)
+
+
+def list_blocked() -> list[dict]:
+    return [
+        {"ip": ip, "blocked_at": blocked_at}
+        for ip, blocked_at in sorted(_blocked.items())
+    ]
+
+
+# Запись в БД — в потоке: db_lock держит и сборщик статистики на время
+# save_stats, и ожидание не должно останавливать event loop. Копия в
+# памяти меняется только из event loop.
+def _insert(ips: list[str], now: int):
+    conn = get_conn()
+    with db_lock(), conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO blocked_ips (ip, blocked_at) VALUES (?, ?)",
+            [(ip, now) for ip in ips],
+        )
+
+
+def _delete(ips: list[str]):
+    conn = get_conn()
+    with db_lock(), conn:
+        conn.executemany("DELETE FROM blocked_ips WHERE ip=?", [(ip,) for ip in ips])
+
+
+async def add(ips: list[str] | set[str]):
+    new = [ip for ip in ips if ip not in _blocked]
+    if not new:
+        return
+
+    now = int(time.time())
+    await asyncio.to_thread(_insert, new, now)
+    for ip in new:
+        _blocked[ip] = now
+    BLOCKED_IPS.set(len(_blocked))
+
+
+async def remove(ips: list[str] | set[str]):
+    gone = [ip for ip in ips if ip in _blocked]
+    if not gone:
+        return
+
+    await asyncio.to_thread(_delete, gone)
+    for ip in gone:
+        _blocked.pop(ip, None)
+    BLOCKED_IPS.set(len(_blocked))
@@ -0,0 +1,191 @@
+import json
+import os
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from core.config import settings
+from services.backends import find_backend, get_backend
+from services.docker_utils import docker_copy_from, docker_copy_to, docker_exec
+
+# -----------------------------
+# clientsTable
+# -----------------------------
+# Файл — JSON-список записей {"clientId": <публичный ключ>,
+# "userData": {"clientName": ..., "creationDate": ...}}. Таблица держится
+# в памяти с индексами по ключу и имени; файл из контейнера скачивается
+# заново, только если он изменился снаружи (по mtime и размеру).
+
+
+class ClientsTable:
+    def __init__(self, entries: list[dict]):
+        self.entries = entries
+        self.by_id: dict[str, dict] = {}
+        self.by_name: dict[str, dict] = {}
+        for entry in entries:
+            self._index(entry)
+
+    def _index(self, entry: dict):
+        if entry.get("clientId"):
+            self.by_id[entry["clientId"]] = entry
+        name = entry.get("userData", {}).get("clientName")
+        if name:
+            self.by_name[name] = entry
+
+    def name_of(self, public_key: str) -> str | None:
+        entry = self.by_id.get(public_key)
+        return entry["userData"].get("clientName") if entry else None
+
+    def key_of(self, client_name: str) -> str | None:
+        entry = self.by_name.get(client_name)
+        return entry.get("clientId") if entry else None
+
+    def add(self, public_key: str, client_name: str, creation_date: str):
+        entry = {
+            "clientId": public_key,
+            "userData": {
+                "clientName": client_name,
+                "creationDate": creation_date,
+            },
+        }
+        self.entries.append(entry)
+        self._index(entry)
+
+    def remove(self, names: set[str], ids: set[str]) -> int:
+        size = len(self.entries)
+        self.entries = [
+            e
+            for e in self.entries
+            if e.get("userData", {}).get("clientName") not in names
+            and e.get("clientId") not in ids
+        ]
+        if len(self.entries) != size:
+            self.by_id.clear()
+            self.by_name.clear()
+            for entry in self.entries:
+                self._index(entry)
+        return size - len(self.entries)
+
+    def copy(self) -> "ClientsTable":
+        return ClientsTable([dict(e) for e in self.entries])
+
+    def dumps(self) -> str:
+        return json.dumps(self.entries, ensure_ascii=False, separators=(",", ":"))
+
+
+class ClientsTableStore:
+    """
+    Закешированная clientsTable одного контейнера.
+
+    get() сверяет mtime и размер файла (stat в контейнере) и скачивает его,
+    только если он изменился; при записи mtime файла задаётся заранее,
+    поэтому собственные записи не считаются внешним изменением.
+    """
+
+    def __init__(self, container: str, path: str):
+        self.container = container
+        self.path = path
+        self._table: ClientsTable | None = None
+        self._stamp: str | None = None
+        self._checked_at = 0.0
+        # меняется при каждой смене содержимого кеша
+        self.version = 0
+
+    async def _read_stamp(self) -> str | None:
+        try:
+            out = await docker_exec(
+                self.container, f"stat -c '%Y %s' {self.path}", log_output=False
+            )
+        except subprocess.CalledProcessError:
+            return None
+        return out.strip()
+
+    async def get(self, max_age: float = 0) -> ClientsTable:
+        """
+        Текущая таблица. max_age — сколько секунд после прошлой проверки
+        можно не сверяться с контейнером (для чтения имён).
+        """
+        now = time.monotonic()
+        if self._table is not None and now - self._checked_at < max_age:
+            return self._table
+
+        stamp = await self._read_stamp()
+        if self._table is None or stamp != self._stamp:
+            self._table = await self._download() if stamp else ClientsTable([])
+            self._stamp = stamp
+            self.version += 1
+        self._checked_at = now
+        return self._table
+
+    def cached(self) -> ClientsTable:
+        """Таблица из кеша без обращения к контейнеру (пустая, если её нет)."""
+        return self._table if self._table is not None else ClientsTable([])
+
+    async def _download(self) -> ClientsTable:
+        fd, temp_path = tempfile.mkstemp(prefix="awg-clients-")
+        os.close(fd)
+        try:
+            await docker_copy_from(self.container, self.path, temp_path)
+            with open(temp_path, "r") as f:
+                content = f.read()
+        finally:
+            os.unlink(temp_path)
+        return ClientsTable(json.loads(content) if content.strip() else [])
+
+    async def write(self, table: ClientsTable):
+        """Записывает таблицу в контейнер одним копированием."""
+        data = table.dumps().encode()
+        # целое время: stat в контейнере отдаёт mtime с точностью до секунды
+        mtime = int(time.time())
+
+        fd, temp_path = tempfile.mkstemp(prefix="awg-clients-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(temp_path, 0o644)
+            os.utime(temp_path, (mtime, mtime))
+            await docker_copy_to(self.container, temp_path, self.path)
+        except Exception:
+            self.invalidate()
+            raise
+        finally:
+            os.unlink(temp_path)
+
+        self._table = table
+        self._stamp = f"{mtime} {len(data)}"
+        self.version += 1
+        self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        self._table = None
+        self._stamp = None
+        self.version += 1
+
+
+_stores: dict[tuple[str, str], ClientsTableStore] = {}
+
+
+def get_store(
+    container: str | None = None, path: str | None = None
+) -> ClientsTableStore:
+    """
+    Кеш clientsTable бэкенда (container — имя бэкенда; без него — первый
+    бэкенд). Путь по умолчанию — из настроек бэкенда.
+    """
+    if container is None:
+        container = get_backend().name
+    if path is None:
+        backend = find_backend(container)
+        path = backend.clients_table_path if backend else settings.CLIENTS_TABLE_PATH
+
+    key = (container, path)
+    store = _stores.get(key)
+    if store is None:
+        store = ClientsTableStore(*key)
+        _stores[key] = store
+    return store
+
+
+def creation_date() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,118 @@
+import io
+import os
+import subprocess
+import tarfile
+import time
+import uuid
+
+import docker
+from docker.errors import DockerException
+
+
+class DockerApiBackend:
+    """
+    Работа с контейнером через Docker Engine API (docker SDK) по одному
+    постоянному пулу соединений к unix-сокету, без запуска docker CLI.
+
+    Ошибки приводятся к subprocess.CalledProcessError, чтобы вызывающий код
+    обрабатывал их так же, как при CLI-бэкенде.
+    """
+
+    def __init__(self, base_url: str, timeout: int = 60, pool_size: int = 10):
+        self.api = docker.APIClient(
+            base_url=base_url, timeout=timeout, max_pool_size=pool_size
+        )
+
+    def ping(self):
+        self.api.ping()
+
+    def exec(
+        self, container: str, command: str | list[str], input: str | None = None
+    ) -> str:
+        """
+        exec_create + exec_start. stdin передаётся через временный файл,
+        загруженный put_archive, — так не нужен hijacked-сокет attach.
+        """
+        cmd = command
+        stdin_path = None
+
+        try:
+            if input is not None:
+                stdin_path = f"/tmp/.awg-api-stdin-{uuid.uuid4().hex}"
+                self._put_file(container, stdin_path, input.encode(), 0o600)
+                inner = command if isinstance(command, str) else " ".join(command)
+                cmd = [
+                    "sh",
+                    "-c",
+                    f"{inner} < {stdin_path}; rc=$?; rm -f {stdin_path}; exit $rc",
+                ]
+
+            exec_id = self.api.exec_create(container, cmd, stdout=True, stderr=True)
+            stdout, stderr = self.api.exec_start(exec_id, demux=True)
+            exit_code = self.api.exec_inspect(exec_id)["ExitCode"]
+        except DockerException as e:
+            raise subprocess.CalledProcessError(1, command, stderr=str(e)) from e
+
+        out = (stdout or b"").decode()
+        if exit_code != 0:
+            raise subprocess.CalledProcessError(
+                exit_code, command, output=out, stderr=(stderr or b"").decode()
+            )
+        return out
+
+    def copy_from(self, container: str, src: str, dst: str):
+        try:
+            stream, _ = self.api.get_archive(container, src)
+            data = b"".join(stream)
+        except DockerException as e:
+            raise subprocess.CalledProcessError(1, f"get_archive {src}", stderr=str(e))
+
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            member = tar.next()
+            extracted = tar.extractfile(member) if member else None
+            if extracted is None:
+                raise subprocess.CalledProcessError(
+                    1, f"get_archive {src}", stderr="not a regular file"
+                )
+            content = extracted.read()
+
+        with open(dst, "wb") as f:
+            f.write(content)
+
+    def copy_to(self, container: str, src: str, dst: str):
+        with open(src, "rb") as f:
+            content = f.read()
+        st = os.stat(src)
+        # mtime сохраняется, как и у docker cp
+        self._put_file(container, dst, content, st.st_mode & 0o777, int(st.st_mtime))
+
+    def restart(self, container: str):
+        try:
+            self.api.restart(container)
+        except DockerException as e:
+            raise subprocess.CalledProcessError(
+                1, f"restart {container}", stderr=str(e)
+            )
+
+    def _put_file(
+        self,
+        container: str,
+        path: str,
+        content: bytes,
+        mode: int,
+        mtime: int | None = None,
+    ):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            info = tarfile.TarInfo(os.path.basename(path))
+            info.size = len(content)
+            info.mode = mode
+            info.mtime = mtime if mtime is not None else int(time.time())
+            tar.addfile(info, io.BytesIO(content))
+
+        try:
+            ok = self.api.put_archive(container, os.path.dirname(path), buf.getvalue())
+        except DockerException as e:
+            raise subprocess.CalledProcessError(1, f"put_archive {path}", stderr=str(e))
+        if not ok:
+            raise subprocess.CalledProcessError(1, f"put_archive {path}")
@@ -1,6 +1,12 @@
+import asyncio
+import shlex
 import subprocess
 import sys
+import time
+from typing import AsyncIterator
 from core.config import settings
+from services.metrics import DOCKER_SECONDS, timed_docker
+from services.proc_utils import iter_exec_lines, run_exec
 
 
 def _log(msg: str):
@@ -8,19 +14,22 @@ def _log(msg: str):
     print(f"[docker-utils] {msg}", file=sys.stderr)
 
 
-def _run(cmd: str, *, capture_output=False) -> str:
+async def _run(
+    cmd: str, *, capture_output=False, input: str | None = None, log_output=True
+) -> str:
     """
-    Универсальный запуск shell-команд с логированием.
+    Универсальный асинхронный запуск команд с логированием и таймаутом
+    DOCKER_TIMEOUT. input — данные для stdin команды (в лог не пишутся).
     """
     _log(f"CMD: {cmd}")
 
     try:
+        result = await run_exec(cmd, input=input, timeout=settings.DOCKER_TIMEOUT)
         if capture_output:
-            result = subprocess.check_output(cmd, shell=True, text=True)
-            _log(f"OUTPUT: {result.strip()}")
+            if log_output:
+                _log(f"OUTPUT: {result.strip()}")
             return result.strip()
 
-        subprocess.run(cmd, shell=True, check=True)
         _log("STATUS: OK")
         return ""
 
@@ -28,59 +37,324 @@ def _run(cmd: str, *, capture_output=False) -> str:
         _log(f"ERROR: exit code {e.returncode}")
         _log(f"STDERR: {e.stderr if hasattr(e, 'stderr') else 'no stderr'}")
         raise
+    except subprocess.TimeoutExpired:
+        _log(f"ERROR: timeout after {settings.DOCKER_TIMEOUT}s")
+        raise
+
+
+# -----------------------------
+# Контейнеры на других docker-хостах
+# -----------------------------
+# Функции модуля принимают имя контейнера. Бэкенд из AWG_BACKENDS
+# регистрирует своё имя как ссылку на (контейнер, docker-хост), и все
+# вызовы с этим именем уходят в нужный контейнер на нужном хосте.
+_targets: dict[str, tuple[str, str]] = {}
+
+
+def register_container(ref: str, container: str, docker_host: str = ""):
+    _targets[ref] = (container, docker_host)
+
+
+def _resolve(ref: str) -> tuple[str, str]:
+    """(имя контейнера, docker-хост; пусто — локальный)."""
+    return _targets.get(ref, (ref, ""))
+
+
+def _docker_bin(docker_host: str) -> str:
+    if docker_host:
+        return f"{settings.DOCKER_BIN} -H {shlex.quote(docker_host)}"
+    return settings.DOCKER_BIN
+
+
+# -----------------------------
+# Бэкенд Docker Engine API
+# -----------------------------
+# Клиент на каждый docker-хост
+_api_backends: dict[str, object] = {}
+# Недоступный API: base_url → (число неудач подряд, когда пробовать снова).
+# До повтора операции идут через CLI; пауза растёт вдвое до API_RETRY_MAX.
+_api_unavailable: dict[str, tuple[int, float]] = {}
+API_RETRY_MIN = 5
+API_RETRY_MAX = 300
+
+
+async def _get_api(ref: str):
+    """
+    Возвращает клиент Docker Engine API (пул соединений к dockerd хоста
+    контейнера ref) и имя контейнера, если DOCKER_BACKEND=api. При
+    недоступности API — (None, имя), и операции идут через docker CLI,
+    пока не подойдёт время следующей попытки подключения.
+    """
+    container, docker_host = _resolve(ref)
+    base_url = docker_host or settings.DOCKER_HOST_URL
+
+    if settings.DOCKER_BACKEND != "api":
+        return None, container
+
+    failures, retry_at = _api_unavailable.get(base_url, (0, 0.0))
+    if time.monotonic() < retry_at:
+        return None, container
+
+    api = _api_backends.get(base_url)
+    if api is None:
+        try:
+            from services.docker_api import DockerApiBackend
+
+            backend = DockerApiBackend(base_url, timeout=int(settings.DOCKER_TIMEOUT))
+            await _in_thread(backend.ping)
+            _api_backends[base_url] = api = backend
+            _api_unavailable.pop(base_url, None)
+            _log(f"Using Docker Engine API at {base_url}")
+        except Exception as e:
+            failures += 1
+            delay = min(API_RETRY_MIN * 2 ** (failures - 1), API_RETRY_MAX)
+            _api_unavailable[base_url] = (failures, time.monotonic() + delay)
+            _log(
+                f"⚠️ Docker Engine API unavailable ({e}) — falling back to CLI, "
+                f"retry in {delay}s."
+            )
+            return None, container
+
+    return api, container
+
+
+async def _in_thread(fn, *args, **kwargs):
+    """
+    Вызов блокирующего метода docker SDK в пуле потоков с таймаутом,
+    чтобы не блокировать event loop.
+    """
+    try:
+        return await asyncio.wait_for(
+            asyncio.to_thread(fn, *args, **kwargs), settings.DOCKER_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        _log(f"ERROR: timeout after {settings.DOCKER_TIMEOUT}s")
+        raise subprocess.TimeoutExpired(getattr(fn, "__name__", "docker"), 0)
 
 
 def get_docker_base_cmd(container: str) -> str:
     """
     Формирует базовую часть команды: /usr/bin/docker exec -i имя_контейнера
     """
-    return f"{settings.DOCKER_BIN} exec -i {container}"
+    name, docker_host = _resolve(container)
+    return f"{_docker_bin(docker_host)} exec -i {name}"
 
 
-def docker_exec(container: str, command: str) -> str:
+@timed_docker("exec")
+async def docker_exec(
+    container: str, command: str, input: str | None = None, log_output=True
+) -> str:
     """
     Выполняет команду внутри Docker-контейнера и возвращает вывод.
+    input передаётся в stdin команды (docker exec -i).
+    log_output=False — не писать вывод в лог (большие дампы).
     """
+    api, name = await _get_api(container)
+    if api is not None:
+        _log(f"API EXEC: {container}: {command}")
+        try:
+            result = (await _in_thread(api.exec, name, command, input=input)).strip()
+        except subprocess.CalledProcessError as e:
+            _log(f"ERROR: exit code {e.returncode}")
+            _log(f"STDERR: {e.stderr}")
+            raise
+        if log_output:
+            _log(f"OUTPUT: {result}")
+        return result
+
     full_cmd = f"{get_docker_base_cmd(container)} {command}"
-    return _run(full_cmd, capture_output=True)
+    return await _run(full_cmd, capture_output=True, input=input, log_output=log_output)
 
 
-def docker_copy_from(container: str, src: str, dst: str):
+async def docker_exec_lines(container: str, command: str) -> AsyncIterator[str]:
+    """
+    Вывод команды в контейнере построчно, по мере поступления (для больших
+    дампов). Через Engine API вывод получается целиком и отдаётся по строкам.
+    """
+    api, name = await _get_api(container)
+    if api is not None:
+        output = await _in_thread(api.exec, name, command)
+        for line in output.splitlines():
+            yield line
+        return
+
+    full_cmd = f"{get_docker_base_cmd(container)} {command}"
+    start = time.perf_counter()
+    result = "error"
+    try:
+        async for line in iter_exec_lines(full_cmd, timeout=settings.DOCKER_TIMEOUT):
+            yield line
+        result = "ok"
+    except subprocess.CalledProcessError as e:
+        _log(f"CMD: {full_cmd}")
+        _log(f"ERROR: exit code {e.returncode}")
+        _log(f"STDERR: {e.stderr}")
+        raise
+    except subprocess.TimeoutExpired:
+        _log(f"ERROR: timeout after {settings.DOCKER_TIMEOUT}s: {full_cmd}")
+        raise
+    finally:
+        DOCKER_SECONDS.labels("exec_lines", result).observe(time.perf_counter() - start)
+
+
+@timed_docker("copy_from")
+async def docker_copy_from(container: str, src: str, dst: str):
     """
     Копирует файл ИЗ контейнера на хост.
     """
-    cmd = f"{get_docker_base_cmd(container)} cat {src}"
     _log(f"Copy FROM container: {container}:{src} -> {dst}")
 
+    api, name = await _get_api(container)
+    if api is not None:
+        try:
+            await _in_thread(api.copy_from, name, src, dst)
+            _log("STATUS: OK")
+        except subprocess.CalledProcessError as e:
+            _log(f"ERROR copying from container: {e.stderr}")
+            raise
+        return
+
+    cmd = f"{get_docker_base_cmd(container)} cat {src}"
+
     with open(dst, "w") as f:
         try:
-            subprocess.run(cmd, shell=True, check=True, text=True, stdout=f)
+            await run_exec(cmd, stdout=f, timeout=settings.DOCKER_TIMEOUT)
             _log("STATUS: OK")
         except subprocess.CalledProcessError as e:
             _log(f"ERROR copying from container: exit {e.returncode}")
             raise
 
 
-def docker_copy_to(container: str, src: str, dst: str):
+@timed_docker("copy_to")
+async def docker_copy_to(container: str, src: str, dst: str):
     """
     Копирует файл С хоста в контейнер.
     """
-    cmd = f"{settings.DOCKER_BIN} cp {src} {container}:{dst}"
     _log(f"Copy TO container: {src} -> {container}:{dst}")
-    _run(cmd)
 
+    api, name = await _get_api(container)
+    if api is not None:
+        try:
+            await _in_thread(api.copy_to, name, src, dst)
+            _log("STATUS: OK")
+        except subprocess.CalledProcessError as e:
+            _log(f"ERROR copying to container: {e.stderr}")
+            raise
+        return
 
-def restart_awg(container: str, wg_config_file: str):
+    name, docker_host = _resolve(container)
+    cmd = f"{_docker_bin(docker_host)} cp {src} {name}:{dst}"
+    await _run(cmd)
+
+
+@timed_docker("restart")
+async def docker_restart(container: str):
+    """
+    Перезапускает контейнер целиком.
+    """
+    _log(f"Restarting container: {container}")
+
+    api, name = await _get_api(container)
+    if api is not None:
+        await _in_thread(api.restart, name)
+        _log("STATUS: OK")
+        return
+
+    name, docker_host = _resolve(container)
+    await _run(f"{_docker_bin(docker_host)} restart {name}")
+
+
+@timed_docker("restart_awg")
+async def restart_awg(container: str, wg_config_file: str):
     """
     Перезапускает интерфейс AWG/WireGuard внутри контейнера.
     """
     _log(f"Restarting AWG: {wg_config_file}")
 
     try:
-        docker_exec(
+        await docker_exec(
             container,
             f"sh -c 'wg-quick down {wg_config_file} || true && wg-quick up {wg_config_file}'",
         )
         _log("AWG restarted successfully")
     except Exception:
         _log("⚠️ Failed to restart wg-quick — interface may not have been running.")
+
+
+@timed_docker("apply_peers")
+async def apply_peers(
+    container: str,
+    interface: str,
+    peers: list[tuple[str, str, str]],
+    remove: list[str] | None = None,
+):
+    """
+    Применяет изменения пиров к работающему интерфейсу одним вызовом `wg set`,
+    не трогая остальные туннели (без wg-quick down/up).
+
+    peers  — список (public_key, preshared_key, allowed_ips) для добавления/обновления
+    remove — список публичных ключей пиров для удаления
+
+    Скрипт передаётся через stdin, поэтому PSK не попадают в аргументы процессов.
+    """
+    script = [
+        "set -e",
+        "umask 077",
+        "d=$(mktemp -d)",
+        "trap 'rm -rf \"$d\"' EXIT",
+    ]
+    args = [f"wg set {shlex.quote(interface)}"]
+
+    for i, (pub, psk, allowed_ips) in enumerate(peers):
+        allowed_ips = ",".join(a.strip() for a in allowed_ips.split(","))
+        script.append(f"printf '%s\\n' {shlex.quote(psk)} > \"$d/{i}\"")
+        args.append(
+            f'peer {shlex.quote(pub)} preshared-key "$d/{i}" '
+            f"allowed-ips {shlex.quote(allowed_ips)}"
+        )
+
+    for pub in remove or []:
+        args.append(f"peer {shlex.quote(pub)} remove")
+
+    script.append(" ".join(args))
+
+    _log(f"Applying peers on {interface}: +{len(peers)} -{len(remove or [])}")
+    await docker_exec(container, "sh -s", input="\n".join(script) + "\n")
+
+
+async def wait_interface(container: str, interface: str, timeout: float) -> bool:
+    """
+    Ждёт, пока интерфейс поднимется (`wg show` отвечает), опрашивая
+    с нарастающей паузой. False — если за timeout не поднялся.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while True:
+        try:
+            await docker_exec(
+                container, f"wg show {shlex.quote(interface)}", log_output=False
+            )
+            return True
+        except Exception:
+            if time.monotonic() + delay > deadline:
+                return False
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 1.0)
+
+
+async def apply_peers_or_restart(
+    container: str,
+    interface: str,
+    wg_config_file: str,
+    peers: list[tuple[str, str, str]],
+    remove: list[str] | None = None,
+):
+    """
+    Горячее применение пиров; полный перезапуск интерфейса — только если
+    живое применение не удалось (например, интерфейс не поднят).
+    """
+    try:
+        await apply_peers(container, interface, peers, remove)
+    except Exception:
+        _log("⚠️ Live apply failed — falling back to wg-quick restart.")
+        await restart_awg(container, wg_config_file)
@@ -1,48 +1,389 @@
+import asyncio
+import ipaddress
+import shutil
 import subprocess
+import time
 
+from core.config import settings
+from services import blocklist
+from services.backends import get_backends
+from services.proc_utils import run_exec
 
-def run_cmd(cmd: str):
-    """Выполняет команду в shell и выбрасывает исключение при ошибке."""
-    subprocess.run(cmd, shell=True, check=True)
+# Таймаут одной команды iptables, секунды
+FIREWALL_TIMEOUT = 15
 
+CHAINS = ("INPUT", "FORWARD")
 
-def block_ip(ip: str):
+
+async def run_cmd(cmd: str, input: str | None = None) -> str:
+    """Выполняет команду и выбрасывает исключение при ошибке."""
+    return await run_exec(cmd, input=input, timeout=FIREWALL_TIMEOUT)
+
+
+def _ips(ips: list[str]) -> set[str]:
+    return {ip.split("/")[0].strip() for ip in ips}
+
+
+def _by_family(ips: set[str]) -> dict[int, set[str]]:
     """
-    Блокирует IP на уровне Linux firewall.
-    Блокировка действует ДО Docker, трафик не попадёт в контейнер.
+    IP по семействам: {4: {...}, 6: {...}}. IPv4 и IPv6 блокируются
+    разными наборами и таблицами (iptables / ip6tables).
+    """
+    groups: dict[int, set[str]] = {}
+    for ip in ips:
+        groups.setdefault(ipaddress.ip_address(ip).version, set()).add(ip)
+    return groups
+
+
+def _families(ips: set[str]) -> list[int]:
+    """Семейства для сверки: IPv4 всегда, IPv6 — если такие IP есть."""
+    return sorted({4} | _by_family(ips).keys())
+
+
+# -----------------------------
+# Бэкенд iptables
+# -----------------------------
+# По правилу DROP на каждый IP в цепочках INPUT и FORWARD (IPv6 — в
+# ip6tables). Какие IP уже заблокированы, известно из blocklist, поэтому
+# iptables -C не нужен: изменения идут одним iptables-restore --noflush.
+IPTABLES = {4: "iptables", 6: "ip6tables"}
+
+
+def _host_ip(source: str) -> str | None:
+    """
+    Адрес из -s правила, если правило — на один хост (/32 или /128).
+    Правила на сети (например, -s 203.0.113.0/24, поставленные вручную) —
+    не блокировки клиентов: None.
     """
-    # Проверяем, есть ли уже правило
-    check_cmd = f"iptables -C INPUT -s {ip} -j DROP"
+    addr, _, mask = source.partition("/")
     try:
-        run_cmd(check_cmd)
-        print(f"⚠️ IP {ip} уже заблокирован.")
+        ip = ipaddress.ip_address(addr)
+    except ValueError:
+        return None
+    if mask and mask != str(ip.max_prefixlen):
+        return None
+    return str(ip)
+
+
+def _parse_drop_rules(rules: str) -> list[tuple[str, str, str]]:
+    """
+    Правила блокировки хостов из вывода iptables-save:
+    (цепочка, IP, исходная строка) для строк вида -A INPUT -s 10.8.1.2/32 -j DROP
+    """
+    found = []
+    for line in rules.splitlines():
+        parts = line.split()
+        if (
+            len(parts) == 6
+            and parts[0] == "-A"
+            and parts[1] in CHAINS
+            and parts[2] == "-s"
+            and parts[4:] == ["-j", "DROP"]
+        ):
+            ip = _host_ip(parts[3])
+            if ip is not None:
+                found.append((parts[1], ip, line))
+    return found
+
+
+def _is_client_ip(ip: str) -> bool:
+    """IP из подсетей клиентов какого-либо бэкенда."""
+    addr = ipaddress.ip_address(ip)
+    for backend in get_backends():
+        for subnet in (backend.subnet, backend.subnet_v6):
+            if subnet and addr in ipaddress.ip_network(subnet, strict=False):
+                return True
+    return False
+
+
+def _client_drop_rules(rules: str) -> list[tuple[str, str, str]]:
+    """
+    Правила, которые считаются блокировками клиентов: на хост из подсетей
+    клиентов или на IP из списка блокировок. Остальные правила DROP
+    (поставленные администратором) не трогаются.
+    """
+    return [
+        rule
+        for rule in _parse_drop_rules(rules)
+        if blocklist.is_blocked(rule[1]) or _is_client_ip(rule[1])
+    ]
+
+
+async def _iptables_save(family: int = 4) -> str:
+    return await run_cmd(f"{IPTABLES[family]}-save -t filter")
+
+
+async def _iptables_restore(lines: list[str], family: int = 4):
+    script = "*filter\n" + "\n".join(lines) + "\nCOMMIT\n"
+    await run_cmd(f"{IPTABLES[family]}-restore --noflush", input=script)
+
+
+async def _iptables_block(ips: set[str]):
+    for family, group in sorted(_by_family(ips).items()):
+        await _iptables_restore(
+            [f"-A {chain} -s {ip} -j DROP" for ip in sorted(group) for chain in CHAINS],
+            family,
+        )
+
+
+async def _iptables_unblock(ips: set[str]):
+    for family, group in sorted(_by_family(ips).items()):
+        try:
+            await _iptables_restore(
+                [
+                    f"-D {chain} -s {ip} -j DROP"
+                    for ip in sorted(group)
+                    for chain in CHAINS
+                ],
+                family,
+            )
+        except subprocess.CalledProcessError:
+            # каких-то правил нет (их удалили вручную) — удаляем только
+            # существующие по выводу iptables-save
+            rules = await _iptables_save(family)
+            delete = [
+                "-D" + line.strip()[2:]
+                for _, ip, line in _parse_drop_rules(rules)
+                if ip in group
+            ]
+            if delete:
+                await _iptables_restore(delete, family)
+
+
+# -----------------------------
+# Бэкенд ipset
+# -----------------------------
+# Заблокированные IP хранятся в наборе hash:ip (IPv6 — в отдельном наборе
+# family inet6 с суффиксом 6), а в цепочках INPUT и FORWARD стоит по одному
+# правилу --match-set. Проверка членства в ядре — O(1), не зависит от числа
+# блокировок; изменения пакетом через ipset restore. Набор IPv6 и правила
+# ip6tables создаются при первой блокировке IPv6-адреса.
+
+_backend: str | None = None
+_backend_lock = asyncio.Lock()
+# семейства, для которых набор и правила уже созданы
+_ipset_ready: set[int] = set()
+
+
+def _set_name(family: int = 4) -> str:
+    return settings.FIREWALL_IPSET + ("6" if family == 6 else "")
+
+
+def _set_match(family: int = 4) -> str:
+    return f"-m set --match-set {_set_name(family)} src -j DROP"
+
+
+async def _ensure_ipset(family: int = 4):
+    """
+    Создаёт набор и правила в цепочках (если их нет) и переносит в набор
+    блокировки, оставшиеся от режима iptables.
+    """
+    if family in _ipset_ready:
         return
-    except subprocess.CalledProcessError:
-        pass  # правила нет — продолжаем
 
-    print(f"⛔ Блокирую IP {ip}...")
+    name = _set_name(family)
+    inet = "inet6" if family == 6 else "inet"
+    await run_cmd(f"ipset create {name} hash:ip family {inet} -exist")
+
+    rules = await _iptables_save(family)
+    lines = {line.strip() for line in rules.splitlines()}
+    legacy = _client_drop_rules(rules)
+
+    # правило набора — первым в цепочке
+    script = [
+        f"-I {chain} 1 {_set_match(family)}"
+        for chain in CHAINS
+        if f"-A {chain} {_set_match(family)}" not in lines
+    ]
+    script += ["-D" + line.strip()[2:] for _, _, line in legacy]
+
+    if legacy:
+        ips = {ip for _, ip, _ in legacy}
+        print(f"🔁 Переношу {len(ips)} IP из правил iptables в ipset {name}...")
+        await _ipset_restore([f"add {name} {ip}" for ip in sorted(ips)])
+
+    if script:
+        await _iptables_restore(script, family)
 
-    run_cmd(f"iptables -A INPUT -s {ip} -j DROP")
-    run_cmd(f"iptables -A FORWARD -s {ip} -j DROP")
+    _ipset_ready.add(family)
 
-    print(f"⛔ IP {ip} успешно заблокирован.")
 
+async def _ipset_restore(commands: list[str]):
+    await run_cmd("ipset restore -exist", input="\n".join(commands) + "\n")
 
-def unblock_ip(ip: str):
+
+async def _ipset_apply(op: str, ips: set[str]):
+    """op — add или del; IP разных семейств — в свои наборы, одним restore."""
+    groups = _by_family(ips)
+    for family in sorted(groups):
+        await _ensure_ipset(family)
+
+    await _ipset_restore(
+        [
+            f"{op} {_set_name(family)} {ip}"
+            for family, group in sorted(groups.items())
+            for ip in sorted(group)
+        ]
+    )
+
+
+async def _ipset_block(ips: set[str]):
+    await _ipset_apply("add", ips)
+
+
+async def _ipset_unblock(ips: set[str]):
+    await _ipset_apply("del", ips)
+
+
+async def _ipset_blocked(family: int = 4) -> set[str]:
+    await _ensure_ipset(family)
+    out = await run_cmd(f"ipset list {_set_name(family)}")
+    members = out.split("Members:", 1)[1] if "Members:" in out else ""
+    return {line.split()[0] for line in members.splitlines() if line.strip()}
+
+
+async def get_backend() -> str:
+    """
+    Бэкенд блокировок по FIREWALL_BACKEND: ipset, iptables или auto
+    (ipset, если он установлен). Если ipset настроить не удалось —
+    откат на iptables.
+    """
+    global _backend
+
+    async with _backend_lock:
+        if _backend is not None:
+            return _backend
+
+        wanted = settings.FIREWALL_BACKEND
+        if wanted == "auto":
+            wanted = "ipset" if shutil.which("ipset") else "iptables"
+
+        if wanted == "ipset":
+            try:
+                await _ensure_ipset()
+            except (
+                subprocess.CalledProcessError,
+                subprocess.TimeoutExpired,
+                OSError,
+            ) as e:
+                print(f"⚠️ ipset недоступен ({e}) — блокировки через iptables.")
+                wanted = "iptables"
+
+        _backend = wanted
+        return _backend
+
+
+async def _apply_block(ips: set[str]):
+    if await get_backend() == "ipset":
+        await _ipset_block(ips)
+    else:
+        await _iptables_block(ips)
+
+
+async def _apply_unblock(ips: set[str]):
+    if await get_backend() == "ipset":
+        await _ipset_unblock(ips)
+    else:
+        await _iptables_unblock(ips)
+
+
+# -----------------------------
+# Публичные функции
+# -----------------------------
+async def block_ip(ip: str):
+    """
+    Блокирует IP на уровне Linux firewall.
+    Блокировка действует ДО Docker, трафик не попадёт в контейнер.
+    """
+    await block_ips([ip])
+
+
+async def unblock_ip(ip: str):
     """
     Разблокирует IP на уровне Linux firewall.
     """
-    print(f"🔓 Разблокирую IP {ip}...")
+    await unblock_ips([ip])
 
-    # Удаляем правила, если они есть
-    try:
-        run_cmd(f"iptables -D INPUT -s {ip} -j DROP")
-    except subprocess.CalledProcessError:
-        pass
 
-    try:
-        run_cmd(f"iptables -D FORWARD -s {ip} -j DROP")
-    except subprocess.CalledProcessError:
-        pass
+async def block_ips(ips: list[str]):
+    """
+    Пакетная блокировка одной операцией firewall. Уже заблокированные IP
+    отсеиваются по списку в памяти, без обращения к iptables.
+    """
+    wanted = _ips(ips)
+    new = {ip for ip in wanted if not blocklist.is_blocked(ip)}
+
+    if not new:
+        print(f"⚠️ {len(wanted)} IP уже заблокированы.")
+        return
+
+    print(f"⛔ Блокирую {len(new)} IP...")
+    await _apply_block(new)
+    await blocklist.add(new)
+    print(f"⛔ {len(new)} IP успешно заблокированы.")
+
+
+async def unblock_ips(ips: list[str]):
+    """
+    Пакетная разблокировка одной операцией firewall.
+    """
+    wanted = _ips(ips)
+    found = {ip for ip in wanted if blocklist.is_blocked(ip)}
+
+    if not found:
+        print(f"🔓 Блокировок для {len(wanted)} IP не найдено.")
+        return
+
+    print(f"🔓 Разблокирую {len(found)} IP...")
+    await _apply_unblock(found)
+    await blocklist.remove(found)
+    print(f"🔓 {len(found)} IP успешно разблокированы.")
+
+
+async def reconcile_blocklist():
+    """
+    Сверка firewall со списком блокировок при старте: один дамп правил
+    (iptables-save или ipset list) и одна пакетная операция для IP, которых
+    в firewall не хватает, — на семейство адресов (IPv6 — если в списке
+    есть IPv6-адреса). Блокировки, найденные в firewall, но отсутствующие
+    в списке (поставленные до его появления или вручную), вносятся в список.
+    """
+    start = time.perf_counter()
+    blocklist.load()
+    wanted = blocklist.blocked_ips()
+
+    present: set[str] = set()
+    missing: set[str] = set()
+    by_family = _by_family(wanted)
+    for family in _families(wanted):
+        want = by_family.get(family, set())
+        if await get_backend() == "ipset":
+            found = await _ipset_blocked(family)
+            lost = want - found
+            if lost:
+                await _ipset_block(lost)
+        else:
+            rules = await _iptables_save(family)
+            pairs = {(chain, ip) for chain, ip, _ in _client_drop_rules(rules)}
+            found = {ip for _, ip in pairs}
+            add = [
+                f"-A {chain} -s {ip} -j DROP"
+                for ip in sorted(want)
+                for chain in CHAINS
+                if (chain, ip) not in pairs
+            ]
+            lost = {line.split()[3] for line in add}
+            if add:
+                await _iptables_restore(add, family)
+        present |= found
+        missing |= lost
+
+    adopted = present - wanted
+    if adopted:
+        await blocklist.add(adopted)
 
-    print(f"🔓 IP {ip} успешно разблокирован.")
+    print(
+        f"🧱 Блокировки сверены за {(time.perf_counter() - start) * 1000:.0f} мс: "
+        f"восстановлено {len(missing)}, добавлено в список {len(adopted)}, "
+        f"всего {len(wanted | adopted)}."
+    )
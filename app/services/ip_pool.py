@@ -0,0 +1,102 @@
+import ipaddress
+import re
+
+# Больше адресов в одном пуле не держим (битовая карта 2 МБ); для IPv6
+# подсетей используется только начало диапазона.
+MAX_POOL_SIZE = 2**24
+
+_HAS_FREE_BIT = re.compile(rb"[^\xff]")
+
+
+class IPPool:
+    """
+    Пул адресов подсети на битовой карте.
+
+    Адреса .0 (сеть) и .1 (сервер), а для IPv4 и broadcast, не выдаются.
+    Поиск свободного адреса идёт от подсказки _hint по байтам карты
+    (на уровне C через regex), поэтому не зависит от числа занятых адресов.
+    """
+
+    def __init__(self, cidr: str):
+        self.network = ipaddress.ip_network(cidr, strict=False)
+        self.host_prefix = self.network.max_prefixlen
+        self._base = int(self.network.network_address)
+
+        self.size = min(self.network.num_addresses, MAX_POOL_SIZE)
+        self._first = 2
+        self._last = self.size - 1
+        if self.network.version == 4 and self.size == self.network.num_addresses:
+            self._last -= 1  # broadcast
+
+        self._bitmap = bytearray((self.size + 7) // 8)
+        self._hint = self._first
+        self.used = 0
+
+    @property
+    def capacity(self) -> int:
+        return max(self._last - self._first + 1, 0)
+
+    @property
+    def free(self) -> int:
+        return self.capacity - self.used
+
+    def _offset(self, ip: str) -> int | None:
+        try:
+            addr = ipaddress.ip_address(ip.split("/")[0].strip())
+        except ValueError:
+            return None
+        if addr.version != self.network.version:
+            return None
+        offset = int(addr) - self._base
+        if offset < self._first or offset > self._last:
+            return None
+        return offset
+
+    def _is_set(self, offset: int) -> bool:
+        return bool(self._bitmap[offset >> 3] & (1 << (offset & 7)))
+
+    def mark(self, ip: str):
+        """Помечает адрес занятым (адреса вне пула игнорируются)."""
+        offset = self._offset(ip)
+        if offset is None or self._is_set(offset):
+            return
+        self._bitmap[offset >> 3] |= 1 << (offset & 7)
+        self.used += 1
+
+    def release(self, ip: str):
+        offset = self._offset(ip)
+        if offset is None or not self._is_set(offset):
+            return
+        self._bitmap[offset >> 3] &= ~(1 << (offset & 7)) & 0xFF
+        self.used -= 1
+        self._hint = min(self._hint, offset)
+
+    def __contains__(self, ip: str) -> bool:
+        offset = self._offset(ip)
+        return offset is not None and self._is_set(offset)
+
+    def allocate(self) -> str:
+        """
+        Занимает первый свободный адрес и возвращает его с маской хоста,
+        например 10.8.1.5/32.
+        """
+        offset = self._hint
+        while offset <= self._last and self._is_set(offset):
+            offset += 1
+            if offset & 7 == 0:
+                # пропускаем полностью занятые байты карты
+                match = _HAS_FREE_BIT.search(self._bitmap, offset >> 3)
+                if not match:
+                    offset = self._last + 1
+                    break
+                offset = match.start() << 3
+
+        if offset > self._last:
+            raise RuntimeError(f"Подсеть {self.network} заполнена.")
+
+        self._bitmap[offset >> 3] |= 1 << (offset & 7)
+        self.used += 1
+        self._hint = offset + 1
+
+        addr = ipaddress.ip_address(self._base + offset)
+        return f"{addr}/{self.host_prefix}"
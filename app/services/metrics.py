@@ -0,0 +1,111 @@
+import functools
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import REGISTRY
+
+# -----------------------------
+# Метрики Prometheus
+# -----------------------------
+# Все значения берутся из памяти процесса: отдача /metrics не обращается
+# ни к SQLite, ни к контейнеру.
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_SECONDS = Histogram(
+    "awg_http_request_seconds",
+    "Длительность обработки HTTP-запроса",
+    ["method", "route", "status"],
+    buckets=_BUCKETS,
+)
+
+DOCKER_SECONDS = Histogram(
+    "awg_docker_operation_seconds",
+    "Длительность операции с контейнером",
+    ["operation", "result"],
+    buckets=_BUCKETS,
+)
+
+MUTATION_BATCH_SECONDS = Histogram(
+    "awg_mutation_batch_seconds",
+    "Длительность применения пакета изменений (запись конфигов, wg set)",
+    buckets=_BUCKETS,
+)
+MUTATION_BATCH_ITEMS = Histogram(
+    "awg_mutation_batch_items",
+    "Число элементов в пакете изменений",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+COLLECTOR_SECONDS = Histogram(
+    "awg_collector_cycle_seconds",
+    "Длительность цикла сбора статистики",
+    buckets=_BUCKETS,
+)
+COLLECTOR_LAG = Gauge(
+    "awg_collector_lag_seconds", "Отставание старта цикла сбора от расписания"
+)
+COLLECTOR_INTERVAL = Gauge(
+    "awg_collector_interval_seconds", "Текущий адаптивный интервал сбора"
+)
+COLLECTOR_ERRORS = Counter("awg_collector_errors", "Ошибки циклов сбора")
+COLLECTOR_BACKEND_ERRORS = Counter(
+    "awg_collector_backend_errors", "Неудачные снятия дампа с бэкенда", ["backend"]
+)
+COLLECTOR_BACKEND_UP = Gauge(
+    "awg_collector_backend_up", "Последний дамп бэкенда снят успешно", ["backend"]
+)
+
+FREE_IPS = Gauge("awg_free_ips", "Свободные адреса в подсети клиентов", ["subnet"])
+BLOCKED_IPS = Gauge("awg_blocked_ips", "Заблокированные IP клиентов")
+
+
+def timed_docker(operation: str):
+    """Декоратор корутины: время выполнения в DOCKER_SECONDS."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = "error"
+            try:
+                value = await fn(*args, **kwargs)
+                result = "ok"
+                return value
+            finally:
+                DOCKER_SECONDS.labels(operation, result).observe(
+                    time.perf_counter() - start
+                )
+
+        return wrapper
+
+    return decorator
+
+
+class _LiveStatsCollector:
+    """Число пиров и счётчики трафика по пирам из снимка сборщика."""
+
+    def collect(self):
+        from services.stats import live
+
+        snap = live.snapshot()
+
+        peers = GaugeMetricFamily("awg_peers", "Пиры в последнем дампе")
+        peers.add_metric([], len(snap.peers))
+        yield peers
+
+        rx = CounterMetricFamily(
+            "awg_peer_rx_bytes", "Принято от пира, байт", labels=["public_key"]
+        )
+        tx = CounterMetricFamily(
+            "awg_peer_tx_bytes", "Отправлено пиру, байт", labels=["public_key"]
+        )
+        for p in snap.peers.values():
+            rx.add_metric([p.public_key], p.total_rx)
+            tx.add_metric([p.public_key], p.total_tx)
+        yield rx
+        yield tx
+
+
+REGISTRY.register(_LiveStatsCollector())
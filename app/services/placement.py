@@ -0,0 +1,181 @@
+import asyncio
+import ipaddress
+import time
+
+from core.config import AwgBackend, settings
+from services.backends import find_backend, get_backend, get_backends, is_sharded
+from services.clients_table import ClientsTable, get_store
+from services.stats import live
+
+# -----------------------------
+# Индекс клиент → бэкенд
+# -----------------------------
+# Имя клиента и публичный ключ → имя бэкенда. Собирается из clientsTable
+# всех бэкендов (по одному stat на бэкенд, если таблицы не менялись) при
+# первом промахе и дополняется при добавлении клиентов. Для проверки имён
+# новых клиентов и оценки нагрузки таблицы перечитываются не чаще раза в
+# CLIENTS_CACHE_TTL: свои изменения индекс и кеш таблиц видят сразу.
+_index: dict[str, str] = {}
+_index_ready = False
+_index_at = 0.0
+# имена клиентов, которые сейчас добавляются (ещё не в clientsTable)
+_reserved: set[str] = set()
+
+
+async def _tables(max_age: float = 0) -> list[tuple[AwgBackend, ClientsTable]]:
+    backends = get_backends()
+    tables = await asyncio.gather(*(get_store(b.name).get(max_age) for b in backends))
+    return list(zip(backends, tables))
+
+
+async def refresh_index(max_age: float = 0):
+    global _index_ready, _index_at
+
+    index = {}
+    for backend, table in await _tables(max_age):
+        for key in table.by_id:
+            index[key] = backend.name
+        for name in table.by_name:
+            index[name] = backend.name
+
+    _index.clear()
+    _index.update(index)
+    _index_ready = True
+    _index_at = time.monotonic()
+
+
+def remember(client: str, backend: str):
+    _index[client] = backend
+
+
+def forget(client: str):
+    _index.pop(client, None)
+
+
+def invalidate():
+    """Клиенты могли переехать (замена конфигов) — индекс собирается заново."""
+    global _index_ready
+    _index.clear()
+    _index_ready = False
+
+
+async def locate(clients: list[str]) -> list[AwgBackend]:
+    """
+    Бэкенды клиентов (по имени или публичному ключу). Неизвестные
+    клиенты относятся к первому бэкенду — он и ответит not_found.
+    """
+    if not is_sharded():
+        return [get_backend()] * len(clients)
+
+    if not _index_ready or any(c not in _index for c in clients):
+        await refresh_index()
+
+    default = get_backend()
+    return [find_backend(_index.get(c, "")) or default for c in clients]
+
+
+async def reserve(names: list[str]) -> list[bool]:
+    """
+    Занимает имена новых клиентов на время добавления: имя должно быть
+    уникальным во всём пуле, а server.conf бэкенда знает только своих
+    клиентов. False — имя уже есть на каком-то бэкенде, добавляется
+    параллельно или повторяется в names.
+    """
+    ttl = settings.CLIENTS_CACHE_TTL
+    if not _index_ready or time.monotonic() - _index_at >= ttl:
+        await refresh_index(ttl)
+
+    free = []
+    for name in names:
+        ok = name not in _index and name not in _reserved
+        if ok:
+            _reserved.add(name)
+        free.append(ok)
+    return free
+
+
+def release(names: list[str]):
+    _reserved.difference_update(names)
+
+
+def backend_of_ip(ip: str) -> AwgBackend:
+    """Бэкенд, в подсети которого адрес (иначе — первый)."""
+    try:
+        addr = ipaddress.ip_address(ip.split("/")[0].strip())
+    except ValueError:
+        return get_backend()
+
+    for backend in get_backends():
+        for subnet in (backend.subnet, backend.subnet_v6):
+            if subnet and addr in ipaddress.ip_network(subnet, strict=False):
+                return backend
+    return get_backend()
+
+
+# -----------------------------
+# Размещение новых клиентов
+# -----------------------------
+def _capacity(backend: AwgBackend) -> int:
+    # без адреса сети, broadcast и адреса сервера
+    net = ipaddress.ip_network(backend.subnet, strict=False)
+    return max(net.num_addresses - 3, 1)
+
+
+async def _loads() -> list[tuple[AwgBackend, int, int, float]]:
+    """(бэкенд, клиентов, ёмкость подсети, суммарная скорость rx+tx)."""
+    peers = live.snapshot().peers
+    loads = []
+    for backend, table in await _tables(settings.CLIENTS_CACHE_TTL):
+        rate = 0.0
+        for key in table.by_id:
+            p = peers.get(key)
+            if p is not None:
+                rate += p.rx_rate + p.tx_rate
+        loads.append((backend, len(table.entries), _capacity(backend), rate))
+    return loads
+
+
+async def backend_loads() -> list[dict]:
+    return [
+        {
+            "name": backend.name,
+            "container": backend.container,
+            "docker_host": backend.docker_host or None,
+            "endpoint": backend.endpoint,
+            "subnet": backend.subnet,
+            "clients": used,
+            "capacity": capacity,
+            "rate": rate,
+        }
+        for backend, used, capacity, rate in await _loads()
+    ]
+
+
+async def place(count: int) -> list[AwgBackend]:
+    """
+    Бэкенды для count новых клиентов по текущей нагрузке: доля занятых
+    адресов подсети плюс доля бэкенда в суммарном трафике (скорости из
+    живой статистики). Каждый клиент уходит на наименее загруженный бэкенд
+    с учётом уже размещённых в этом вызове; заполненные бэкенды
+    пропускаются, пока есть свободные.
+    """
+    if not is_sharded():
+        return [get_backend()] * count
+
+    loads = await _loads()
+    used = [u for _, u, _, _ in loads]
+    total_rate = sum(rate for _, _, _, rate in loads)
+
+    placed = []
+    for _ in range(count):
+        best, best_key = 0, None
+        for i, (_, _, capacity, rate) in enumerate(loads):
+            score = used[i] / capacity
+            if total_rate:
+                score += rate / total_rate
+            key = (used[i] >= capacity, score)
+            if best_key is None or key < best_key:
+                best, best_key = i, key
+        used[best] += 1
+        placed.append(loads[best][0])
+    return placed
@@ -0,0 +1,109 @@
+import asyncio
+import shlex
+import subprocess
+import time
+from typing import IO, AsyncIterator
+
+
+async def run_exec(
+    cmd: str | list[str],
+    *,
+    input: str | None = None,
+    timeout: float | None = None,
+    stdout: IO | None = None,
+) -> str:
+    """
+    Асинхронный запуск процесса без промежуточного /bin/sh
+    (строка команды разбирается через shlex).
+
+    - ненулевой код возврата → subprocess.CalledProcessError
+    - превышение timeout → subprocess.TimeoutExpired, процесс убивается
+    - отмена задачи (CancelledError) тоже убивает процесс
+
+    stdout — файл, куда писать вывод вместо возврата строки.
+    """
+    args = shlex.split(cmd) if isinstance(cmd, str) else cmd
+
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=stdout if stdout is not None else subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    try:
+        out, err = await asyncio.wait_for(
+            proc.communicate(input.encode() if input is not None else None),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        _kill(proc)
+        await proc.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout or 0)
+    except asyncio.CancelledError:
+        _kill(proc)
+        raise
+
+    output = out.decode() if out is not None else ""
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(
+            proc.returncode, cmd, output=output, stderr=err.decode()
+        )
+    return output
+
+
+async def iter_exec_lines(
+    cmd: str | list[str], *, timeout: float | None = None
+) -> AsyncIterator[str]:
+    """
+    Построчное чтение stdout процесса по мере поступления, без накопления
+    всего вывода. Ошибки — как у run_exec; timeout — на весь процесс.
+    """
+    args = shlex.split(cmd) if isinstance(cmd, str) else cmd
+    deadline = time.monotonic() + timeout if timeout else None
+
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        limit=1 << 20,
+    )
+    assert proc.stdout is not None and proc.stderr is not None
+    # stderr читается параллельно, чтобы процесс не встал на полном пайпе
+    stderr = asyncio.ensure_future(proc.stderr.read())
+
+    try:
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise asyncio.TimeoutError
+            line = await asyncio.wait_for(proc.stdout.readline(), remaining)
+            if not line:
+                break
+            yield line.decode()
+
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+        await asyncio.wait_for(proc.wait(), remaining)
+    except asyncio.TimeoutError:
+        _kill(proc)
+        await proc.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout or 0)
+    except BaseException:
+        # отмена или генератор закрыт раньше конца вывода
+        _kill(proc)
+        raise
+    finally:
+        if proc.returncode is None:
+            await proc.wait()
+        err = await stderr
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=err.decode())
+
+
+def _kill(proc: asyncio.subprocess.Process):
+    try:
+        proc.kill()
+    except ProcessLookupError:
+        pass
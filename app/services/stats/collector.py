@@ -1,21 +1,157 @@
-import subprocess
+import asyncio
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from services.docker_utils import get_docker_base_cmd
-from .parser import parse_wg_dump
-from .database import save_stats
+from services.backends import get_backends
+from services.metrics import (
+    COLLECTOR_ERRORS,
+    COLLECTOR_INTERVAL,
+    COLLECTOR_LAG,
+    COLLECTOR_SECONDS,
+)
+from . import live, snapshot, stream
+from .parser import PeerRecord
+from .database import compact_series, save_stats
+from .stats import series_retention
 
-from core.config import settings  # чтобы использовать settings.DOCKER_CONTAINER
+from core.config import settings
 
+# Разбор дампа и запись в SQLite идут в отдельном потоке, чтобы не
+# блокировать event loop; один поток — циклы пишут строго по очереди
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stats-collector")
 
-def collect_once():
-    raw = subprocess.check_output(
-        f"{get_docker_base_cmd(settings.DOCKER_CONTAINER)} wg show awg0 dump",
-        shell=True,
-        text=True,
+# Адаптивный интервал: сбор занимает не больше 1/DUTY_FACTOR времени,
+# и не чаще чем раз в peers / PEERS_PER_SECOND секунд
+DUTY_FACTOR = 5
+PEERS_PER_SECOND = 2000
+
+_last_compaction = 0
+
+_state = {
+    "running": False,
+    "cycles": 0,
+    "errors": 0,
+    "last_error": None,
+    "last_started": None,
+    "last_finished": None,
+    "last_duration": None,
+    "peers": 0,
+    "interval": None,
+    "lag": 0.0,
+    "failed_backends": [],
+}
+
+
+def collector_state() -> dict:
+    state = dict(_state)
+    state["backends"] = snapshot.backend_states()
+    return state
+
+
+def _process(peers: list[PeerRecord], timestamp: int) -> str | None:
+    global _last_compaction
+
+    save_stats(timestamp, peers)
+
+    prev = live.snapshot()
+    live.update(timestamp, peers)
+    # дифф для подписчиков считается здесь же, в потоке сборщика
+    event = (
+        stream.diff_event(prev, live.snapshot()) if stream.has_subscribers() else None
     )
 
-    peers = parse_wg_dump(raw)
+    if timestamp - _last_compaction >= settings.STATS_COMPACT_INTERVAL:
+        _last_compaction = timestamp
+        compact_series(timestamp, series_retention())
+
+    return event
+
+
+async def collect_once() -> int:
+    """
+    Один цикл сбора. Возвращает число пиров в свежих дампах.
+
+    Дампы бэкендов снимаются параллельно (не больше STATS_CONCURRENCY
+    одновременно, каждый со своим таймаутом и backoff — см. snapshot).
+    Не ответившие бэкенды в цикл не попадают, остальные пишутся в базу
+    одной транзакцией.
+    """
+    backends = get_backends()
+    dumps = await asyncio.gather(*(snapshot.fetch(b) for b in backends))
+
+    peers = []
+    failed = []
+    for backend, dump in zip(backends, dumps):
+        if dump is None:
+            failed.append(backend.name)
+        else:
+            peers.extend(dump)
+
+    _state["failed_backends"] = failed
+    if failed and len(failed) == len(backends):
+        raise RuntimeError(f"Ни один бэкенд не ответил: {', '.join(failed)}")
+
     timestamp = int(time.time())
 
-    save_stats(timestamp, peers)
+    loop = asyncio.get_running_loop()
+    event = await loop.run_in_executor(_executor, _process, peers, timestamp)
+
+    if event is not None:
+        stream.publish(event)
+    return len(peers)
+
+
+def next_interval(duration: float, peers: int) -> float:
+    interval = max(
+        settings.STATS_INTERVAL,
+        duration * DUTY_FACTOR,
+        peers / PEERS_PER_SECOND,
+    )
+    return min(interval, settings.STATS_INTERVAL_MAX)
+
+
+async def collector_loop():
+    """
+    Фоновый сбор статистики. Циклы не перекрываются: следующий планируется
+    от начала предыдущего через адаптивный интервал; если цикл занял больше
+    интервала, следующий стартует сразу, а отставание попадает в lag.
+    """
+    _state["running"] = True
+    next_run = time.monotonic()
+
+    try:
+        while True:
+            started = time.monotonic()
+            _state["lag"] = round(max(0.0, started - next_run), 3)
+            _state["last_started"] = time.time()
+
+            try:
+                _state["peers"] = await collect_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                _state["errors"] += 1
+                COLLECTOR_ERRORS.inc()
+                _state["last_error"] = str(e)
+                print("Collector error:", e)
+
+            duration = time.monotonic() - started
+            interval = next_interval(duration, _state["peers"])
+
+            _state["cycles"] += 1
+            _state["last_finished"] = time.time()
+            _state["last_duration"] = round(duration, 3)
+            _state["interval"] = interval
+
+            COLLECTOR_SECONDS.observe(duration)
+            COLLECTOR_LAG.set(_state["lag"])
+            COLLECTOR_INTERVAL.set(interval)
+
+            next_run = started + interval
+            await asyncio.sleep(max(0.0, next_run - time.monotonic()))
+    finally:
+        _state["running"] = False
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
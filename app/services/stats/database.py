@@ -1,68 +1,180 @@
 import sqlite3
+import threading
 from pathlib import Path
 
 DB_PATH = Path("stats.db")
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS peer_totals (
-            public_key TEXT PRIMARY KEY,
-            total_rx INTEGER,
-            total_tx INTEGER,
-            last_rx INTEGER,
-            last_tx INTEGER,
-            last_seen INTEGER
-        )
-    """)
-
-    conn.commit()
-    conn.close()
+# -----------------------------
+# Постоянное соединение
+# -----------------------------
+# Одно соединение на процесс в режиме WAL: читатели не блокируют запись
+# сборщика. Обращения из пула потоков FastAPI сериализуются через _lock.
+_conn: sqlite3.Connection | None = None
+_lock = threading.RLock()
 
 
-def save_stats(timestamp, peers):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    for p in peers:
-        pk = p["public_key"]
-        rx = p["rx_bytes"]
-        tx = p["tx_bytes"]
-        handshake = p["latest_handshake"]
+def get_conn() -> sqlite3.Connection:
+    global _conn
+    with _lock:
+        if _conn is None:
+            conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+            # действует только для новой БД; нужно для incremental_vacuum
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            _conn = conn
+        return _conn
 
-        c.execute("SELECT last_rx, last_tx, total_rx, total_tx, last_seen FROM peer_totals WHERE public_key=?", (pk,))
-        row = c.fetchone()
 
-        if row:
-            last_rx, last_tx, total_rx, total_tx, last_seen = row
+def db_lock() -> threading.RLock:
+    return _lock
 
-            # обработка перезапуска контейнера
-            delta_rx = rx if rx < last_rx else rx - last_rx
-            delta_tx = tx if tx < last_tx else tx - last_tx
 
-            total_rx += delta_rx
-            total_tx += delta_tx
+def close_db():
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
 
-            # обновляем last_seen только если handshake > 0
-            if handshake > 0:
-                last_seen = handshake
 
-            c.execute("""
-                UPDATE peer_totals
-                SET total_rx=?, total_tx=?, last_rx=?, last_tx=?, last_seen=?
-                WHERE public_key=?
-            """, (total_rx, total_tx, rx, tx, last_seen, pk))
-
-        else:
-            # первая запись
-            last_seen = handshake if handshake > 0 else None
+def init_db():
+    conn = get_conn()
+
+    with _lock, conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS peer_totals (
+                public_key TEXT PRIMARY KEY,
+                total_rx INTEGER,
+                total_tx INTEGER,
+                last_rx INTEGER,
+                last_tx INTEGER,
+                last_seen INTEGER
+            )
+        """)
+
+        # Трафик по интервалам: resolution — размер корзины в секундах
+        # (1 — сырые дельты каждого сбора), bucket — начало корзины
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS traffic_series (
+                resolution INTEGER NOT NULL,
+                public_key TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                rx INTEGER NOT NULL,
+                tx INTEGER NOT NULL,
+                PRIMARY KEY (resolution, public_key, bucket)
+            ) WITHOUT ROWID
+        """)
+
+        # Заблокированные IP клиентов (см. services/blocklist.py)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS blocked_ips (
+                ip TEXT PRIMARY KEY,
+                blocked_at INTEGER NOT NULL
+            )
+        """)
+
+
+# -----------------------------
+# Запись снимка
+# -----------------------------
+# Разрешения временного ряда: имя → размер корзины в секундах
+RESOLUTIONS = {"raw": 1, "1m": 60, "1h": 3600, "1d": 86400}
+
+# Снимок сначала загружается во временную таблицу, дальше всё считается
+# в SQL. Дельта: если счётчик уменьшился (перезапуск контейнера), дельтой
+# считается само новое значение. Для нового пира дельты нет.
+_SERIES_SQL = f"""
+    WITH
+        d AS (
+            SELECT
+                i.public_key,
+                CASE WHEN i.rx < t.last_rx THEN i.rx ELSE i.rx - t.last_rx END AS rx,
+                CASE WHEN i.tx < t.last_tx THEN i.tx ELSE i.tx - t.last_tx END AS tx
+            FROM ingest i JOIN peer_totals t ON t.public_key = i.public_key
+        ),
+        r(res) AS (VALUES {", ".join(f"({v})" for v in RESOLUTIONS.values())})
+    INSERT INTO traffic_series (resolution, public_key, bucket, rx, tx)
+    SELECT r.res, d.public_key, :ts - :ts % r.res, d.rx, d.tx
+    FROM d, r
+    WHERE d.rx > 0 OR d.tx > 0
+    ON CONFLICT (resolution, public_key, bucket) DO UPDATE SET
+        rx = rx + excluded.rx,
+        tx = tx + excluded.tx
+"""
+
+# В выражениях SET столбцы — старые значения строки, excluded.* — новые
+# счётчики. last_seen обновляется только при ненулевом handshake.
+_TOTALS_SQL = """
+    INSERT INTO peer_totals (public_key, total_rx, total_tx, last_rx, last_tx, last_seen)
+    SELECT public_key, 0, 0, rx, tx, seen FROM ingest WHERE true
+    ON CONFLICT(public_key) DO UPDATE SET
+        total_rx = total_rx + CASE
+            WHEN excluded.last_rx < last_rx THEN excluded.last_rx
+            ELSE excluded.last_rx - last_rx
+        END,
+        total_tx = total_tx + CASE
+            WHEN excluded.last_tx < last_tx THEN excluded.last_tx
+            ELSE excluded.last_tx - last_tx
+        END,
+        last_rx = excluded.last_rx,
+        last_tx = excluded.last_tx,
+        last_seen = COALESCE(excluded.last_seen, last_seen)
+"""
 
-            c.execute("""
-                INSERT INTO peer_totals (public_key, total_rx, total_tx, last_rx, last_tx, last_seen)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (pk, 0, 0, rx, tx, last_seen))
 
-    conn.commit()
-    conn.close()
+def save_stats(timestamp, peers):
+    """
+    Сохраняет снимок счётчиков одной транзакцией: дельты за интервал
+    пишутся в traffic_series (сырые и свёртки 1m/1h/1d), накопленные
+    итоги — в peer_totals.
+    """
+    rows = [
+        (
+            p.public_key,
+            p.rx_bytes,
+            p.tx_bytes,
+            p.latest_handshake if p.latest_handshake > 0 else None,
+        )
+        for p in peers
+    ]
+
+    conn = get_conn()
+    with _lock, conn:
+        conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS ingest (
+                public_key TEXT PRIMARY KEY,
+                rx INTEGER,
+                tx INTEGER,
+                seen INTEGER
+            )
+        """)
+        conn.execute("DELETE FROM ingest")
+        conn.executemany("INSERT OR REPLACE INTO ingest VALUES (?, ?, ?, ?)", rows)
+        conn.execute(_SERIES_SQL, {"ts": int(timestamp)})
+        conn.execute(_TOTALS_SQL)
+
+
+# -----------------------------
+# Хранение временного ряда
+# -----------------------------
+def compact_series(now: int, retention: dict[str, int]):
+    """
+    Удаляет корзины старше срока хранения своего разрешения.
+    retention: имя разрешения → срок в секундах (0 — хранить всегда).
+    """
+    conn = get_conn()
+    deleted = 0
+    with _lock:
+        with conn:
+            for name, keep in retention.items():
+                if keep <= 0:
+                    continue
+                c = conn.execute(
+                    "DELETE FROM traffic_series WHERE resolution=? AND bucket < ?",
+                    (RESOLUTIONS[name], now - keep),
+                )
+                deleted += c.rowcount
+        # освобождённые страницы возвращаются ОС, файл БД не растёт
+        conn.execute("PRAGMA incremental_vacuum")
+    return deleted
@@ -0,0 +1,203 @@
+import time
+
+from .database import db_lock, get_conn
+from .parser import PeerRecord
+
+# -----------------------------
+# Текущие скорости и итоги пиров в памяти
+# -----------------------------
+# Сборщик после каждого цикла строит новый снимок со скоростями и заранее
+# отсортированными индексами и подменяет его одной операцией присваивания.
+# Запросы читают готовый снимок без блокировок и без обращения к БД.
+
+# Пир считается активным, если handshake был не раньше, чем столько секунд назад
+ACTIVE_WINDOW = 180
+
+
+class LivePeer:
+    __slots__ = (
+        "public_key",
+        "endpoint",
+        "allowed_ips",
+        "rx_rate",
+        "tx_rate",
+        "total_rx",
+        "total_tx",
+        "last_rx",
+        "last_tx",
+        "last_seen",
+        "sampled_at",
+    )
+
+    def __init__(self, public_key: str):
+        self.public_key = public_key
+        self.endpoint: str | None = None
+        self.allowed_ips: str | None = None
+        self.rx_rate = 0.0
+        self.tx_rate = 0.0
+        self.total_rx = 0
+        self.total_tx = 0
+        self.last_rx = 0
+        self.last_tx = 0
+        self.last_seen: int | None = None
+        # время дампа, из которого взяты last_rx/last_tx
+        self.sampled_at: int | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "public_key": self.public_key,
+            "total_rx": self.total_rx,
+            "total_tx": self.total_tx,
+            "last_seen": self.last_seen,
+            "rx_rate": self.rx_rate,
+            "tx_rate": self.tx_rate,
+            "endpoint": self.endpoint,
+            "allowed_ips": self.allowed_ips,
+        }
+
+
+# Поля сортировки: имя → ключ (индексы хранятся по убыванию)
+SORT_KEYS = {
+    "rate": lambda p: p.rx_rate + p.tx_rate,
+    "rx_rate": lambda p: p.rx_rate,
+    "tx_rate": lambda p: p.tx_rate,
+    "total": lambda p: p.total_rx + p.total_tx,
+    "total_rx": lambda p: p.total_rx,
+    "total_tx": lambda p: p.total_tx,
+    "last_seen": lambda p: p.last_seen or 0,
+}
+
+
+class LiveSnapshot:
+    def __init__(self, timestamp: int | None, peers: dict[str, LivePeer]):
+        self.timestamp = timestamp
+        self.peers = peers
+        self.index = {
+            name: sorted(peers.values(), key=key, reverse=True)
+            for name, key in SORT_KEYS.items()
+        }
+
+
+_snapshot = LiveSnapshot(None, {})
+
+
+def snapshot() -> LiveSnapshot:
+    return _snapshot
+
+
+def seed_from_db():
+    """Начальные итоги и счётчики из peer_totals (при старте приложения)."""
+    global _snapshot
+
+    conn = get_conn()
+    with db_lock():
+        rows = conn.execute(
+            "SELECT public_key, total_rx, total_tx, last_rx, last_tx, last_seen "
+            "FROM peer_totals"
+        ).fetchall()
+
+    peers = {}
+    for pk, total_rx, total_tx, last_rx, last_tx, last_seen in rows:
+        p = LivePeer(pk)
+        p.total_rx, p.total_tx = total_rx or 0, total_tx or 0
+        p.last_rx, p.last_tx = last_rx or 0, last_tx or 0
+        p.last_seen = last_seen
+        peers[pk] = p
+
+    _snapshot = LiveSnapshot(None, peers)
+
+
+def update(timestamp: int, peers: list[PeerRecord]):
+    """
+    Новый снимок по дампу: скорости считаются по разнице счётчиков с
+    прошлым замером пира, итоги — так же, как в peer_totals. Бэкенд мог
+    пропустить циклы (таймаут, backoff) — тогда трафик за весь перерыв
+    делится на время с прошлого замера, а не на один цикл.
+    """
+    global _snapshot
+
+    prev = _snapshot
+
+    current: dict[str, LivePeer] = {}
+    for data in peers:
+        pk = data.public_key
+        old = prev.peers.get(pk)
+        p = LivePeer(pk)
+        p.endpoint = data.endpoint
+        p.allowed_ips = data.allowed_ips
+        p.last_rx = rx = data.rx_bytes
+        p.last_tx = tx = data.tx_bytes
+        p.last_seen = data.latest_handshake or None
+        p.sampled_at = timestamp
+
+        if old is not None:
+            # счётчик уменьшился — контейнер перезапускался
+            delta_rx = rx if rx < old.last_rx else rx - old.last_rx
+            delta_tx = tx if tx < old.last_tx else tx - old.last_tx
+            p.total_rx = old.total_rx + delta_rx
+            p.total_tx = old.total_tx + delta_tx
+            p.last_seen = p.last_seen or old.last_seen
+            interval = timestamp - old.sampled_at if old.sampled_at else 0
+            if interval > 0:
+                p.rx_rate = delta_rx / interval
+                p.tx_rate = delta_tx / interval
+
+        current[pk] = p
+
+    # пиры, пропавшие из дампа, остаются с итогами и нулевой скоростью
+    for pk, old in prev.peers.items():
+        if pk not in current:
+            p = LivePeer(pk)
+            p.total_rx, p.total_tx = old.total_rx, old.total_tx
+            p.last_rx, p.last_tx = old.last_rx, old.last_tx
+            p.last_seen = old.last_seen
+            p.sampled_at = old.sampled_at
+            current[pk] = p
+
+    _snapshot = LiveSnapshot(timestamp, current)
+
+
+# -----------------------------
+# Запросы
+# -----------------------------
+def top(n: int = 10, by: str = "rate") -> list[dict]:
+    if by not in SORT_KEYS:
+        raise ValueError(f"Неизвестное поле сортировки: {by}")
+    return [p.to_dict() for p in _snapshot.index[by][:n]]
+
+
+def query(
+    sort: str = "total",
+    order: str = "desc",
+    offset: int = 0,
+    limit: int | None = None,
+    active: bool | None = None,
+    search: str | None = None,
+) -> tuple[int, list[dict]]:
+    """
+    Страница пиров из заранее отсортированного индекса.
+    Возвращает (всего подходящих, страница).
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Неизвестное поле сортировки: {sort}")
+    if order not in ("asc", "desc"):
+        raise ValueError("order должен быть asc или desc")
+
+    snap = _snapshot
+    index = snap.index[sort]
+    if order == "asc":
+        index = index[::-1]
+
+    if active is None and not search:
+        end = None if limit is None else offset + limit
+        return len(index), [p.to_dict() for p in index[offset:end]]
+
+    since = int(time.time()) - ACTIVE_WINDOW
+    matched = [
+        p
+        for p in index
+        if (active is None or ((p.last_seen or 0) >= since) == active)
+        and (not search or search in p.public_key)
+    ]
+    end = None if limit is None else offset + limit
+    return len(matched), [p.to_dict() for p in matched[offset:end]]
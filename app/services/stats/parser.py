@@ -1,39 +1,104 @@
-def parse_wg_dump(raw: str):
-    peers = []
-    lines = raw.splitlines()
+from typing import Iterable, Iterator, NamedTuple
 
-    for line in lines:
+# -----------------------------
+# Разбор `wg show <iface> dump`
+# -----------------------------
+# Первая строка дампа — интерфейс:
+#   private_key, public_key, listen_port, fwmark (+ параметры AWG)
+# Остальные — пиры, 8 колонок через TAB:
+#   0: public_key
+#   1: preshared_key ("(none)", если не задан)
+#   2: endpoint ("(none)", если неизвестен)
+#   3: allowed_ips (через запятую)
+#   4: latest_handshake (unix time, 0 — не было)
+#   5: rx_bytes
+#   6: tx_bytes
+#   7: persistent_keepalive ("off" или секунды)
+# В `wg show all dump` перед каждой строкой идёт имя интерфейса.
+
+
+class PeerRecord(NamedTuple):
+    public_key: str
+    preshared_key: str | None
+    endpoint: str | None
+    allowed_ips: str
+    latest_handshake: int
+    rx_bytes: int
+    tx_bytes: int
+    persistent_keepalive: int | None
+    interface: str | None = None
+
+
+_NONE = ("(none)", "(null)", "")
+
+
+class DumpParser:
+    """
+    Построчный разбор дампа: feed() принимает строку и возвращает
+    PeerRecord или None (строка интерфейса, пустая или битая строка).
+    Битые строки не логируются по одной, а считаются в errors.
+
+    with_interface=True — формат `wg show all dump` с именем интерфейса
+    в первой колонке.
+    """
+
+    def __init__(self, with_interface: bool = False):
+        self.with_interface = with_interface
+        self.interfaces: set[str] = set()
+        self.errors = 0
+        self._seen_interface_line = False
+
+    def feed(self, line: str) -> PeerRecord | None:
+        line = line.rstrip("\r\n")
+        if not line:
+            return None
         parts = line.split("\t")
 
-        # В дампе AmneziaWG:
-        # Строка интерфейса начинается с PrivateKey (или его отсутствия)
-        # Строка пира начинается с PublicKey.
-        # Нам нужны только те строки, где 8+ колонок (это пиры)
+        interface = None
+        if self.with_interface:
+            interface = parts[0]
+            if interface not in self.interfaces:
+                # первая строка каждого интерфейса — сам интерфейс
+                self.interfaces.add(interface)
+                return None
+            parts = parts[1:]
+        elif not self._seen_interface_line:
+            self._seen_interface_line = True
+            return None
+
         if len(parts) < 8:
-            continue
+            self.errors += 1
+            return None
 
         try:
-            # Индексы в дампе AWG (версия с обфускацией):
-            # 0: public_key
-            # 1: preshared_key
-            # 2: endpoint (может быть (null))
-            # 3: allowed_ips
-            # 4: latest_handshake (unix timestamp)
-            # 5: rx_bytes
-            # 6: tx_bytes
-            # 7: persistent_keepalive
-
-            peer = {
-                "public_key": parts[0],
-                "endpoint": parts[2] if parts[2] != "(null)" else None,
-                "allowed_ips": parts[3],
-                "latest_handshake": int(parts[4]) if parts[4] != "0" else 0,
-                "rx_bytes": int(parts[5]),
-                "tx_bytes": int(parts[6]),
-            }
-            peers.append(peer)
-        except (ValueError, IndexError) as e:
-            print(f"Ошибка парсинга строки: {e}")
-            continue
-
-    return peers
+            keepalive = parts[7]
+            return PeerRecord(
+                parts[0],
+                None if parts[1] in _NONE else parts[1],
+                None if parts[2] in _NONE else parts[2],
+                parts[3],
+                int(parts[4]),
+                int(parts[5]),
+                int(parts[6]),
+                None if keepalive == "off" else int(keepalive),
+                interface,
+            )
+        except ValueError:
+            self.errors += 1
+            return None
+
+
+def iter_wg_dump(
+    lines: Iterable[str], with_interface: bool = False
+) -> Iterator[PeerRecord]:
+    parser = DumpParser(with_interface)
+    for line in lines:
+        record = parser.feed(line)
+        if record is not None:
+            yield record
+    if parser.errors:
+        print(f"Ошибка парсинга дампа: пропущено строк {parser.errors}")
+
+
+def parse_wg_dump(raw: str, with_interface: bool = False) -> list[PeerRecord]:
+    return list(iter_wg_dump(raw.splitlines(), with_interface))
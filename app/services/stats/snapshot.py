@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import json
+import subprocess
+import time
+from contextlib import aclosing
+
+from core.config import AwgBackend, settings
+from services.backends import get_backends
+from services.clients_table import ClientsTable, get_store
+from services.docker_utils import docker_exec_lines
+from services.metrics import COLLECTOR_BACKEND_ERRORS, COLLECTOR_BACKEND_UP
+from .parser import DumpParser, PeerRecord
+
+# -----------------------------
+# Последний дамп интерфейса
+# -----------------------------
+# Дамп, снятый сборщиком статистики, переиспользуется /clients: пока он
+# моложе CLIENTS_CACHE_TTL, контейнер не трогается. Если дамп устарел,
+# одновременные запросы ждут один общий docker exec. Дампы — по бэкендам.
+#
+# Каждый дамп снимается с таймаутом STATS_BACKEND_TIMEOUT, одновременно —
+# не больше STATS_CONCURRENCY. После ошибки бэкенд не опрашивается
+# (backoff, удваивается до STATS_BACKOFF_MAX), а читателям отдаётся
+# последний удачный дамп: зависший контейнер не задерживает остальные.
+
+
+class _Dump:
+    __slots__ = (
+        "peers",
+        "taken_at",
+        "seq",
+        "inflight",
+        "failures",
+        "retry_at",
+        "error",
+    )
+
+    def __init__(self):
+        self.peers: list[PeerRecord] = []
+        self.taken_at = 0.0
+        self.seq = 0
+        self.inflight: asyncio.Future | None = None
+        self.failures = 0
+        self.retry_at = 0.0
+        self.error: Exception | None = None
+
+
+_dumps: dict[str, _Dump] = {}
+# семафор привязан к event loop
+_limit: tuple[asyncio.AbstractEventLoop, asyncio.Semaphore] | None = None
+
+
+def _dump(backend: str) -> _Dump:
+    dump = _dumps.get(backend)
+    if dump is None:
+        dump = _dumps[backend] = _Dump()
+    return dump
+
+
+def _semaphore() -> asyncio.Semaphore:
+    global _limit
+    loop = asyncio.get_running_loop()
+    if _limit is None or _limit[0] is not loop:
+        _limit = (loop, asyncio.Semaphore(settings.STATS_CONCURRENCY))
+    return _limit[1]
+
+
+def publish(backend: str, peers: list[PeerRecord]):
+    """Новый дамп бэкенда."""
+    dump = _dump(backend)
+    dump.peers = peers
+    dump.taken_at = time.monotonic()
+    dump.seq += 1
+
+
+def invalidate(backend: str):
+    """Следующий /clients снимет свежий дамп (после замены конфигов)."""
+    dump = _dump(backend)
+    dump.taken_at = 0.0
+    dump.retry_at = 0.0
+
+
+async def read_dump(container: str, interface: str) -> list[PeerRecord]:
+    parser = DumpParser()
+    peers = []
+    # aclosing: при таймауте процесс docker exec завершается сразу
+    async with aclosing(
+        docker_exec_lines(container, f"wg show {interface} dump")
+    ) as lines:
+        async for line in lines:
+            record = parser.feed(line)
+            if record is not None:
+                peers.append(record)
+    if parser.errors:
+        print(f"Ошибка парсинга дампа: пропущено строк {parser.errors}")
+    return peers
+
+
+async def _fetch(backend: AwgBackend, dump: _Dump) -> list[PeerRecord] | None:
+    async with _semaphore():
+        try:
+            peers = await asyncio.wait_for(
+                read_dump(backend.name, backend.interface),
+                settings.STATS_BACKEND_TIMEOUT,
+            )
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = TimeoutError(f"нет ответа за {settings.STATS_BACKEND_TIMEOUT:g} с")
+            dump.failures += 1
+            dump.error = e
+            delay = min(
+                settings.STATS_INTERVAL * 2 ** (dump.failures - 1),
+                settings.STATS_BACKOFF_MAX,
+            )
+            dump.retry_at = time.monotonic() + delay
+            COLLECTOR_BACKEND_ERRORS.labels(backend.name).inc()
+            COLLECTOR_BACKEND_UP.labels(backend.name).set(0)
+            print(
+                f"⚠️ Дамп бэкенда {backend.name} не снят ({e}), "
+                f"повтор через {delay:.0f} с"
+            )
+            return None
+
+    dump.failures = 0
+    dump.retry_at = 0.0
+    dump.error = None
+    COLLECTOR_BACKEND_UP.labels(backend.name).set(1)
+    publish(backend.name, peers)
+    return peers
+
+
+async def fetch(backend: AwgBackend) -> list[PeerRecord] | None:
+    """
+    Свежий дамп бэкенда (один docker exec на всех одновременных
+    вызывающих). None — бэкенд не ответил или ещё в backoff после ошибки.
+    """
+    dump = _dump(backend.name)
+    if dump.retry_at > time.monotonic():
+        return None
+
+    if dump.inflight is None or dump.inflight.done():
+        dump.inflight = asyncio.ensure_future(_fetch(backend, dump))
+    return await asyncio.shield(dump.inflight)
+
+
+async def get_peers(backend: AwgBackend, max_age: float) -> list[PeerRecord]:
+    """
+    Дамп не старше max_age; если бэкенд недоступен — последний удачный.
+    Ошибка — только если удачного дампа ещё не было.
+    """
+    dump = _dump(backend.name)
+    if dump.seq and time.monotonic() - dump.taken_at < max_age:
+        return dump.peers
+
+    await fetch(backend)
+    if not dump.seq and dump.error is not None:
+        raise dump.error
+    return dump.peers
+
+
+def is_stale(backend: str) -> bool:
+    """Бэкенд отдаёт последний удачный дамп, а не текущий."""
+    return _dump(backend).failures > 0
+
+
+def backend_states() -> dict[str, dict]:
+    now = time.monotonic()
+    return {
+        name: {
+            "peers": len(dump.peers),
+            "age": round(now - dump.taken_at, 3) if dump.seq else None,
+            "failures": dump.failures,
+            "retry_in": round(max(0.0, dump.retry_at - now), 3),
+            "error": str(dump.error) if dump.error else None,
+        }
+        for name, dump in _dumps.items()
+    }
+
+
+# -----------------------------
+# Ответ /clients
+# -----------------------------
+# Тело и ETag собираются один раз на набор (дамп, версия clientsTable)
+# всех бэкендов.
+_response: tuple[tuple, bytes, str] | None = None
+
+
+async def _table(backend: AwgBackend, store, ttl: float) -> ClientsTable:
+    # недоступный бэкенд не задерживает ответ: имена — из кеша
+    if is_stale(backend.name):
+        return store.cached()
+    try:
+        return await asyncio.wait_for(
+            store.get(max_age=ttl), settings.STATS_BACKEND_TIMEOUT
+        )
+    except (asyncio.TimeoutError, subprocess.CalledProcessError, OSError) as e:
+        print(f"⚠️ clientsTable бэкенда {backend.name} не прочитана ({e})")
+        return store.cached()
+
+
+async def clients_response() -> tuple[bytes, str]:
+    """JSON-ответ /clients и его ETag. Бэкенды опрашиваются параллельно."""
+    global _response
+
+    ttl = settings.CLIENTS_CACHE_TTL
+    backends = get_backends()
+    stores = [get_store(b.name) for b in backends]
+    dumps = await asyncio.gather(*(get_peers(b, ttl) for b in backends))
+    tables = await asyncio.gather(
+        *(_table(b, store, ttl) for b, store in zip(backends, stores))
+    )
+
+    key = tuple(
+        (_dump(b.name).seq, store.version, is_stale(b.name))
+        for b, store in zip(backends, stores)
+    )
+    if _response is not None and _response[0] == key:
+        return _response[1], _response[2]
+
+    sharded = len(backends) > 1
+    clients = []
+    for backend, peers, table in zip(backends, dumps, tables):
+        for p in peers:
+            client = {
+                "public_key": p.public_key,
+                "name": table.name_of(p.public_key),
+                "endpoint": p.endpoint,
+                "allowed_ips": [a for a in p.allowed_ips.split(",") if a],
+                "latest_handshake": p.latest_handshake,
+                "rx_bytes": p.rx_bytes,
+                "tx_bytes": p.tx_bytes,
+                "persistent_keepalive": p.persistent_keepalive,
+            }
+            if sharded:
+                client["backend"] = backend.name
+            clients.append(client)
+
+    payload = {"status": "ok", "clients": clients}
+    stale = [b.name for b in backends if is_stale(b.name)]
+    if stale:
+        # по этим бэкендам — последний удачный дамп
+        payload["stale_backends"] = stale
+    if not sharded:
+        payload["interface"] = backends[0].interface
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+    etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+    _response = (key, body, etag)
+    return body, etag
@@ -1,32 +1,20 @@
-import sqlite3
-from pathlib import Path
-
-DB_PATH = Path("stats.db")
-
-def get_wireguard_stats():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT public_key, total_rx, total_tx, last_seen FROM peer_totals")
-    rows = c.fetchall()
-    conn.close()
-
-    return [
-        {
-            "public_key": r[0],
-            "total_rx": r[1],
-            "total_tx": r[2],
-            "last_seen": r[3]
-        }
-        for r in rows
-    ]
+import time
+
+from core.config import settings
+from .database import RESOLUTIONS, db_lock, get_conn
+
+# Точек в ответе истории, если step не задан
+HISTORY_MAX_POINTS = 1000
 
 
 def get_peer_stats(public_key: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT total_rx, total_tx, last_seen FROM peer_totals WHERE public_key=?", (public_key,))
-    row = c.fetchone()
-    conn.close()
+    conn = get_conn()
+    with db_lock():
+        c = conn.execute(
+            "SELECT total_rx, total_tx, last_seen FROM peer_totals WHERE public_key=?",
+            (public_key,),
+        )
+        row = c.fetchone()
 
     if not row:
         return {"error": "peer not found"}
@@ -35,5 +23,97 @@ def get_peer_stats(public_key: str):
         "public_key": public_key,
         "total_rx": row[0],
         "total_tx": row[1],
-        "last_seen": row[2]
+        "last_seen": row[2],
+    }
+
+
+def series_retention() -> dict[str, int]:
+    """Сроки хранения разрешений временного ряда, секунды (0 — всегда)."""
+    return {
+        "raw": settings.STATS_RETENTION_RAW,
+        "1m": settings.STATS_RETENTION_1M,
+        "1h": settings.STATS_RETENTION_1H,
+        "1d": settings.STATS_RETENTION_1D,
+    }
+
+
+def _pick_resolution(start: int, step: int, now: int) -> tuple[int, int]:
+    """
+    Самое грубое разрешение, которое делит step и ещё хранит данные на
+    момент start. Если такого нет — самое мелкое из хранящих, а step
+    округляется вверх до кратного ему.
+    """
+    retention = series_retention()
+    usable = [
+        res
+        for name, res in RESOLUTIONS.items()
+        if retention[name] <= 0 or start >= now - retention[name]
+    ]
+    if not usable:
+        usable = [max(RESOLUTIONS.values())]
+
+    fitting = [res for res in usable if res <= step and step % res == 0]
+    if fitting:
+        return max(fitting), step
+
+    res = min(usable, key=lambda r: (r < step, r))
+    return res, -(-step // res) * res
+
+
+def get_peer_history(
+    public_key: str,
+    start: int | None = None,
+    end: int | None = None,
+    step: int | None = None,
+):
+    """
+    Трафик пира по интервалам [start, end) с шагом step секунд.
+    """
+    now = int(time.time())
+    end = end if end is not None else now
+    start = start if start is not None else end - 86400
+
+    if end <= start:
+        raise ValueError("'from' должен быть меньше 'to'")
+    if step is None:
+        step = next(
+            (
+                res
+                for res in RESOLUTIONS.values()
+                if (end - start) / res <= HISTORY_MAX_POINTS
+            ),
+            max(RESOLUTIONS.values()),
+        )
+    if step <= 0:
+        raise ValueError("step должен быть положительным")
+
+    res, step = _pick_resolution(start, step, now)
+
+    conn = get_conn()
+    with db_lock():
+        c = conn.execute(
+            """
+            SELECT bucket - bucket % :step AS b, SUM(rx), SUM(tx)
+            FROM traffic_series
+            WHERE resolution = :res AND public_key = :pk
+              AND bucket >= :start AND bucket < :end
+            GROUP BY b ORDER BY b
+            """,
+            {
+                "step": step,
+                "res": res,
+                "pk": public_key,
+                "start": start - start % res,
+                "end": end,
+            },
+        )
+        rows = c.fetchall()
+
+    return {
+        "public_key": public_key,
+        "from": start,
+        "to": end,
+        "step": step,
+        "resolution": res,
+        "points": [{"t": r[0], "rx": r[1], "tx": r[2]} for r in rows],
     }
@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+from . import live
+
+# -----------------------------
+# Трансляция статистики подписчикам (SSE)
+# -----------------------------
+# Событие кодируется один раз и одной и той же строкой раскладывается по
+# очередям подписчиков. Очереди ограничены: если подписчик не успевает
+# читать, его очередь сбрасывается и он получает свежий полный снимок.
+
+QUEUE_SIZE = 16
+
+# Маркер в очереди: подписчику нужен полный снимок
+RESYNC = None
+
+_subscribers: set[asyncio.Queue] = set()
+
+
+def has_subscribers() -> bool:
+    return bool(_subscribers)
+
+
+def _event(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def snapshot_event() -> str:
+    snap = live.snapshot()
+    return _event(
+        "snapshot",
+        {
+            "timestamp": snap.timestamp,
+            "peers": [p.to_dict() for p in snap.peers.values()],
+        },
+    )
+
+
+def diff_event(prev: live.LiveSnapshot, cur: live.LiveSnapshot) -> str | None:
+    """
+    Пиры, у которых изменились счётчики, endpoint или handshake.
+    None — если изменений нет.
+    """
+    changed = []
+    for pk, p in cur.peers.items():
+        old = prev.peers.get(pk)
+        if (
+            old is None
+            or old.last_rx != p.last_rx
+            or old.last_tx != p.last_tx
+            or old.endpoint != p.endpoint
+            or old.last_seen != p.last_seen
+            or old.rx_rate != p.rx_rate
+            or old.tx_rate != p.tx_rate
+        ):
+            changed.append(p.to_dict())
+
+    if not changed:
+        return None
+    return _event("diff", {"timestamp": cur.timestamp, "peers": changed})
+
+
+def publish(event: str):
+    """Вызывается из event loop после цикла сборщика."""
+    for queue in _subscribers:
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # медленный подписчик: старые диффы не нужны, нужен снимок
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+
+
+async def subscribe(keepalive: float = 15):
+    """
+    Генератор событий SSE для одного подписчика: сначала полный снимок,
+    затем диффы после каждого цикла сбора.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    _subscribers.add(queue)
+    try:
+        yield snapshot_event()
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield snapshot_event() if event is RESYNC else event
+    finally:
+        _subscribers.discard(queue)
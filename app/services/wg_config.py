@@ -0,0 +1,329 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from services.ip_pool import IPPool
+
+# -----------------------------
+# Модель server.conf
+# -----------------------------
+# Файл хранится построчно: секция [Interface] (со всем, что до неё) и
+# упорядоченный список секций [Peer]. Строки не переформатируются,
+# поэтому render() возвращает исходный текст байт в байт, а изменения
+# затрагивают только нужные строки.
+
+
+def _split_kv(line: str) -> tuple[str, str] | None:
+    stripped = line.strip()
+    if not stripped or stripped.startswith(("#", ";", "[")) or "=" not in stripped:
+        return None
+    key, value = stripped.split("=", 1)
+    return key.strip().lower(), value.strip()
+
+
+def _ip_of(allowed_ip: str) -> str:
+    return allowed_ip.split("/")[0].strip()
+
+
+class Peer:
+    """
+    Секция [Peer]. lines — исходные строки секции (включая заголовок
+    и пустые строки после неё).
+    """
+
+    __slots__ = ("lines", "name", "public_key", "preshared_key", "allowed_ips")
+
+    def __init__(self, lines: list[str]):
+        self.lines = lines
+        self.name: str | None = None
+        self.public_key: str | None = None
+        self.preshared_key: str | None = None
+        self.allowed_ips: list[str] = []
+
+        for line in lines[1:]:
+            stripped = line.strip()
+            if (
+                stripped.startswith("#")
+                and self.name is None
+                and self.public_key is None
+            ):
+                self.name = stripped[1:].strip()
+                continue
+
+            kv = _split_kv(line)
+            if not kv:
+                continue
+            key, value = kv
+            if key == "publickey":
+                self.public_key = value
+            elif key == "presharedkey":
+                self.preshared_key = value
+            elif key == "allowedips":
+                self.allowed_ips.extend(
+                    v.strip() for v in value.split(",") if v.strip()
+                )
+
+    @property
+    def ips(self) -> list[str]:
+        """Адреса пира без маски."""
+        return [_ip_of(a) for a in self.allowed_ips]
+
+    def set(self, key: str, value: str):
+        """
+        Меняет значение ключа на месте; если ключа нет — добавляет строку
+        после последней строки key = value секции.
+        """
+        wanted = key.lower()
+        last_kv = 0
+
+        for i, line in enumerate(self.lines):
+            kv = _split_kv(line)
+            if not kv:
+                continue
+            last_kv = i
+            if kv[0] == wanted:
+                ending = "\n" if line.endswith("\n") else ""
+                self.lines[i] = f"{key} = {value}{ending}"
+                break
+        else:
+            self.lines.insert(last_kv + 1, f"{key} = {value}\n")
+
+        if wanted == "presharedkey":
+            self.preshared_key = value
+        elif wanted == "allowedips":
+            self.allowed_ips = [v.strip() for v in value.split(",") if v.strip()]
+        elif wanted == "publickey":
+            self.public_key = value
+
+    def settings(self) -> dict[str, str]:
+        """Ключи секции (без комментария с именем)."""
+        return dict(kv for kv in map(_split_kv, self.lines) if kv)
+
+    def text(self) -> str:
+        return "".join(self.lines)
+
+
+class ServerConfig:
+    """
+    Разобранный server.conf с индексами пиров по имени, публичному ключу и IP.
+    """
+
+    def __init__(self, text: str):
+        self.head: list[str] = []
+        self.interface: dict[str, str] = {}
+        self.peers: dict[int, Peer] = {}
+        self.by_name: dict[str, Peer] = {}
+        self.by_public_key: dict[str, Peer] = {}
+        self.by_ip: dict[str, Peer] = {}
+        self._next_id = 0
+        self._ids: dict[int, int] = {}
+        self._hash: str | None = None
+        self._pools: dict[str, IPPool] = {}
+
+        current: list[str] | None = None
+        for line in text.splitlines(keepends=True):
+            if line.strip().lower() == "[peer]":
+                if current is not None:
+                    self._append(Peer(current))
+                current = [line]
+            elif current is not None:
+                current.append(line)
+            else:
+                self.head.append(line)
+                kv = _split_kv(line)
+                if kv:
+                    self.interface[kv[0]] = kv[1]
+
+        if current is not None:
+            self._append(Peer(current))
+
+    # --- индексы ---
+    def _append(self, peer: Peer):
+        peer_id = self._next_id
+        self._next_id += 1
+        self.peers[peer_id] = peer
+        self._ids[id(peer)] = peer_id
+        self._index(peer)
+
+    def _index(self, peer: Peer):
+        if peer.name:
+            self.by_name[peer.name] = peer
+        if peer.public_key:
+            self.by_public_key[peer.public_key] = peer
+        for ip in peer.ips:
+            self.by_ip[ip] = peer
+            for pool in self._pools.values():
+                pool.mark(ip)
+
+    def _unindex(self, peer: Peer):
+        if peer.name and self.by_name.get(peer.name) is peer:
+            del self.by_name[peer.name]
+        if peer.public_key and self.by_public_key.get(peer.public_key) is peer:
+            del self.by_public_key[peer.public_key]
+        for ip in peer.ips:
+            if self.by_ip.get(ip) is peer:
+                del self.by_ip[ip]
+                for pool in self._pools.values():
+                    pool.release(ip)
+
+    # --- поиск ---
+    @property
+    def private_key(self) -> str | None:
+        return self.interface.get("privatekey")
+
+    def find(self, name_or_key: str) -> Peer | None:
+        """Пир по имени клиента или по публичному ключу."""
+        return self.by_name.get(name_or_key) or self.by_public_key.get(name_or_key)
+
+    def client_ip(self, client_name: str) -> str | None:
+        peer = self.by_name.get(client_name)
+        if not peer or not peer.ips:
+            return None
+        return peer.ips[0]
+
+    def pool(self, cidr: str) -> IPPool:
+        """
+        Пул адресов подсети, заполненный адресами пиров. Пул живёт вместе
+        с моделью и обновляется при добавлении/удалении пиров.
+        """
+        pool = self._pools.get(cidr)
+        if pool is None:
+            pool = IPPool(cidr)
+            for ip in self.by_ip:
+                pool.mark(ip)
+            self._pools[cidr] = pool
+        return pool
+
+    # --- изменения ---
+    def add_peer(
+        self, name: str, public_key: str, preshared_key: str, allowed_ips: str
+    ) -> Peer:
+        self._forget()
+
+        # Файл должен заканчиваться пустой строкой, чтобы новый блок
+        # отделялся от предыдущего так же, как раньше
+        tail = self._tail()
+        if tail:
+            if not tail[-1].endswith("\n"):
+                tail[-1] += "\n"
+            if tail[-1].strip():
+                tail.append("\n")
+
+        peer = Peer(
+            [
+                "[Peer]\n",
+                f"# {name}\n",
+                f"PublicKey = {public_key}\n",
+                f"PresharedKey = {preshared_key}\n",
+                f"AllowedIPs = {allowed_ips}\n",
+                "\n",
+            ]
+        )
+        self._append(peer)
+        return peer
+
+    def remove_peer(self, peer: Peer):
+        self._forget()
+        peer_id = self._ids.pop(id(peer))
+        del self.peers[peer_id]
+        self._unindex(peer)
+
+    def update_peer(self, peer: Peer, key: str, value: str):
+        """Изменение ключа пира с обновлением индексов."""
+        self._forget()
+        self._unindex(peer)
+        peer.set(key, value)
+        self._index(peer)
+
+    def _tail(self) -> list[str]:
+        if self.peers:
+            return next(reversed(self.peers.values())).lines
+        return self.head
+
+    # --- сериализация ---
+    def render(self) -> str:
+        text = "".join(self.head) + "".join(p.text() for p in self.peers.values())
+        _remember(text, self)
+        return text
+
+    def _forget(self):
+        with _cache_lock:
+            if self._hash is not None and _cache.get(self._hash) is self:
+                del _cache[self._hash]
+            self._hash = None
+
+
+# -----------------------------
+# Разница двух конфигов
+# -----------------------------
+# Ключи пира, которые можно поменять в живом интерфейсе через wg set
+LIVE_PEER_KEYS = {"publickey", "presharedkey", "allowedips"}
+
+
+def diff_peers(
+    old: ServerConfig, new: ServerConfig
+) -> tuple[list[Peer], list[str], list[Peer]]:
+    """
+    Разница пиров по публичному ключу: (новые пиры, ключи удалённых,
+    пиры с изменёнными настройками — PSK, AllowedIPs и прочими).
+    """
+    added: list[Peer] = []
+    changed: list[Peer] = []
+    for public_key, peer in new.by_public_key.items():
+        prev = old.by_public_key.get(public_key)
+        if prev is None:
+            added.append(peer)
+        elif _peer_state(prev) != _peer_state(peer):
+            changed.append(peer)
+
+    removed = [key for key in old.by_public_key if key not in new.by_public_key]
+    return added, removed, changed
+
+
+def _peer_state(peer: Peer) -> dict:
+    state = peer.settings()
+    state["allowedips"] = sorted(peer.allowed_ips)
+    return state
+
+
+# -----------------------------
+# Кеш разобранных конфигов по хешу содержимого
+# -----------------------------
+_CACHE_SIZE = 8
+_cache: "OrderedDict[str, ServerConfig]" = OrderedDict()
+# разбор может идти в пуле потоков (asyncio.to_thread)
+_cache_lock = threading.RLock()
+
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def _remember(text: str, config: ServerConfig):
+    digest = _digest(text)
+    with _cache_lock:
+        if config._hash != digest:
+            config._forget()
+        config._hash = digest
+        _cache[digest] = config
+        _cache.move_to_end(digest)
+        while len(_cache) > _CACHE_SIZE:
+            _, evicted = _cache.popitem(last=False)
+            evicted._hash = None
+
+
+def parse_server_config(text: str) -> ServerConfig:
+    """
+    Возвращает разобранный server.conf. Повторный вызов с тем же
+    содержимым не разбирает файл заново.
+    """
+    digest = _digest(text)
+    with _cache_lock:
+        config = _cache.get(digest)
+        if config is not None:
+            _cache.move_to_end(digest)
+            return config
+
+    config = ServerConfig(text)
+    _remember(text, config)
+    return config
@@ -0,0 +1,129 @@
+import base64
+import os
+
+# -----------------------------
+# X25519 (RFC 7748) — ключи, совместимые с `wg genkey` / `wg pubkey`
+# -----------------------------
+_P = 2**255 - 19
+_A24 = 121665
+_BASEPOINT = 9
+
+
+def _clamp(scalar: bytes) -> int:
+    k = bytearray(scalar)
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    return int.from_bytes(k, "little")
+
+
+def _x25519(scalar: int, u: int) -> int:
+    """Montgomery ladder из RFC 7748, раздел 5."""
+    x1 = u
+    x2, z2 = 1, 0
+    x3, z3 = u, 1
+    swap = 0
+
+    for t in reversed(range(255)):
+        bit = (scalar >> t) & 1
+        swap ^= bit
+        if swap:
+            x2, x3 = x3, x2
+            z2, z3 = z3, z2
+        swap = bit
+
+        a = x2 + z2
+        aa = a * a % _P
+        b = x2 - z2
+        bb = b * b % _P
+        e = aa - bb
+        c = x3 + z3
+        d = x3 - z3
+        da = d * a % _P
+        cb = c * b % _P
+        x3 = (da + cb) ** 2 % _P
+        z3 = x1 * (da - cb) ** 2 % _P
+        x2 = aa * bb % _P
+        z2 = e * (aa + _A24 * e) % _P
+
+    if swap:
+        x2, z2 = x3, z3
+
+    return x2 * pow(z2, _P - 2, _P) % _P
+
+
+def x25519(scalar: bytes, u: bytes) -> bytes:
+    """
+    Функция X25519: скаляр и u-координата — по 32 байта (little-endian).
+    """
+    if len(scalar) != 32 or len(u) != 32:
+        raise ValueError("X25519 ожидает 32-байтные входные данные")
+
+    u_int = int.from_bytes(u, "little") & ((1 << 255) - 1)
+    return _x25519(_clamp(scalar), u_int).to_bytes(32, "little")
+
+
+def _decode_key(key: str) -> bytes:
+    try:
+        raw = base64.b64decode(key.strip(), validate=True)
+    except ValueError:
+        raise ValueError("Ключ не является корректным base64")
+
+    if len(raw) != 32:
+        raise ValueError("Ключ должен содержать 32 байта")
+    return raw
+
+
+def check_key(key: str) -> str:
+    """
+    Проверяет формат ключа (base64, 32 байта) и возвращает его без
+    пробелов. Бросает ValueError на некорректном ключе.
+    """
+    _decode_key(key)
+    return key.strip()
+
+
+# -----------------------------
+# Генерация ключей
+# -----------------------------
+def generate_private_key() -> str:
+    """Аналог `wg genkey`: случайный 32-байтный ключ с clamping."""
+    k = bytearray(os.urandom(32))
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    return base64.b64encode(bytes(k)).decode()
+
+
+def generate_preshared_key() -> str:
+    """Аналог `wg genpsk`."""
+    return base64.b64encode(os.urandom(32)).decode()
+
+
+def public_key(private_key: str) -> str:
+    """
+    Аналог `wg pubkey`. Бросает ValueError на некорректном ключе.
+    """
+    raw = _decode_key(private_key)
+    pub = _x25519(_clamp(raw), _BASEPOINT).to_bytes(32, "little")
+    return base64.b64encode(pub).decode()
+
+
+# Публичные ключи серверов по имени сервера (бэкенда): (PrivateKey из
+# server.conf, публичный ключ). Пересчёт — только при смене ключа в
+# server.conf. Ключи клиентов не кешируются: их приватные ключи не должны
+# оставаться в памяти процесса.
+_server_keys: dict[str, tuple[str, str]] = {}
+
+
+def server_public_key(private_key: str, server: str = "") -> str:
+    cached = _server_keys.get(server)
+    if cached is None or cached[0] != private_key:
+        cached = (private_key, public_key(private_key))
+        _server_keys[server] = cached
+    return cached[1]
+
+
+def generate_keypair() -> tuple[str, str]:
+    key = generate_private_key()
+    return key, public_key(key)
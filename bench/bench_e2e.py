@@ -0,0 +1,139 @@
+"""
+Сквозные бенчмарки горячих путей на поддельном docker/wg (см. harness.py):
+add_client, пакет параллельных add_client, remove_client, /clients, /configs,
+блокировка пачки IP и цикл сборщика — при 100, 1k и 10k пиров. Для каждой операции выводится
+задержка и число вызовов docker (для блокировок — и команд firewall).
+
+Запуск из корня репозитория:
+    python bench/bench_e2e.py [--latency-ms 20] [--sizes 100,1000] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import FakeAwg, quiet  # noqa: E402
+
+REPEAT = 5
+BURST = 20
+BLOCK = 100
+
+
+async def measure(fake: FakeAwg, ops: int, fn, host: bool = False) -> dict:
+    fake.reset_calls()
+    with quiet():
+        start = time.perf_counter()
+        await fn()
+        elapsed = time.perf_counter() - start
+    calls = fake.calls(host=host)
+    return {
+        "ms_per_op": round(elapsed / ops * 1000, 2),
+        "calls_per_op": round(sum(calls.values()) / ops, 2),
+        "calls": dict(calls),
+    }
+
+
+async def run_size(fake: FakeAwg, peers: int) -> dict:
+    from starlette.requests import Request
+
+    from routers import wg
+    from services import awg_manager, blocklist, firewall_utils
+    from services.backends import get_backend
+    from services.stats import collector, database, snapshot
+
+    fake.seed(peers)
+    database.init_db()
+    # seed() сбрасывает и firewall: набор ipset и список создаются заново
+    blocklist.load()
+    firewall_utils._backend = None
+    firewall_utils._ipset_ready.clear()
+    results = {}
+
+    async def add_sequential():
+        for i in range(REPEAT):
+            await awg_manager.add_client(f"bench-add-{i}")
+
+    async def add_burst():
+        await asyncio.gather(
+            *[awg_manager.add_client(f"bench-burst-{i}") for i in range(BURST)]
+        )
+
+    async def remove_sequential():
+        for i in range(REPEAT):
+            await awg_manager.remove_client(f"peer{i}")
+
+    request = Request({"type": "http", "headers": []})
+
+    async def list_clients_cold():
+        for _ in range(REPEAT):
+            snapshot.invalidate(get_backend().name)
+            await wg.list_clients(request, user=None)
+
+    async def list_clients():
+        for _ in range(REPEAT):
+            await wg.list_clients(request, user=None)
+
+    async def get_configs():
+        for _ in range(REPEAT):
+            await wg.get_configs(backend=None, user=None)
+
+    async def block_unblock():
+        ips = [f"10.8.{(i + 2) >> 8}.{(i + 2) & 255}" for i in range(BLOCK)]
+        await awg_manager.block_client_ips(ips)
+        await awg_manager.unblock_client_ips(ips)
+
+    async def collect():
+        for _ in range(REPEAT):
+            await collector.collect_once()
+
+    results["add_client"] = await measure(fake, REPEAT, add_sequential)
+    results[f"add_client x{BURST} concurrent"] = await measure(fake, BURST, add_burst)
+    results["remove_client"] = await measure(fake, REPEAT, remove_sequential)
+    results["/clients (fresh dump)"] = await measure(fake, REPEAT, list_clients_cold)
+    results["/clients (cached)"] = await measure(fake, REPEAT, list_clients)
+    results["/configs"] = await measure(fake, REPEAT, get_configs)
+    results[f"block+unblock {BLOCK} IPs"] = await measure(
+        fake, 1, block_unblock, host=True
+    )
+    results["collector cycle"] = await measure(fake, REPEAT, collect)
+
+    database.close_db()
+    os.unlink(database.DB_PATH)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--sizes", default="100,1000,10000")
+    parser.add_argument("--json", action="store_true", help="вывод в JSON (для CI)")
+    args = parser.parse_args()
+
+    fake = FakeAwg(latency_ms=args.latency_ms)
+    report = {}
+    try:
+        for peers in (int(s) for s in args.sizes.split(",")):
+            report[peers] = asyncio.run(run_size(fake, peers))
+    finally:
+        fake.cleanup()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{'peers':>7}  {'operation':<30} {'ms/op':>9} {'calls/op':>9}")
+    for peers, results in report.items():
+        for name, r in results.items():
+            print(
+                f"{peers:>7}  {name:<30} {r['ms_per_op']:>9.2f} "
+                f"{r['calls_per_op']:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Скорость разбора `wg show dump` на синтетических дампах от 1k до 100k пиров.
+
+Запуск из корня репозитория:
+    python bench/bench_parser.py [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from services.stats.parser import DumpParser, parse_wg_dump  # noqa: E402
+
+SIZES = [1_000, 10_000, 50_000, 100_000]
+
+
+def make_dump(n: int, interface: str | None = None) -> str:
+    prefix = f"{interface}\t" if interface else ""
+    lines = [f"{prefix}cHJpdmF0ZQ==\tcHVibGlj\t51820\toff\t4\t10\t50\t133\t86"]
+    for i in range(n):
+        lines.append(
+            prefix
+            + "\t".join(
+                [
+                    f"{i:043d}=",
+                    "(none)" if i % 3 else f"{i:043x}=",
+                    (
+                        f"198.51.{i >> 8 & 255}.{i & 255}:{1024 + i % 60000}"
+                        if i % 5
+                        else "(none)"
+                    ),
+                    f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}/32",
+                    str(1790000000 + i) if i % 4 else "0",
+                    str(random.randrange(1 << 40)),
+                    str(random.randrange(1 << 40)),
+                    "25" if i % 7 == 0 else "off",
+                ]
+            )
+        )
+    return "\n".join(lines) + "\n"
+
+
+def bench(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def streamed(dump: str) -> int:
+    # как в сборщике: построчная подача, хранятся только записи
+    parser = DumpParser()
+    peers = []
+    for line in dump.splitlines(keepends=True):
+        record = parser.feed(line)
+        if record is not None:
+            peers.append(record)
+    return len(peers)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'peers':>8} {'parse ms':>10} {'stream ms':>10} {'us/peer':>9} {'MB':>7}")
+    for n in SIZES:
+        dump = make_dump(n)
+        assert len(parse_wg_dump(dump)) == n
+
+        parse_time = bench(lambda: parse_wg_dump(dump), args.repeat)
+        stream_time = bench(lambda: streamed(dump), args.repeat)
+
+        tracemalloc.start()
+        records = parse_wg_dump(dump)
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del records
+
+        print(
+            f"{n:>8} {parse_time * 1000:>10.1f} {stream_time * 1000:>10.1f} "
+            f"{stream_time / n * 1e6:>9.2f} {size / 2**20:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Стоимость одного цикла записи статистики (save_stats) при 1k, 10k и 50k пиров.
+
+Запуск из корня репозитория:
+    python bench/bench_stats_ingest.py [--cycles N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from services.stats import database  # noqa: E402
+from services.stats.parser import PeerRecord  # noqa: E402
+
+SIZES = [1_000, 10_000, 50_000]
+
+
+def make_peers(n: int) -> list[PeerRecord]:
+    return [
+        PeerRecord(
+            f"peer{i:08d}",
+            None,
+            None,
+            f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}/32",
+            0,
+            0,
+            0,
+            None,
+        )
+        for i in range(n)
+    ]
+
+
+def advance(peers: list[PeerRecord], now: int):
+    for i, p in enumerate(peers):
+        rx, tx = p.rx_bytes, p.tx_bytes
+        if random.random() < 0.001:
+            # перезапуск контейнера — счётчики сбросились
+            rx = tx = 0
+        peers[i] = p._replace(
+            rx_bytes=rx + random.randrange(1 << 20),
+            tx_bytes=tx + random.randrange(1 << 20),
+            latest_handshake=now if random.random() < 0.7 else 0,
+        )
+
+
+def run(n: int, cycles: int) -> list[float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = Path(tmp) / "stats.db"
+        database.init_db()
+
+        peers = make_peers(n)
+        # первый цикл — вставка всех пиров
+        database.save_stats(int(time.time()), peers)
+
+        timings = []
+        for _ in range(cycles):
+            now = int(time.time())
+            advance(peers, now)
+            start = time.perf_counter()
+            database.save_stats(now, peers)
+            timings.append(time.perf_counter() - start)
+
+        database.close_db()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cycles", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'peers':>8} {'min ms':>10} {'avg ms':>10} {'us/peer':>10}")
+    for n in SIZES:
+        timings = run(n, args.cycles)
+        avg = sum(timings) / len(timings)
+        print(
+            f"{n:>8} {min(timings) * 1000:>10.1f} {avg * 1000:>10.1f} "
+            f"{avg / n * 1e6:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Подмена docker / wg / wg-quick / iptables / ip6tables / ipset для бенчмарков.
+
+Один скрипт, поведение выбирается по имени, под которым он запущен
+(harness создаёт симлинки в каталоге shim). Файловая система контейнера —
+каталог FAKE_ROOT (по умолчанию в /dev/shm, т.е. в памяти).
+
+Переменные окружения:
+    FAKE_ROOT        корень «контейнера»
+    FAKE_SHIMS       каталог с симлинками (добавляется в PATH внутри exec)
+    FAKE_CALLS       файл, куда пишется по строке на каждый вызов docker
+                     и команд firewall на хосте (с префиксом host)
+    FAKE_LATENCY_MS  задержка каждого вызова docker, мс
+    FAKE_WG_CONF     путь server.conf внутри контейнера (для wg show)
+
+Несколько контейнеров: если есть каталог FAKE_ROOT/nodes/<ключ>, где ключ —
+имя контейнера (с docker -H <хост> — node_key(хост, контейнер)), корнем
+контейнера служит он, а вызовы пишутся в FAKE_CALLS с суффиксом @<ключ>.
+FAKE_HANG — ключи узлов через запятую, вызовы которых «зависают».
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+import zlib
+
+ROOT = os.environ.get("FAKE_ROOT", "/tmp/fake-awg")
+NODE = ""
+
+
+def node_key(docker_host: str, container: str) -> str:
+    if not docker_host:
+        return container
+    return "".join(c if c.isalnum() else "_" for c in docker_host) + "@" + container
+
+
+def host_path(path: str) -> str:
+    return ROOT + path if path.startswith("/opt/") else path
+
+
+def log_call(kind: str):
+    calls = os.environ.get("FAKE_CALLS")
+    if NODE:
+        kind = f"{kind}@{NODE}"
+    if calls:
+        # O_APPEND: короткие записи из параллельных процессов не перемешиваются
+        fd = os.open(calls, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(fd, f"{kind}\n".encode())
+        os.close(fd)
+
+
+# -----------------------------
+# docker
+# -----------------------------
+def _select_node(docker_host: str, container: str):
+    global ROOT, NODE
+    key = node_key(docker_host, container)
+    path = os.path.join(ROOT, "nodes", key)
+    if os.path.isdir(path):
+        ROOT, NODE = path, key
+        os.environ["FAKE_ROOT"] = path
+    if key in os.environ.get("FAKE_HANG", "").split(","):
+        time.sleep(3600)
+
+
+def docker(args: list[str]) -> int:
+    latency = float(os.environ.get("FAKE_LATENCY_MS", "0"))
+    if latency:
+        time.sleep(latency / 1000)
+
+    docker_host = ""
+    while args and args[0] == "-H":
+        docker_host, args = args[1], args[2:]
+
+    cmd = args[0]
+    if cmd == "cp":
+        src, dst = args[1], args[2]
+        remote = src if ":" in src else dst
+        _select_node(docker_host, remote.split(":", 1)[0])
+        log_call("cp_to" if ":" in dst else "cp_from")
+        src = host_path(src.split(":", 1)[1]) if ":" in src else src
+        dst = host_path(dst.split(":", 1)[1]) if ":" in dst else dst
+        # как docker cp: содержимое вместе с mtime
+        shutil.copy2(src, dst)
+        return 0
+
+    if cmd == "restart":
+        _select_node(docker_host, args[1])
+        log_call("restart")
+        return 0
+
+    if cmd == "exec":
+        rest = args[1:]
+        while rest and rest[0].startswith("-"):
+            rest = rest[1:]
+        inner = rest[1:]
+        _select_node(docker_host, rest[0])
+        log_call(f"exec {inner[0]}")
+
+        if inner[0] == "cat":
+            try:
+                with open(host_path(inner[1]), "rb") as f:
+                    sys.stdout.buffer.write(f.read())
+            except FileNotFoundError:
+                print(f"cat: {inner[1]}: No such file or directory", file=sys.stderr)
+                return 1
+            return 0
+
+        env = dict(os.environ)
+        env["PATH"] = os.environ["FAKE_SHIMS"] + ":" + env.get("PATH", "")
+        return subprocess.call([host_path(a) for a in inner], env=env)
+
+    print(f"fake docker: unsupported command {cmd}", file=sys.stderr)
+    return 1
+
+
+# -----------------------------
+# wg / wg-quick
+# -----------------------------
+def _peers(conf_path: str):
+    public_key, allowed = None, ""
+    with open(host_path(conf_path)) as f:
+        for line in f:
+            line = line.strip()
+            if line.lower() == "[peer]":
+                if public_key:
+                    yield public_key, allowed
+                public_key, allowed = None, ""
+            elif "=" in line:
+                key, value = (s.strip() for s in line.split("=", 1))
+                if key == "PublicKey":
+                    public_key = value
+                elif key == "AllowedIPs":
+                    allowed = value.replace(" ", "")
+    if public_key:
+        yield public_key, allowed
+
+
+def wg(args: list[str]) -> int:
+    if args and args[0] == "show":
+        conf = os.environ.get("FAKE_WG_CONF", "/opt/amnezia/awg/wg0.conf")
+        now = int(time.time())
+        iface = args[1] if len(args) > 1 else "awg0"
+
+        out = []
+        if args[-1] == "dump":
+            out.append("cHJpdmF0ZQ==\tcHVibGlj\t51820\toff")
+            for pk, allowed in _peers(conf):
+                seed = zlib.crc32(pk.encode())
+                out.append(
+                    f"{pk}\t(none)\t198.51.100.{seed % 250}:{1024 + seed % 60000}"
+                    f"\t{allowed}\t{now - seed % 300}\t{seed % 4096 * now}"
+                    f"\t{seed % 1024 * now}\toff"
+                )
+        else:
+            out.append(f"interface: {iface}\n  listening port: 51820\n")
+            for pk, allowed in _peers(conf):
+                out.append(f"peer: {pk}\n  allowed ips: {allowed}\n")
+        sys.stdout.write("\n".join(out) + "\n")
+        return 0
+
+    # wg set и прочее — интерфейс не моделируется
+    return 0
+
+
+def wg_quick(args: list[str]) -> int:
+    if args and args[0] == "strip":
+        with open(host_path(args[1])) as f:
+            for line in f:
+                key = line.split("=", 1)[0].strip()
+                if key not in ("Address", "DNS", "MTU", "PostUp", "PostDown"):
+                    sys.stdout.write(line)
+    return 0
+
+
+# -----------------------------
+# iptables (правила в файле FAKE_ROOT/iptables.rules, ip6tables — в
+# FAKE_ROOT/ip6tables.rules)
+# -----------------------------
+def _table() -> str:
+    name = os.path.basename(sys.argv[0])
+    return "ip6tables" if name.startswith("ip6tables") else "iptables"
+
+
+def _rules_path() -> str:
+    return os.path.join(ROOT, f"{_table()}.rules")
+
+
+def _load_rules() -> list[str]:
+    try:
+        with open(_rules_path()) as f:
+            return [line.rstrip("\n") for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def _save_rules(rules: list[str]):
+    with open(_rules_path(), "w") as f:
+        f.write("".join(r + "\n" for r in rules))
+
+
+def _normalize(rule: list[str]) -> str:
+    # iptables-save выводит адрес с маской
+    rule = list(rule)
+    if "-s" in rule:
+        i = rule.index("-s") + 1
+        if "/" not in rule[i]:
+            rule[i] += "/128" if ":" in rule[i] else "/32"
+    return " ".join(rule)
+
+
+def _apply(rules: list[str], parts: list[str]):
+    op = parts[0]
+    if op == "-I":
+        # -I CHAIN [N] rule...
+        rest = parts[2:]
+        if rest and rest[0].isdigit():
+            rest = rest[1:]
+        rules.insert(0, _normalize([parts[1]] + rest))
+    elif op == "-A":
+        rules.append(_normalize(parts[1:]))
+    elif op == "-D":
+        rule = _normalize(parts[1:])
+        if rule in rules:
+            rules.remove(rule)
+
+
+def iptables(args: list[str]) -> int:
+    log_call(f"host iptables {args[0]}")
+    op, rule = args[0], _normalize(args[1:])
+    rules = _load_rules()
+    if op == "-C":
+        return 0 if rule in rules else 1
+    if op == "-A":
+        rules.append(rule)
+    elif op == "-D":
+        if rule not in rules:
+            return 1
+        rules.remove(rule)
+    _save_rules(rules)
+    return 0
+
+
+def iptables_save(args: list[str]) -> int:
+    log_call(f"host {_table()}-save")
+    sys.stdout.write("*filter\n")
+    for rule in _load_rules():
+        sys.stdout.write(f"-A {rule}\n")
+    sys.stdout.write("COMMIT\n")
+    return 0
+
+
+def iptables_restore(args: list[str]) -> int:
+    log_call(f"host {_table()}-restore")
+    rules = _load_rules()
+    for line in sys.stdin:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0] in ("-A", "-I", "-D"):
+            _apply(rules, parts)
+    _save_rules(rules)
+    return 0
+
+
+# -----------------------------
+# ipset (набор — файл FAKE_ROOT/ipset.<имя>, по адресу в строке)
+# -----------------------------
+def _set_path(name: str) -> str:
+    return os.path.join(ROOT, f"ipset.{name}")
+
+
+def _load_set(name: str) -> set[str]:
+    with open(_set_path(name)) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def _save_set(name: str, members: set[str]):
+    with open(_set_path(name), "w") as f:
+        f.write("".join(m + "\n" for m in sorted(members)))
+
+
+def ipset(args: list[str]) -> int:
+    log_call(f"host ipset {args[0]}")
+    cmd = args[0]
+
+    if cmd == "create":
+        if not os.path.exists(_set_path(args[1])):
+            _save_set(args[1], set())
+        return 0
+
+    if cmd == "restore":
+        sets: dict[str, set[str]] = {}
+        for line in sys.stdin:
+            parts = line.split()
+            if len(parts) < 3 or parts[0] not in ("add", "del"):
+                continue
+            members = sets.setdefault(parts[1], _load_set(parts[1]))
+            if parts[0] == "add":
+                members.add(parts[2])
+            else:
+                members.discard(parts[2])
+        for name, members in sets.items():
+            _save_set(name, members)
+        return 0
+
+    if cmd == "list":
+        name = args[-1]
+        members = _load_set(name)
+        print(f"Name: {name}\nType: hash:ip\nNumber of entries: {len(members)}")
+        if "-t" not in args:
+            print("Members:")
+            for m in sorted(members):
+                print(m)
+        return 0
+
+    print(f"fake ipset: unsupported command {cmd}", file=sys.stderr)
+    return 1
+
+
+COMMANDS = {
+    "docker": docker,
+    "wg": wg,
+    "wg-quick": wg_quick,
+    "iptables": iptables,
+    "iptables-save": iptables_save,
+    "iptables-restore": iptables_restore,
+    "ip6tables-save": iptables_save,
+    "ip6tables-restore": iptables_restore,
+    "ipset": ipset,
+}
+
+
+if __name__ == "__main__":
+    name = os.path.basename(sys.argv[0])
+    sys.exit(COMMANDS[name](sys.argv[1:]))
@@ -0,0 +1,204 @@
+"""
+Окружение для сквозных бенчмарков: поддельный docker/wg (fake_docker.py)
+с файловой системой контейнера в памяти и счётчиком вызовов.
+
+    fake = FakeAwg(latency_ms=20)   # до импорта модулей приложения
+    fake.seed(1000)
+    ...
+    fake.calls()  # Counter по видам вызовов docker
+"""
+
+import base64
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BENCH_DIR, "..", "app")
+
+CONTAINER = "amnezia-awg"
+WG_CONF = "/opt/amnezia/awg/wg0.conf"
+CLIENTS_TABLE = "/opt/amnezia/awg/clientsTable"
+
+AWG_PARAMS = {
+    "Jc": 4,
+    "Jmin": 10,
+    "Jmax": 50,
+    "S1": 133,
+    "S2": 86,
+    "H1": 1020325451,
+    "H2": 3288052141,
+    "H3": 1766607858,
+    "H4": 2109233507,
+}
+
+SHIMS = [
+    "docker",
+    "wg",
+    "wg-quick",
+    "iptables",
+    "iptables-save",
+    "iptables-restore",
+    "ip6tables-save",
+    "ip6tables-restore",
+    "ipset",
+]
+
+
+class FakeAwg:
+    def __init__(self, latency_ms: float = 0):
+        base = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        self.root = tempfile.mkdtemp(prefix="fake-awg-", dir=base)
+        self.shims = os.path.join(self.root, "shims")
+        self.work = os.path.join(self.root, "work")
+        self.calls_log = os.path.join(self.root, "calls.log")
+        os.makedirs(os.path.join(self.root, "opt/amnezia/awg"))
+        os.makedirs(self.shims)
+        os.makedirs(self.work)
+
+        # копия скрипта с интерпретатором текущего окружения; -S ускоряет старт
+        script = os.path.join(self.shims, "fake_docker.py")
+        with open(os.path.join(BENCH_DIR, "fake_docker.py")) as src:
+            body = src.read()
+        with open(script, "w") as f:
+            f.write(f"#!{sys.executable} -S\n{body}")
+        os.chmod(script, 0o755)
+        for name in SHIMS:
+            os.symlink(script, os.path.join(self.shims, name))
+
+        with open(os.path.join(self.work, "awg_params.json"), "w") as f:
+            json.dump(AWG_PARAMS, f)
+
+        os.environ.update(
+            {
+                "FAKE_ROOT": self.root,
+                "FAKE_SHIMS": self.shims,
+                "FAKE_CALLS": self.calls_log,
+                "FAKE_LATENCY_MS": str(latency_ms),
+                "FAKE_WG_CONF": WG_CONF,
+                "PATH": self.shims + ":" + os.environ.get("PATH", ""),
+                "JWT_SECRET": "bench",
+                "ENDPOINT": "vpn.example.com",
+                "WG_CONFIG_FILE": WG_CONF,
+                "CLIENTS_TABLE_PATH": CLIENTS_TABLE,
+                "DOCKER_CONTAINER": CONTAINER,
+                "DOCKER_BIN": os.path.join(self.shims, "docker"),
+                "DOCKER_BACKEND": "cli",
+                "WG_SUBNET": "10.8.0.0/16",
+            }
+        )
+
+        # users/, files/ и stats.db приложение создаёт в текущем каталоге
+        os.chdir(self.work)
+        if APP_DIR not in sys.path:
+            sys.path.insert(0, APP_DIR)
+
+    def add_node(self, container: str, docker_host: str = "") -> str:
+        """
+        Ещё один «контейнер» (для нескольких бэкендов). Возвращает ключ
+        узла для seed(node=...), host_path(node=...) и суффикса в calls().
+        """
+        key = node_key(docker_host, container)
+        os.makedirs(os.path.join(self.root, "nodes", key, "opt/amnezia/awg"))
+        return key
+
+    def seed(self, peers: int, node: str | None = None, net: str = "10.8"):
+        """
+        server.conf и clientsTable с заданным числом пиров; node — узел
+        из add_node, net — первые два октета адресов пиров.
+        """
+        from services import wg_keys
+
+        lines = [
+            "[Interface]\n",
+            f"PrivateKey = {wg_keys.generate_private_key()}\n",
+            f"Address = {net}.0.1/16\n",
+            "ListenPort = 51820\n",
+        ]
+        lines += [f"{k} = {v}\n" for k, v in AWG_PARAMS.items()]
+        lines.append("\n")
+
+        table = []
+        for i in range(peers):
+            pub = base64.b64encode(os.urandom(32)).decode()
+            psk = base64.b64encode(os.urandom(32)).decode()
+            ip = f"{net}.{(i + 2) >> 8}.{(i + 2) & 255}/32"
+            lines += [
+                "[Peer]\n",
+                f"# {node or 'peer'}{i}\n",
+                f"PublicKey = {pub}\n",
+                f"PresharedKey = {psk}\n",
+                f"AllowedIPs = {ip}\n",
+                "\n",
+            ]
+            table.append(
+                {
+                    "clientId": pub,
+                    "userData": {
+                        "clientName": f"{node or 'peer'}{i}",
+                        "creationDate": "2024-01-01 00:00:00",
+                    },
+                }
+            )
+
+        with open(self.host_path(WG_CONF, node), "w") as f:
+            f.write("".join(lines))
+        with open(self.host_path(CLIENTS_TABLE, node), "w") as f:
+            json.dump(table, f, indent=4)
+        if node:
+            return
+        for name in os.listdir(self.root):
+            if name.endswith("tables.rules") or name.startswith("ipset."):
+                os.unlink(os.path.join(self.root, name))
+        shutil.rmtree(os.path.join(self.work, "users"), ignore_errors=True)
+        self.reset_calls()
+
+    def host_path(self, path: str, node: str | None = None) -> str:
+        if node:
+            return os.path.join(self.root, "nodes", node) + path
+        return self.root + path
+
+    def reset_calls(self):
+        with open(self.calls_log, "w"):
+            pass
+
+    def calls(self, host: bool = False) -> Counter:
+        """
+        Вызовы docker по видам; host=True — также команды firewall на хосте
+        (iptables, ipset).
+        """
+        with open(self.calls_log) as f:
+            return Counter(
+                line.strip()
+                for line in f
+                if line.strip() and (host or not line.startswith("host "))
+            )
+
+    def host_commands(self) -> Counter:
+        """Только команды firewall на хосте."""
+        calls = self.calls(host=True)
+        return Counter({k: v for k, v in calls.items() if k.startswith("host ")})
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def node_key(docker_host: str, container: str) -> str:
+    # как в fake_docker.node_key
+    if not docker_host:
+        return container
+    return "".join(c if c.isalnum() else "_" for c in docker_host) + "@" + container
+
+
+@contextlib.contextmanager
+def quiet():
+    """Глушит логи приложения на время замера."""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(
+        io.StringIO()
+    ):
+        yield
@@ -0,0 +1,14 @@
+import os
+import sys
+
+# модули приложения импортируются от app/, как при запуске uvicorn из app/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+# обязательные настройки (core.config) — чтобы модули импортировались без .env
+for key, value in {
+    "JWT_SECRET": "test",
+    "ENDPOINT": "vpn.example.com",
+    "WG_CONFIG_FILE": "/opt/amnezia/awg/wg0.conf",
+    "DOCKER_CONTAINER": "amnezia-awg",
+}.items():
+    os.environ.setdefault(key, value)
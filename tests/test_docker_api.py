@@ -0,0 +1,248 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import socketserver
+import subprocess
+import tarfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from core.config import settings
+from services import docker_utils
+from services.docker_api import DockerApiBackend
+
+# -----------------------------
+# Подмена dockerd на unix-сокете
+# -----------------------------
+# Понимает запросы, которые делает DockerApiBackend: exec (create / start /
+# inspect), архивы (get / put) и restart. Файловая система «контейнера» —
+# файловая система хоста, exec запускает команду здесь же.
+
+
+class FakeDockerd(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str):
+        super().__init__(path, DockerdHandler)
+        self.execs: dict[str, list[str]] = {}
+        self.exit_codes: dict[str, int] = {}
+        self.requests: list[tuple[str, str]] = []
+
+
+class DockerdHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeDockerd
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _reply(self, code: int, body: bytes = b"", ctype="application/json"):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, data, code: int = 200):
+        self._reply(code, json.dumps(data).encode())
+
+    def _route(self) -> tuple[list[str], dict]:
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        # /v1.xx/... → без версии
+        if parts and parts[0].startswith("v1."):
+            parts = parts[1:]
+        self.server.requests.append((self.command, "/".join(parts)))
+        return parts, {k: v[0] for k, v in parse_qs(url.query).items()}
+
+    def do_HEAD(self):
+        self._route()
+        self._reply(200)
+
+    def do_GET(self):
+        parts, query = self._route()
+        if parts == ["version"]:
+            return self._json({"ApiVersion": "1.44", "Version": "fake"})
+        if parts == ["_ping"]:
+            return self._reply(200, b"OK", "text/plain")
+        if parts[0] == "exec" and parts[2] == "json":
+            return self._json({"ExitCode": self.server.exit_codes[parts[1]]})
+        if parts[0] == "containers" and parts[2] == "archive":
+            return self._get_archive(query["path"])
+        self._json({"message": "not found"}, 404)
+
+    def do_PUT(self):
+        parts, query = self._route()
+        if parts[0] == "containers" and parts[2] == "archive":
+            with tarfile.open(fileobj=io.BytesIO(self._body())) as tar:
+                tar.extractall(query["path"], filter="tar")
+            return self._reply(200)
+        self._json({"message": "not found"}, 404)
+
+    def do_POST(self):
+        parts, _ = self._route()
+        body = self._body()
+        if parts[0] == "containers" and parts[2] == "exec":
+            exec_id = uuid.uuid4().hex
+            self.server.execs[exec_id] = json.loads(body)["Cmd"]
+            return self._json({"Id": exec_id}, 201)
+        if parts[0] == "exec" and parts[2] == "start":
+            return self._exec_start(parts[1])
+        if parts[0] == "containers" and parts[2] == "restart":
+            return self._reply(204)
+        self._json({"message": "not found"}, 404)
+
+    def _exec_start(self, exec_id: str):
+        cmd = self.server.execs[exec_id]
+        proc = subprocess.run(
+            ["sh", "-c", cmd] if isinstance(cmd, str) else cmd,
+            capture_output=True,
+        )
+        self.server.exit_codes[exec_id] = proc.returncode
+
+        # мультиплексированный поток: заголовок из 8 байт на кадр
+        # (1 — stdout, 2 — stderr), соединение закрывается в конце
+        frames = b""
+        for stream, data in ((1, proc.stdout), (2, proc.stderr)):
+            if data:
+                frames += bytes([stream, 0, 0, 0]) + len(data).to_bytes(4, "big")
+                frames += data
+        upgrade = self.headers.get("Upgrade") == "tcp"
+        self.send_response(101 if upgrade else 200)
+        self.send_header("Content-Type", "application/vnd.docker.raw-stream")
+        self.send_header("Connection", "Upgrade" if upgrade else "close")
+        if upgrade:
+            self.send_header("Upgrade", "tcp")
+        self.end_headers()
+        # Клиент читает поток с сырого сокета после разбора заголовков:
+        # данные, пришедшие вместе с заголовками, осели бы в буфере
+        # http.client. Настоящий dockerd тоже пишет вывод позже.
+        time.sleep(0.05)
+        self.wfile.write(frames)
+        self.close_connection = True
+
+    def _get_archive(self, path: str):
+        if not os.path.exists(path):
+            return self._json({"message": "no such file"}, 404)
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            tar.add(path, arcname=os.path.basename(path))
+        stat = {"name": os.path.basename(path), "size": os.path.getsize(path)}
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-tar")
+        self.send_header(
+            "X-Docker-Container-Path-Stat",
+            base64.b64encode(json.dumps(stat).encode()).decode(),
+        )
+        self.send_header("Content-Length", str(buf.tell()))
+        self.end_headers()
+        self.wfile.write(buf.getvalue())
+
+
+@pytest.fixture
+def dockerd(tmp_path):
+    path = str(tmp_path / "docker.sock")
+    server = FakeDockerd(path)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server, f"unix://{path}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def api(dockerd) -> DockerApiBackend:
+    _, url = dockerd
+    return DockerApiBackend(url, timeout=10)
+
+
+def test_exec(api):
+    assert api.exec("awg", ["echo", "hello"]) == "hello\n"
+
+
+def test_exec_error(api):
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        api.exec("awg", ["sh", "-c", "echo out; echo oops >&2; exit 3"])
+    assert e.value.returncode == 3
+    assert e.value.output == "out\n"
+    assert e.value.stderr == "oops\n"
+
+
+def test_exec_stdin(api, dockerd):
+    server, _ = dockerd
+    data = "line 1\nline 2\n" * 1000
+
+    assert api.exec("awg", "cat", input=data) == data
+
+    # stdin передан файлом через put_archive и удалён после exec
+    puts = [p for m, p in server.requests if m == "PUT"]
+    assert puts == ["containers/awg/archive"]
+    assert not [f for f in os.listdir("/tmp") if f.startswith(".awg-api-stdin-")]
+
+
+def test_archive_round_trip(api, tmp_path):
+    src = tmp_path / "src.conf"
+    src.write_text("[Interface]\nPrivateKey = x\n")
+    src.chmod(0o600)
+    os.utime(src, (1700000000, 1700000000))
+    (tmp_path / "container").mkdir()
+    remote = str(tmp_path / "container" / "wg0.conf")
+
+    api.copy_to("awg", str(src), remote)
+
+    # права и mtime сохраняются, как у docker cp
+    st = os.stat(remote)
+    assert st.st_mode & 0o777 == 0o600
+    assert int(st.st_mtime) == 1700000000
+
+    dst = tmp_path / "back.conf"
+    api.copy_from("awg", remote, str(dst))
+    assert dst.read_text() == src.read_text()
+
+
+def test_copy_from_missing_file(api, tmp_path):
+    with pytest.raises(subprocess.CalledProcessError):
+        api.copy_from("awg", str(tmp_path / "missing"), str(tmp_path / "out"))
+
+
+def test_restart(api, dockerd):
+    server, _ = dockerd
+    api.restart("awg")
+    assert ("POST", "containers/awg/restart") in server.requests
+
+
+def test_get_api_retries_after_backoff(dockerd, tmp_path, monkeypatch):
+    _, url = dockerd
+    down = f"unix://{tmp_path / 'down.sock'}"
+    monkeypatch.setattr(settings, "DOCKER_BACKEND", "api")
+    monkeypatch.setattr(docker_utils, "_api_backends", {})
+    monkeypatch.setattr(docker_utils, "_api_unavailable", {})
+    monkeypatch.setattr(docker_utils, "_targets", {})
+    docker_utils.register_container("node", "awg", down)
+
+    # dockerd недоступен — CLI и пауза до следующей попытки
+    api, name = asyncio.run(docker_utils._get_api("node"))
+    assert api is None and name == "awg"
+    failures, retry_at = docker_utils._api_unavailable[down]
+    assert failures == 1
+
+    # dockerd поднялся на том же адресе; до конца паузы — всё ещё CLI
+    os.symlink(url.removeprefix("unix://"), down.removeprefix("unix://"))
+    assert asyncio.run(docker_utils._get_api("node"))[0] is None
+
+    # пауза прошла — API подключается снова
+    docker_utils._api_unavailable[down] = (failures, 0.0)
+    api, name = asyncio.run(docker_utils._get_api("node"))
+    assert isinstance(api, DockerApiBackend) and name == "awg"
+    assert down not in docker_utils._api_unavailable
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+from core.config import settings
+from services import backends, blocklist, firewall_utils
+from services.stats import database
+
+# Подмена iptables / ip6tables / ipset: пишет в лог по JSON-строке на вызов
+# (аргументы и stdin); iptables-save выводит правила из FIREWALL_STUB_RULES
+# (ip6tables-save — пустую таблицу filter), ipset list — пустой набор.
+STUB = """\
+import json, os, sys
+
+name = os.path.basename(sys.argv[0])
+args = sys.argv[1:]
+stdin = sys.stdin.read() if "restore" in name or "restore" in args else None
+with open(os.environ["FIREWALL_STUB_LOG"], "a") as f:
+    f.write(json.dumps({"cmd": [name] + args, "stdin": stdin}) + "\\n")
+
+if name.endswith("-save"):
+    rules = os.environ.get("FIREWALL_STUB_RULES", "") if name == "iptables-save" else ""
+    print("*filter\\n" + rules + "COMMIT")
+elif name == "ipset" and args[0] == "list":
+    print("Name: " + args[-1] + "\\nMembers:")
+"""
+
+TOOLS = [
+    "ipset",
+    "iptables-save",
+    "iptables-restore",
+    "ip6tables-save",
+    "ip6tables-restore",
+]
+
+
+@pytest.fixture
+def firewall(tmp_path, monkeypatch):
+    """Каталог с подменёнными командами в PATH и чистая БД блокировок."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "stub.py"
+    script.write_text(f"#!{sys.executable}\n{STUB}")
+    script.chmod(0o755)
+    for tool in TOOLS:
+        os.symlink(script, bin_dir / tool)
+
+    log = tmp_path / "calls.log"
+    monkeypatch.setenv("FIREWALL_STUB_LOG", str(log))
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setattr(settings, "FIREWALL_IPSET", "awg-blocked")
+
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "stats.db")
+    monkeypatch.setattr(database, "_conn", None)
+    database.init_db()
+    blocklist.load()
+
+    # один бэкенд с подсетью клиентов 10.8.0.0/24
+    monkeypatch.setattr(backends, "_backends", None)
+    monkeypatch.setattr(settings, "AWG_BACKENDS", [])
+    monkeypatch.setattr(settings, "WG_SUBNET", "10.8.0.0/24")
+
+    monkeypatch.setattr(firewall_utils, "_backend", None)
+    monkeypatch.setattr(firewall_utils, "_ipset_ready", set())
+    monkeypatch.setattr(firewall_utils, "_backend_lock", asyncio.Lock())
+
+    def calls() -> list[dict]:
+        if not log.exists():
+            return []
+        return [json.loads(line) for line in log.read_text().splitlines()]
+
+    yield calls
+    database.get_conn().close()
+
+
+def restores(calls: list[dict], tool: str) -> list[str]:
+    return [c["stdin"] for c in calls if c["cmd"][0] == tool and c["stdin"]]
+
+
+def test_ipset_block_splits_families(firewall, monkeypatch):
+    monkeypatch.setattr(settings, "FIREWALL_BACKEND", "ipset")
+
+    asyncio.run(firewall_utils.block_ips(["10.8.0.2/32", "fd42::2/128", "10.8.0.3"]))
+
+    calls = firewall()
+    creates = [c["cmd"] for c in calls if c["cmd"][:2] == ["ipset", "create"]]
+    assert creates == [
+        ["ipset", "create", "awg-blocked", "hash:ip", "family", "inet", "-exist"],
+        ["ipset", "create", "awg-blocked6", "hash:ip", "family", "inet6", "-exist"],
+    ]
+
+    # правила --match-set: IPv4 — в iptables, IPv6 — в ip6tables
+    assert restores(calls, "iptables-restore") == [
+        "*filter\n"
+        "-I INPUT 1 -m set --match-set awg-blocked src -j DROP\n"
+        "-I FORWARD 1 -m set --match-set awg-blocked src -j DROP\n"
+        "COMMIT\n"
+    ]
+    assert restores(calls, "ip6tables-restore") == [
+        "*filter\n"
+        "-I INPUT 1 -m set --match-set awg-blocked6 src -j DROP\n"
+        "-I FORWARD 1 -m set --match-set awg-blocked6 src -j DROP\n"
+        "COMMIT\n"
+    ]
+
+    # все адреса — одним ipset restore, каждый в набор своего семейства
+    assert restores(calls, "ipset") == [
+        "add awg-blocked 10.8.0.2\nadd awg-blocked 10.8.0.3\nadd awg-blocked6 fd42::2\n"
+    ]
+    assert blocklist.blocked_ips() == {"10.8.0.2", "10.8.0.3", "fd42::2"}
+
+
+def test_ipset_unblock(firewall, monkeypatch):
+    monkeypatch.setattr(settings, "FIREWALL_BACKEND", "ipset")
+    asyncio.run(firewall_utils.block_ips(["10.8.0.2", "fd42::2"]))
+    before = len(firewall())
+
+    asyncio.run(firewall_utils.unblock_ips(["10.8.0.2", "fd42::2", "10.8.0.9"]))
+
+    calls = firewall()[before:]
+    # наборы уже созданы — только один restore
+    assert [c["cmd"] for c in calls] == [["ipset", "restore", "-exist"]]
+    assert calls[0]["stdin"] == "del awg-blocked 10.8.0.2\ndel awg-blocked6 fd42::2\n"
+    assert blocklist.blocked_ips() == set()
+
+
+def test_ipset_ipv4_only_does_not_touch_ip6tables(firewall, monkeypatch):
+    monkeypatch.setattr(settings, "FIREWALL_BACKEND", "ipset")
+
+    asyncio.run(firewall_utils.block_ips(["10.8.0.2"]))
+
+    assert not [c for c in firewall() if c["cmd"][0].startswith("ip6tables")]
+
+
+def test_iptables_block_and_unblock(firewall, monkeypatch):
+    monkeypatch.setattr(settings, "FIREWALL_BACKEND", "iptables")
+
+    asyncio.run(firewall_utils.block_ips(["10.8.0.2", "fd42::2"]))
+    asyncio.run(firewall_utils.unblock_ips(["10.8.0.2", "fd42::2"]))
+
+    calls = firewall()
+    assert not [c for c in calls if c["cmd"][0] == "ipset"]
+    assert restores(calls, "iptables-restore") == [
+        "*filter\n"
+        "-A INPUT -s 10.8.0.2 -j DROP\n"
+        "-A FORWARD -s 10.8.0.2 -j DROP\n"
+        "COMMIT\n",
+        "*filter\n"
+        "-D INPUT -s 10.8.0.2 -j DROP\n"
+        "-D FORWARD -s 10.8.0.2 -j DROP\n"
+        "COMMIT\n",
+    ]
+    assert restores(calls, "ip6tables-restore") == [
+        "*filter\n"
+        "-A INPUT -s fd42::2 -j DROP\n"
+        "-A FORWARD -s fd42::2 -j DROP\n"
+        "COMMIT\n",
+        "*filter\n"
+        "-D INPUT -s fd42::2 -j DROP\n"
+        "-D FORWARD -s fd42::2 -j DROP\n"
+        "COMMIT\n",
+    ]
+
+
+def test_already_blocked_skips_firewall(firewall, monkeypatch):
+    monkeypatch.setattr(settings, "FIREWALL_BACKEND", "iptables")
+    asyncio.run(firewall_utils.block_ips(["10.8.0.2"]))
+    before = len(firewall())
+
+    asyncio.run(firewall_utils.block_ips(["10.8.0.2/32"]))
+
+    assert len(firewall()) == before
+
+
+def test_reconcile_restores_both_families(firewall, monkeypatch):
+    monkeypatch.setattr(settings, "FIREWALL_BACKEND", "iptables")
+    conn = database.get_conn()
+    with conn:
+        conn.executemany(
+            "INSERT INTO blocked_ips (ip, blocked_at) VALUES (?, 0)",
+            [("10.8.0.2",), ("fd42::2",)],
+        )
+
+    asyncio.run(firewall_utils.reconcile_blocklist())
+
+    calls = firewall()
+    assert restores(calls, "iptables-restore") == [
+        "*filter\n"
+        "-A INPUT -s 10.8.0.2 -j DROP\n"
+        "-A FORWARD -s 10.8.0.2 -j DROP\n"
+        "COMMIT\n"
+    ]
+    assert restores(calls, "ip6tables-restore") == [
+        "*filter\n"
+        "-A INPUT -s fd42::2 -j DROP\n"
+        "-A FORWARD -s fd42::2 -j DROP\n"
+        "COMMIT\n"
+    ]
+
+
+# правила администратора: сеть и хост вне подсетей клиентов
+ADMIN_RULES = (
+    "-A INPUT -s 203.0.113.0/24 -j DROP\n" "-A FORWARD -s 198.51.100.7/32 -j DROP\n"
+)
+
+
+def test_parse_drop_rules_only_hosts():
+    rules = ADMIN_RULES + (
+        "-A INPUT -s 10.8.0.2/32 -j DROP\n-A INPUT -s fd42::2/128 -j DROP\n"
+    )
+    assert [ip for _, ip, _ in firewall_utils._parse_drop_rules(rules)] == [
+        "198.51.100.7",
+        "10.8.0.2",
+        "fd42::2",
+    ]
+
+
+def test_ipset_migration_leaves_admin_rules(firewall, monkeypatch):
+    monkeypatch.setattr(settings, "FIREWALL_BACKEND", "ipset")
+    monkeypatch.setenv(
+        "FIREWALL_STUB_RULES",
+        ADMIN_RULES + "-A INPUT -s 10.8.0.2/32 -j DROP\n",
+    )
+
+    asyncio.run(firewall_utils.get_backend())
+
+    calls = firewall()
+    # в набор переносится только блокировка клиента
+    assert restores(calls, "ipset") == ["add awg-blocked 10.8.0.2\n"]
+    assert restores(calls, "iptables-restore") == [
+        "*filter\n"
+        "-I INPUT 1 -m set --match-set awg-blocked src -j DROP\n"
+        "-I FORWARD 1 -m set --match-set awg-blocked src -j DROP\n"
+        "-D INPUT -s 10.8.0.2/32 -j DROP\n"
+        "COMMIT\n"
+    ]
+
+
+def test_reconcile_ignores_admin_rules(firewall, monkeypatch):
+    monkeypatch.setattr(settings, "FIREWALL_BACKEND", "iptables")
+    monkeypatch.setenv(
+        "FIREWALL_STUB_RULES",
+        ADMIN_RULES
+        + "-A INPUT -s 10.8.0.3/32 -j DROP\n-A FORWARD -s 10.8.0.3/32 -j DROP\n",
+    )
+
+    asyncio.run(firewall_utils.reconcile_blocklist())
+
+    # 10.8.0.3 — клиент, заблокированный до появления списка, — в список;
+    # правила администратора — нет, и iptables не меняется
+    assert blocklist.blocked_ips() == {"10.8.0.3"}
+    assert restores(firewall(), "iptables-restore") == []
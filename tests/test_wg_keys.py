@@ -0,0 +1,87 @@
+import base64
+
+import pytest
+
+from services import wg_keys
+
+# Тестовые векторы RFC 7748
+ALICE_PRIVATE = "77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a"
+ALICE_PUBLIC = "8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a"
+BOB_PRIVATE = "5dab087e624a8a4b79e17f8b83800ee66f3bb1292618b6fd1c2f8b27ff88e0eb"
+BOB_PUBLIC = "de9edb7d7b7dc1b4d35b61c2ece435373f8343c85b78674dadfc7e146f882b4f"
+SHARED = "4a5d9d5ba4ce2de1728e3bf480350f25e07e21c947d19e3376f09b3c1e161742"
+
+
+def b64(hex_key: str) -> str:
+    return base64.b64encode(bytes.fromhex(hex_key)).decode()
+
+
+@pytest.mark.parametrize(
+    "scalar, u, out",
+    [
+        (
+            "a546e36bf0527c9d3b16154b82465edd62144c0ac1fc5a18506a2244ba449ac4",
+            "e6db6867583030db3594c1a424b15f7c726624ec26b3353b10a903a6d0ab1c4c",
+            "c3da55379de9c6908e94ea4df28d084f32eccf03491c71f754b4075577a28552",
+        ),
+        (
+            "4b66e9d4d1b4673c5ad22691957d6af5c11b6421e0ea01d42ca4169e7918ba0d",
+            "e5210f12786811d3f4b7959d0538ae2c31dbe7106fc03c3efc4cd549c715a493",
+            "95cbde9476e8907d7aade45cb4b873f88b595a68799fa152e6f8f7647aac7957",
+        ),
+    ],
+)
+def test_x25519_vectors(scalar, u, out):
+    """RFC 7748, раздел 5.2."""
+    assert wg_keys.x25519(bytes.fromhex(scalar), bytes.fromhex(u)).hex() == out
+
+
+@pytest.mark.parametrize(
+    "iterations, out",
+    [
+        (1, "422c8e7a6227d7bca1350b3e2bb7279f7897b87bb6854b783c60e80311ae3079"),
+        (1000, "684cf59ba83309552800ef566f2f4d3c1c3887c49360e3875f2eb94d99532c51"),
+    ],
+)
+def test_x25519_iterated(iterations, out):
+    """RFC 7748, раздел 5.2: k = X25519(k, u), u = старое k."""
+    k = u = (9).to_bytes(32, "little")
+    for _ in range(iterations):
+        k, u = wg_keys.x25519(k, u), k
+    assert k.hex() == out
+
+
+def test_public_key_matches_rfc():
+    """RFC 7748, раздел 6.1; ключи в base64, как у `wg pubkey`."""
+    assert wg_keys.public_key(b64(ALICE_PRIVATE)) == b64(ALICE_PUBLIC)
+    assert wg_keys.public_key(b64(BOB_PRIVATE)) == b64(BOB_PUBLIC)
+
+
+def test_shared_secret():
+    alice = bytes.fromhex(ALICE_PRIVATE)
+    bob = bytes.fromhex(BOB_PRIVATE)
+    assert wg_keys.x25519(alice, bytes.fromhex(BOB_PUBLIC)).hex() == SHARED
+    assert wg_keys.x25519(bob, bytes.fromhex(ALICE_PUBLIC)).hex() == SHARED
+
+
+def test_generate_keypair():
+    key, pub = wg_keys.generate_keypair()
+    raw = base64.b64decode(key)
+    assert len(raw) == 32
+    assert raw[0] & 7 == 0 and raw[31] & 0xC0 == 0x40
+    assert wg_keys.public_key(key) == pub
+
+
+@pytest.mark.parametrize(
+    "key", ["", "not base64!", base64.b64encode(b"x" * 31).decode()]
+)
+def test_public_key_rejects_invalid(key):
+    with pytest.raises(ValueError):
+        wg_keys.public_key(key)
+
+
+def test_server_public_key_recomputed_on_key_change():
+    assert wg_keys.server_public_key(b64(ALICE_PRIVATE), "a") == b64(ALICE_PUBLIC)
+    assert wg_keys.server_public_key(b64(BOB_PRIVATE), "b") == b64(BOB_PUBLIC)
+    assert wg_keys.server_public_key(b64(ALICE_PRIVATE), "a") == b64(ALICE_PUBLIC)
+    assert wg_keys.server_public_key(b64(BOB_PRIVATE), "a") == b64(BOB_PUBLIC)